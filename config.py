@@ -3,6 +3,16 @@ import flask_calendar.constants as constants
 DEBUG = True
 DATA_FOLDER = "data"
 USERS_DATA_FOLDER = "users"
+# Where calendars are stored:
+# - "json": one file per calendar inside DATA_FOLDER
+# - "journaled_json": like "json", but changes are appended to a journal file, folded into the calendar file once the
+#   journal is bigger than JOURNAL_COMPACTION_THRESHOLD_BYTES
+# - "sharded_json": one folder per calendar inside DATA_FOLDER, with a file per month of tasks. Existing calendars
+#   can be converted with flask_calendar/scripts/data_migration_002.sh
+# - "sqlite": a single SQLite database at SQLITE_DATABASE_PATH
+STORAGE_BACKEND = "json"
+JOURNAL_COMPACTION_THRESHOLD_BYTES = 256 * 1024
+SQLITE_DATABASE_PATH = "data/calendars.sqlite"
 BASE_URL = "http://0.0.0.0:5000"
 MIN_YEAR = 2017
 MAX_YEAR = 2200
@@ -17,13 +27,39 @@ WEEK_STARTING_DAY = constants.WEEK_START_DAY_MONDAY
 
 MONTHS_TO_EXPORT = 6  # currently only used for ICS export
 
+# If true, calendars can be subscribed to at /<calendar_id>/ics?key=<ics_key of any user of the calendar>
 FEATURE_FLAG_ICAL_EXPORT = False
 
-# (base ^ attempts ) second delays between failed logins
+# If true, changes of tasks are appended to a `<calendar_id>.changes` log inside DATA_FOLDER (shared by all processes)
+# and streamed as Server-Sent Events at /<calendar_id>/events, so open calendars update without reloading. Each stream
+# holds a worker for up to CHANGE_FEED_STREAM_SECONDS before browsers reconnect, checking the log every
+# CHANGE_FEED_POLL_SECONDS
+FEATURE_FLAG_CHANGE_FEED = False
+CHANGE_FEED_STREAM_SECONDS = 55
+CHANGE_FEED_POLL_SECONDS = 1
+
+# If true, clients mirroring a calendar can fetch only what changed since a sync token at
+# /<calendar_id>/api/changes?since=<token>, read from the same `<calendar_id>.changes` logs
+FEATURE_FLAG_SYNC_API = False
+# Changes (including which tasks were deleted) are kept this long, and at most CHANGE_FEED_MAX_BYTES per calendar.
+# Older sync tokens get a 410 and clients have to fetch everything again
+CHANGE_LOG_RETENTION_DAYS = 30
+CHANGE_FEED_MAX_BYTES = 1024 * 1024
+
+# After each failed login, further attempts for that username and from that IP get rejected (HTTP 429) during
+# (base ^ attempts) seconds. Kept in the SESSION_STORE, so all processes share it
 FAILED_LOGIN_DELAY_BASE = 2
 
 # If true, will automatically decorate hyperlinks with <a> tags upon rendering them
 AUTO_DECORATE_TASK_DETAILS_HYPERLINK = True
+# If true (and decorating hyperlinks), tasks are saved with their decorated details so rendering doesn't redo it
+STORE_TASK_DETAILS_MARKUP = False
+
+# Memory budget of the per-process cache of parsed calendars, measured in bytes of the calendar JSON files
+CALENDAR_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Per-process cache of repetitive tasks expanded into the days of a month, measured in (calendar, month) entries
+RECURRENCE_CACHE_MAX_ENTRIES = 4096
 
 SHOW_VIEW_PAST_BUTTON = True
 
@@ -33,6 +69,16 @@ HIDE_PAST_TASKS = False
 # days past to keep hidden tasks (future ones always kept) counting all months as 31 days long
 DAYS_PAST_TO_KEEP_HIDDEN_TASKS = 62
 
+# Where login sessions are kept:
+# - "memory": inside each process, so the app must run as a single process
+# - "filesystem": one file per session inside SESSIONS_FOLDER, shared by all processes (and nodes, on a shared volume)
+# - "sqlite": a SQLite database at SESSIONS_DATABASE_PATH, shared by all processes
+SESSION_STORE = "memory"
+SESSIONS_FOLDER = "data/sessions"
+SESSIONS_DATABASE_PATH = "data/sessions.sqlite"
+# percent of chance that a login also removes expired sessions from the store
+SESSION_SWEEP_CHANCE = 10
+
 # Cookies config
 COOKIE_HTTPS_ONLY = False
 COOKIE_SAMESITE_POLICY = "Lax"
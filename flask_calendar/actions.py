@@ -1,25 +1,37 @@
+import gzip
+import hmac
 import re
 import json
 from datetime import date, timedelta
-from typing import List, Optional, Tuple, cast  # noqa: F401
+from typing import Dict, List, Optional, Tuple, cast  # noqa: F401
 
 import msgspec
 from flask import abort, current_app, g, jsonify, make_response, redirect, render_template, request, session, url_for
 from werkzeug.wrappers import Response
 
 import flask_calendar.constants as constants
-from flask_calendar import view
+from flask_calendar import delta_sync, ics_export, view
+from flask_calendar.change_feed import ChangeFeed, event_stream
 from flask_calendar.weather import Weather, Datapoint
 from flask_calendar.app_utils import (
     add_session,
     authenticated,
     authorized,
+    details_markup_to_store,
+    get_calendar_data,
+    get_login_throttle,
     get_session_username,
     new_session_id,
+    strong_etag,
 )
 from flask_calendar.authentication import Authentication
 from flask_calendar.calendar_data import CalendarData
+from flask_calendar.calendar_schema import Task
 from flask_calendar.gregorian_calendar import GregorianCalendar
+from flask_calendar.recurrence import parse_date
+
+# longest range the tasks API expands at once
+API_MAX_RANGE_DAYS = 366
 
 
 def get_authentication() -> Authentication:
@@ -28,7 +40,6 @@ def get_authentication() -> Authentication:
         auth = g._auth = Authentication(
             data_folder=current_app.config["USERS_DATA_FOLDER"],
             password_salt=current_app.config["PASSWORD_SALT"],
-            failed_login_delay_base=current_app.config["FAILED_LOGIN_DELAY_BASE"],
         )
     return cast(Authentication, auth)
 
@@ -60,9 +71,21 @@ def login_action() -> Response:
 def do_login_action() -> Response:
     username = request.form.get("username", "")
     password = request.form.get("password", "")
-    authentication = get_authentication()
+    client_ip = str(request.remote_addr)
+    login_throttle = get_login_throttle()
+
+    # rejected before checking the password, so guessing can't go faster than the throttle allows
+    retry_after = login_throttle.retry_after(username, client_ip)
+    if retry_after > 0:
+        return Response(
+            "Too many failed login attempts, try again in {} seconds".format(retry_after),
+            status=429,
+            headers={"Retry-After": str(retry_after)},
+        )
 
+    authentication = get_authentication()
     if authentication.is_valid(username, password):
+        login_throttle.successful_attempt(username)
         session_id = new_session_id()
         add_session(session_id, username)
         response = make_response(redirect("/"))
@@ -84,6 +107,7 @@ def do_login_action() -> Response:
         response.set_cookie(**cookie_kwargs)
         return cast(Response, response)
     else:
+        login_throttle.failed_attempt(username, client_ip)
         return redirect("/login")
 
 
@@ -105,8 +129,6 @@ def set_view_type(calendar_id: str, view_type: str):
 @authenticated
 @authorized
 def new_task_action(calendar_id: str, year: int, month: int, day: int) -> Response:
-    GregorianCalendar.setfirstweekday(current_app.config["WEEK_STARTING_DAY"])
-
     current_day, current_month, current_year = GregorianCalendar.current_date()
     year = max(min(int(year), current_app.config["MAX_YEAR"]), current_app.config["MIN_YEAR"])
     month = max(min(int(month), 12), 1)
@@ -146,7 +168,7 @@ def new_task_action(calendar_id: str, year: int, month: int, day: int) -> Respon
 @authorized
 def edit_task_action(calendar_id: str, year: int, month: int, day: int, task_id: int) -> Response:
     month_names = GregorianCalendar.MONTH_NAMES
-    calendar_data = CalendarData(current_app.config["DATA_FOLDER"], current_app.config["WEEK_STARTING_DAY"])
+    calendar_data = get_calendar_data()
 
     repeats = request.args.get("repeats") == "1"
     try:
@@ -194,7 +216,7 @@ def edit_task_action(calendar_id: str, year: int, month: int, day: int, task_id:
 def update_task_action(calendar_id: str, year: str, month: str, day: str, task_id: str) -> Response:
     # Logic is same as save + delete, could refactor but can wait until need to change any save/delete logic
 
-    calendar_data = CalendarData(current_app.config["DATA_FOLDER"], current_app.config["WEEK_STARTING_DAY"])
+    calendar_data = get_calendar_data()
 
     # For creation of "updated" task use only form data
     title = request.form["title"].strip()
@@ -215,9 +237,12 @@ def update_task_action(calendar_id: str, year: str, month: str, day: str, task_i
     repetition_type = request.form.get("repetition_type", "")
     repetition_subtype = request.form.get("repetition_subtype", "")
     repetition_value = int(request.form["repetition_value"])  # type: int
+    starts_on = request.form.get("starts_on") or None
+    until = request.form.get("until") or None
+    count = int(request.form["count"]) if request.form.get("count") else None  # type: Optional[int]
     travel_to = request.form.get("travel_to")
 
-    calendar_data.create_task(
+    created = calendar_data.create_task(
         calendar_id=calendar_id,
         year=updated_year,
         month=updated_month,
@@ -232,8 +257,15 @@ def update_task_action(calendar_id: str, year: str, month: str, day: str, task_i
         repetition_type=repetition_type,
         repetition_subtype=repetition_subtype,
         repetition_value=repetition_value,
+        starts_on=starts_on,
+        until=until,
+        count=count,
         travel_to=travel_to,
+        details_markup=details_markup_to_store(details),
     )
+    if not created:
+        # invalid values, the task is kept as it was
+        abort(400)
     # For deletion of old task data use only url data
     calendar_data.delete_task(
         calendar_id=calendar_id,
@@ -275,8 +307,11 @@ def save_task_action(calendar_id: str) -> Response:
     repetition_type = request.form.get("repetition_type")
     repetition_subtype = request.form.get("repetition_subtype")
     repetition_value = int(request.form["repetition_value"])
+    starts_on = request.form.get("starts_on") or None
+    until = request.form.get("until") or None
+    count = int(request.form["count"]) if request.form.get("count") else None  # type: Optional[int]
 
-    calendar_data = CalendarData(current_app.config["DATA_FOLDER"], current_app.config["WEEK_STARTING_DAY"])
+    calendar_data = get_calendar_data()
 
     dates_to_create = []  # type: List[Tuple[Optional[int], Optional[int], Optional[int]]]
 
@@ -298,24 +333,26 @@ def save_task_action(calendar_id: str) -> Response:
     else:
         dates_to_create.append((year, month, day))
 
-    for date_tuple in dates_to_create:
-        year, month, day = date_tuple
-        calendar_data.create_task(
-            calendar_id=calendar_id,
-            year=year,
-            month=month,
-            day=day,
-            title=title,
-            is_all_day=is_all_day,
-            start_time=start_time,
-            end_time=end_time,
-            details=details,
-            color=color,
-            has_repetition=has_repetition,
-            repetition_type=repetition_type,
-            repetition_subtype=repetition_subtype,
-            repetition_value=repetition_value,
-        )
+    created = calendar_data.create_tasks(
+        calendar_id=calendar_id,
+        dates=dates_to_create,
+        title=title,
+        is_all_day=is_all_day,
+        start_time=start_time,
+        end_time=end_time,
+        details=details,
+        color=color,
+        has_repetition=has_repetition,
+        repetition_type=repetition_type,
+        repetition_subtype=repetition_subtype,
+        repetition_value=repetition_value,
+        starts_on=starts_on,
+        until=until,
+        count=count,
+        details_markup=details_markup_to_store(details),
+    )
+    if not created:
+        abort(400)
 
     if year is None:
         return redirect("{}/{}/".format(current_app.config["BASE_URL"], calendar_id), code=302)
@@ -329,7 +366,9 @@ def save_task_action(calendar_id: str) -> Response:
 @authenticated
 @authorized
 def delete_task_action(calendar_id: str, year: str, month: str, day: str, task_id: str) -> Response:
-    calendar_data = CalendarData(current_app.config["DATA_FOLDER"], current_app.config["WEEK_STARTING_DAY"])
+    calendar_data = get_calendar_data()
+    # deleting a repetitive task changes every cell it appeared on, so only cells of normal tasks are sent back
+    is_normal = calendar_data.is_normal_task(calendar_id, year, month, day, int(task_id))
     calendar_data.delete_task(
         calendar_id=calendar_id,
         year_str=year,
@@ -338,7 +377,7 @@ def delete_task_action(calendar_id: str, year: str, month: str, day: str, task_i
         task_id=int(task_id),
     )
 
-    return cast(Response, jsonify({}))
+    return _changed_cells_response(calendar_id, [(year, month, day)] if is_normal else [])
 
 
 @authenticated
@@ -346,7 +385,7 @@ def delete_task_action(calendar_id: str, year: str, month: str, day: str, task_i
 def update_task_day_action(calendar_id: str, year: str, month: str, day: str, task_id: str) -> Response:
     new_day = request.data.decode("utf-8")
 
-    calendar_data = CalendarData(current_app.config["DATA_FOLDER"], current_app.config["WEEK_STARTING_DAY"])
+    calendar_data = get_calendar_data()
     calendar_data.update_task_day(
         calendar_id=calendar_id,
         year_str=year,
@@ -356,13 +395,13 @@ def update_task_day_action(calendar_id: str, year: str, month: str, day: str, ta
         new_day_str=new_day,
     )
 
-    return cast(Response, jsonify({}))
+    return _changed_cells_response(calendar_id, [(year, month, day), (year, month, new_day)])
 
 
 @authenticated
 @authorized
 def hide_repetition_task_instance_action(calendar_id: str, year: str, month: str, day: str, task_id: str) -> Response:
-    calendar_data = CalendarData(current_app.config["DATA_FOLDER"], current_app.config["WEEK_STARTING_DAY"])
+    calendar_data = get_calendar_data()
     calendar_data.hide_repetition_task_instance(
         calendar_id=calendar_id,
         year_str=year,
@@ -371,4 +410,185 @@ def hide_repetition_task_instance_action(calendar_id: str, year: str, month: str
         task_id_str=task_id,
     )
 
-    return cast(Response, jsonify({}))
+    return _changed_cells_response(calendar_id, [(year, month, day)])
+
+
+@authenticated
+@authorized
+def events_action(calendar_id: str) -> Response:
+    if not current_app.config["FEATURE_FLAG_CHANGE_FEED"]:
+        abort(404)
+    try:
+        last_event_id = int(request.headers["Last-Event-ID"])  # type: Optional[int]
+    except (KeyError, ValueError):
+        last_event_id = None
+
+    response = Response(
+        event_stream(
+            cast(ChangeFeed, current_app.extensions["change_feed"]),
+            calendar_id,
+            last_event_id,
+            current_app.config["CHANGE_FEED_STREAM_SECONDS"],
+            current_app.config["CHANGE_FEED_POLL_SECONDS"],
+        ),
+        mimetype="text/event-stream",
+    )
+    response.headers["Cache-Control"] = "no-cache"
+    # so proxies like nginx send events as they come
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
+def ics_export_action(calendar_id: str) -> Response:
+    # Calendar clients can't log in, subscriptions authenticate with the `ics_key` of any user of the calendar
+    if not current_app.config["FEATURE_FLAG_ICAL_EXPORT"]:
+        abort(404)
+    calendar_data = get_calendar_data()
+    try:
+        usernames = calendar_data.users_list(calendar_id=calendar_id)
+    except FileNotFoundError:
+        abort(404)
+    if not any(_is_ics_key(username, request.args.get("key", "")) for username in usernames):
+        abort(403)
+
+    _, current_month, current_year = GregorianCalendar.current_date()
+    start = date(current_year, current_month, 1)
+    months = current_month - 1 + current_app.config["MONTHS_TO_EXPORT"]
+    end = date(current_year + months // 12, months % 12 + 1, 1) - timedelta(days=1)
+
+    etag = strong_etag(
+        (calendar_id, calendar_data.calendar_revision(calendar_id), start, end, calendar_data.first_weekday)
+    )
+    if request.if_none_match.contains(etag):
+        response = make_response("", 304)  # type: Response
+    else:
+        response = Response(
+            ics_export.calendar_lines(
+                calendar_id, calendar_data.load_calendar(calendar_id), start, end, calendar_data.first_weekday, start
+            ),
+            content_type="text/calendar; charset=utf-8",
+        )
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+def _is_ics_key(username: str, key: str) -> bool:
+    try:
+        ics_key = get_authentication().user_data(username).get("ics_key")
+    except KeyError:
+        return False
+    return ics_key is not None and hmac.compare_digest(str(ics_key), key)
+
+
+@authenticated
+@authorized
+def api_tasks_action(calendar_id: str) -> Response:
+    try:
+        start = parse_date(request.args["from"])
+        end = parse_date(request.args["to"])
+    except (KeyError, ValueError):
+        abort(400)
+    if start > end or (end - start).days >= API_MAX_RANGE_DAYS:
+        abort(400)
+
+    calendar_data = get_calendar_data()
+    compress = "gzip" in request.accept_encodings
+    etag = strong_etag(
+        (calendar_id, calendar_data.calendar_revision(calendar_id), start, end, calendar_data.first_weekday, compress)
+    )
+    if request.if_none_match.contains(etag):
+        response = make_response("", 304)  # type: Response
+    else:
+        days = {}  # type: Dict[str, List[Task]]
+        for day, task in calendar_data.occurrences_between(start, end, calendar_id=calendar_id):
+            days.setdefault(day.isoformat(), []).append(task)
+        # tasks are encoded straight from the cached document, without converting them to dicts
+        body = msgspec.json.encode({"from": start.isoformat(), "to": end.isoformat(), "days": days})
+        response = make_response(gzip.compress(body) if compress else body)
+        response.content_type = "application/json"
+        if compress:
+            response.headers["Content-Encoding"] = "gzip"
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+@authenticated
+@authorized
+def api_changes_action(calendar_id: str) -> Response:
+    """
+    Changes of the tasks since the `since` sync token, with the token to ask from next time. Without `since` only
+    the current token, to take before fetching the tasks. Tokens older than the kept changes get a 410, and clients
+    have to fetch everything again.
+    """
+    if not current_app.config["FEATURE_FLAG_SYNC_API"]:
+        abort(404)
+    change_feed = cast(ChangeFeed, current_app.extensions["change_feed"])
+    if "since" not in request.args:
+        return cast(Response, jsonify({"token": str(change_feed.last_sequence(calendar_id))}))
+    try:
+        since = int(request.args["since"])
+    except ValueError:
+        abort(400)
+
+    records, (_, _, token) = change_feed.read(calendar_id, change_feed.cursor_after(since))
+    # checked after reading, a trim in between could have dropped records
+    first_sequence = change_feed.first_sequence(calendar_id)
+    if since < 0 or (first_sequence is not None and since < first_sequence - 1):
+        abort(410)
+    if not records and since > change_feed.last_sequence(calendar_id):
+        # from a log that has been removed since
+        abort(410)
+    # loaded after reading the log (not the copy used to authorize the request), so it has every change read
+    data = get_calendar_data().storage.load(calendar_id)
+    changes = delta_sync.compact_changes(records, data)
+    changes["token"] = str(token)
+    response = make_response(msgspec.json.encode(changes))  # type: Response
+    response.content_type = "application/json"
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+@authenticated
+@authorized
+def day_cells_action(calendar_id: str) -> Response:
+    try:
+        days = [parse_date(value) for value in request.args["days"].split(",")]
+    except (KeyError, ValueError):
+        abort(400)
+    if len(days) > view.MAX_DAY_CELLS:
+        abort(400)
+    view_type, requested_date = _day_cells_options(days[0].month)
+    return cast(Response, jsonify({"cells": view.day_cells(calendar_id, days, view_type, requested_date)}))
+
+
+def _changed_cells_response(calendar_id: str, days: List[Tuple[str, str, str]]) -> Response:
+    """
+    Response of the changes of tasks. Pages sending `cells=1` get the HTML of the changed `days` (see
+    `day_cells_action`), if there's no `cells` in the response they have to reload.
+    """
+    if request.args.get("cells") != "1":
+        return cast(Response, jsonify({}))
+    try:
+        changed_days = sorted(set(date(int(year), int(month), int(day)) for year, month, day in days))
+    except ValueError:
+        return cast(Response, jsonify({}))
+    if not changed_days:
+        return cast(Response, jsonify({}))
+    view_type, requested_date = _day_cells_options(changed_days[0].month)
+    return cast(Response, jsonify({"cells": view.day_cells(calendar_id, changed_days, view_type, requested_date)}))
+
+
+def _day_cells_options(default_month: int) -> Tuple[view.ViewType, Tuple[int, int, int]]:
+    # view and (day, month, year) the page shows, which decide how cells render
+    current_day, _, current_year = GregorianCalendar.current_date()
+    try:
+        view_type = view.ViewType(request.args.get("view", session.get("view", "monthly")))
+        month = int(request.args.get("month", default_month))
+        year = int(request.args.get("y", current_year))
+        day = int(request.args.get("d", current_day))
+    except ValueError:
+        abort(400)
+    return view_type, (day, month, year)
@@ -22,8 +22,13 @@ from flask_calendar.actions import (
     update_task_action,
     update_task_day_action,
 )
-from flask_calendar.app_utils import task_details_for_markup
-
+from flask_calendar.app_utils import task_details_for_markup, task_markup, templates_digest
+from flask_calendar.calendar_cache import cache as calendar_cache
+from flask_calendar.change_feed import ChangeFeed
+from flask_calendar.login_throttle import create_login_throttle
+from flask_calendar.recurrence import cache as recurrence_cache
+from flask_calendar.session_store import create_session_store
+from flask_calendar.storage import create_storage
 
 
 def create_app(config_overrides: Optional[Dict] = None) -> Flask:
@@ -41,6 +46,19 @@ def create_app(config_overrides: Optional[Dict] = None) -> Flask:
         except locale.Error as e:
             app.logger.warning("{} ({})".format(str(e), app.config["LOCALE"]))
 
+    calendar_cache.max_bytes = app.config["CALENDAR_CACHE_MAX_BYTES"]
+    recurrence_cache.max_entries = app.config["RECURRENCE_CACHE_MAX_ENTRIES"]
+    app.extensions["calendar_storage"] = create_storage(app.config)
+    app.extensions["session_store"] = create_session_store(app.config)
+    app.extensions["login_throttle"] = create_login_throttle(app.config)
+    app.extensions["templates_digest"] = templates_digest(os.path.join(app.root_path, str(app.template_folder)))
+    if app.config["FEATURE_FLAG_CHANGE_FEED"] or app.config["FEATURE_FLAG_SYNC_API"]:
+        app.extensions["change_feed"] = ChangeFeed(
+            app.config["DATA_FOLDER"],
+            app.config["CHANGE_FEED_MAX_BYTES"],
+            app.config["CHANGE_LOG_RETENTION_DAYS"] * 24 * 60 * 60,
+        )
+
     # To avoid main_calendar_action below shallowing favicon requests and generating error logs
     @app.route("/favicon.ico")
     def favicon() -> Response:
@@ -54,6 +72,11 @@ def create_app(config_overrides: Optional[Dict] = None) -> Flask:
     app.add_url_rule("/login", "login_action", login_action, methods=["GET"])
     app.add_url_rule("/do_login", "do_login_action", do_login_action, methods=["POST"])
     app.add_url_rule("/<calendar_id>/", "main_calendar_action", main_calendar_action, methods=["GET"])
+    app.add_url_rule("/<calendar_id>/day_cells", "day_cells_action", actions.day_cells_action, methods=["GET"])
+    app.add_url_rule("/<calendar_id>/api/changes", "api_changes_action", actions.api_changes_action, methods=["GET"])
+    app.add_url_rule("/<calendar_id>/api/tasks", "api_tasks_action", actions.api_tasks_action, methods=["GET"])
+    app.add_url_rule("/<calendar_id>/events", "events_action", actions.events_action, methods=["GET"])
+    app.add_url_rule("/<calendar_id>/ics", "ics_export_action", actions.ics_export_action, methods=["GET"])
     app.add_url_rule("/<calendar_id>/set_view/<view_type>", "set_view_type", actions.set_view_type, methods=["GET"])
     app.add_url_rule(
         "/<calendar_id>/<year>/<month>/<day>/new_task",
@@ -99,6 +122,7 @@ def create_app(config_overrides: Optional[Dict] = None) -> Flask:
     )
 
     app.jinja_env.filters["task_details_for_markup"] = task_details_for_markup
+    app.jinja_env.filters["task_markup"] = task_markup
 
     return app
 
@@ -1,20 +1,29 @@
+import hashlib
+import os
+import random
 import re
 import uuid
-from functools import wraps
-from typing import Any, Callable
+from functools import lru_cache, wraps
+from typing import Any, Callable, Optional, Tuple, cast
 
-from cachelib.simple import SimpleCache
-from flask import abort, current_app, redirect, request
+from flask import abort, current_app, g, redirect, request
 from flask_calendar.authorization import Authorization
 from flask_calendar.calendar_data import CalendarData
+from flask_calendar.calendar_schema import Task
 from flask_calendar.constants import SESSION_ID
 from flask_calendar.gregorian_calendar import GregorianCalendar
+from flask_calendar.login_throttle import LoginThrottle
+from flask_calendar.session_store import SessionStore
+from flask_calendar.storage import CalendarStorage
 
-cache = SimpleCache()
+SESSION_TIMEOUT = 2678400  # 1 month
 
 # see `app_utils` tests for details, but TL;DR is that urls must start with `http://` or `https://` to match
 URLS_REGEX_PATTERN = r"(https?\:\/\/[\w/\-?=%.]+\.[\w/\+\-?=%.~&\[\]\#]+)"
 DECORATED_URL_FORMAT = '<a href="{}" target="_blank">{}</a>'
+URLS_REGEX = re.compile(URLS_REGEX_PATTERN)
+# distinct details strings whose markup is kept, details of repetitive tasks are rendered once per occurrence
+TASK_DETAILS_MEMO_SIZE = 4096
 
 
 def authenticated(decorated_function: Callable) -> Any:
@@ -34,7 +43,7 @@ def authorized(decorated_function: Callable) -> Any:
     @wraps(decorated_function)
     def wrapper(*args: Any, **kwargs: Any) -> Any:
         username = get_session_username(str(request.cookies.get(SESSION_ID)))
-        authorization = Authorization(calendar_data=CalendarData(data_folder=current_app.config["DATA_FOLDER"]))
+        authorization = Authorization(calendar_data=get_calendar_data())
         if "calendar_id" not in kwargs:
             raise ValueError("calendar_id")
         calendar_id = str(kwargs["calendar_id"])
@@ -45,6 +54,23 @@ def authorized(decorated_function: Callable) -> Any:
     return wrapper
 
 
+def get_calendar_data() -> CalendarData:
+    """
+    Shared by everything handling the current request (`authorized`, actions and views), so each calendar is only
+    fetched once per request.
+    """
+    calendar_data = getattr(g, "_calendar_data", None)
+    if calendar_data is None:
+        calendar_data = g._calendar_data = CalendarData(
+            data_folder=current_app.config["DATA_FOLDER"],
+            first_weekday=current_app.config["WEEK_STARTING_DAY"],
+            storage=cast(CalendarStorage, current_app.extensions["calendar_storage"]),
+            documents={},
+            change_feed=current_app.extensions.get("change_feed"),
+        )
+    return cast(CalendarData, calendar_data)
+
+
 def previous_month_link(year: int, month: int) -> str:
     month, year = GregorianCalendar.previous_month_and_year(year=year, month=month)
     return (
@@ -67,25 +93,66 @@ def new_session_id() -> str:
     return str(uuid.uuid4())
 
 
+def get_session_store() -> SessionStore:
+    return cast(SessionStore, current_app.extensions["session_store"])
+
+
+def get_login_throttle() -> LoginThrottle:
+    return cast(LoginThrottle, current_app.extensions["login_throttle"])
+
+
 def is_session_valid(session_id: str) -> bool:
-    return cache.get(session_id) is not None
+    return get_session_store().get_username(session_id) is not None
 
 
 def add_session(session_id: str, username: str) -> None:
-    cache.set(session_id, username, timeout=2678400)  # 1 month
+    session_store = get_session_store()
+    session_store.add(session_id, username, timeout=SESSION_TIMEOUT)
+    if random.randint(0, 99) < current_app.config["SESSION_SWEEP_CHANCE"]:
+        session_store.sweep_expired()
+        get_login_throttle().store.sweep_expired()
 
 
 def get_session_username(session_id: str) -> str:
-    return str(cache.get(session_id))
+    return str(get_session_store().get_username(session_id))
 
 
 def task_details_for_markup(details: str) -> str:
     if not current_app.config["AUTO_DECORATE_TASK_DETAILS_HYPERLINK"]:
         return details
+    return decorate_task_details(details)
+
 
+def task_markup(task: Task) -> str:
+    """
+    Markup of the details of a task, the one stored with it when it was saved if any.
+    """
+    if not current_app.config["AUTO_DECORATE_TASK_DETAILS_HYPERLINK"]:
+        return cast(str, task["details"])
+    details_markup = task.get("details_markup")
+    if details_markup is not None:
+        return cast(str, details_markup)
+    return decorate_task_details(task["details"])
+
+
+def details_markup_to_store(details: str) -> Optional[str]:
+    """
+    Markup to save along a task when `STORE_TASK_DETAILS_MARKUP` is enabled, None if it's the same as the details.
+    """
+    if (
+        not current_app.config["STORE_TASK_DETAILS_MARKUP"]
+        or not current_app.config["AUTO_DECORATE_TASK_DETAILS_HYPERLINK"]
+    ):
+        return None
+    details_markup = decorate_task_details(details)
+    return None if details_markup == details else details_markup
+
+
+@lru_cache(maxsize=TASK_DETAILS_MEMO_SIZE)
+def decorate_task_details(details: str) -> str:
     decorated_fragments = []
 
-    fragments = re.split(URLS_REGEX_PATTERN, details)
+    fragments = URLS_REGEX.split(details)
     for index, fragment in enumerate(fragments):
         if index % 2 == 1:
             decorated_fragments.append(DECORATED_URL_FORMAT.format(fragment, fragment))
@@ -93,3 +160,26 @@ def task_details_for_markup(details: str) -> str:
             decorated_fragments.append(fragment)
 
     return "".join(decorated_fragments)
+
+
+def templates_digest(folder: str) -> str:
+    """
+    Hash of the template sources in `folder`, computed once at startup so validators of rendered pages change when a
+    deploy changes the markup.
+    """
+    digest = hashlib.sha1()
+    for root, folders, filenames in os.walk(folder):
+        folders.sort()
+        for filename in sorted(filenames):
+            path = os.path.join(root, filename)
+            digest.update(os.path.relpath(path, folder).encode("utf-8"))
+            with open(path, "rb") as file:
+                digest.update(file.read())
+    return digest.hexdigest()
+
+
+def strong_etag(key: Tuple) -> str:
+    """
+    ETag of a response built from `key`, which has to hold everything the response depends on.
+    """
+    return hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
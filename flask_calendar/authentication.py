@@ -1,70 +1,48 @@
 import hashlib
-import json
-import os
-import time
-from typing import Dict, cast
+from typing import Dict
 
-from cachelib.simple import SimpleCache
-
-cache = SimpleCache()
+from flask_calendar.user_store import get_user_store
 
 
 class Authentication:
-
-    USERS_FILENAME = "users.json"
-
-    def __init__(self, data_folder: str, password_salt: str, failed_login_delay_base: int) -> None:
-        self.contents = {}  # type: Dict
-        with open(os.path.join(".", data_folder, self.USERS_FILENAME)) as file:
-            self.contents = json.load(file)
+    def __init__(self, data_folder: str, password_salt: str) -> None:
+        # users are parsed once per process and shared, not on every instantiation
+        self.users = get_user_store(data_folder)
         self.password_salt = password_salt
-        self.failed_login_delay_base = failed_login_delay_base
         self.data_folder = data_folder
 
     def is_valid(self, username: str, password: str) -> bool:
-        if username not in self.contents:
-            self._failed_attempt(username)
+        # failed attempts are throttled by the caller, see `LoginThrottle`
+        user = self.users.get(username)
+        if user is None:
             return False
-        if self._hash_password(password) != self.contents[username]["password"]:
-            self._failed_attempt(username)
-            return False
-        return True
+        return bool(self._hash_password(password) == user["password"])
 
     def user_data(self, username: str) -> Dict:
-        return cast(Dict, self.contents[username])
+        user = self.users.get(username)
+        if user is None:
+            raise KeyError(username)
+        return user
 
     def add_user(self, username: str, plaintext_password: str, default_calendar: str) -> None:
-        if username in self.contents:
+        if username in self.users:
             raise ValueError("Username {} already exists".format(username))
         hashed_password = self._hash_password(plaintext_password)
-        self.contents[username] = {
-            "username": username,
-            "password": hashed_password,
-            "default_calendar": default_calendar,
-            "ics_key": "an_ics_key",
-        }
-        self._save()
+        self.users.set(
+            {
+                "username": username,
+                "password": hashed_password,
+                "default_calendar": default_calendar,
+                "ics_key": "an_ics_key",
+            }
+        )
 
     def delete_user(self, username: str) -> None:
-        self.contents.pop(username)
-        self._save()
+        if username not in self.users:
+            raise KeyError(username)
+        self.users.delete(username)
 
     def _hash_password(self, plaintext_password: str) -> str:
         hash_algoritm = hashlib.new("sha256")
         hash_algoritm.update((plaintext_password + self.password_salt).encode("UTF-8"))
         return hash_algoritm.hexdigest()
-
-    def _save(self) -> None:
-        with open(os.path.join(".", self.data_folder, self.USERS_FILENAME), "w") as file:
-            json.dump(self.contents, file)
-
-    def _failed_attempt(self, username: str) -> None:
-        key = "LF_{}".format(username)
-        attempts = cache.get(key)
-        if attempts is None:
-            attempts = 0
-        else:
-            attempts = int(attempts) + 1
-        wait = self.failed_login_delay_base ** attempts
-        cache.set(key, attempts, timeout=7200)  # Keep for 2h
-        time.sleep(wait)
@@ -0,0 +1,83 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+# (inode, mtime in nanoseconds, size in bytes) of the file a cached entry was decoded from.
+# Entries decoded from several files use the concatenation of their stamps.
+FileStamp = Tuple[int, ...]
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def file_stamp(stat_result: os.stat_result) -> FileStamp:
+    return stat_result.st_ino, stat_result.st_mtime_ns, stat_result.st_size
+
+
+class CalendarCache:
+    """
+    Process-wide LRU of decoded calendars, keyed by calendar file path.
+    An entry is only served while the file on disk still has the same inode, mtime and size it had when decoded.
+    Memory budget is measured in bytes of the source files, not of the decoded objects.
+    Cached documents are shared between requests, so callers must not mutate what `get` returns.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # type: OrderedDict[str, Tuple[FileStamp, Any]]
+        self._current_bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, path: str, stamp: FileStamp) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None or entry[0] != stamp:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(path)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, path: str, stamp: FileStamp, value: Any) -> None:
+        size = sum(stamp[2::3])
+        with self._lock:
+            self._remove(path)
+            if size > self.max_bytes:
+                return
+            self._entries[path] = (stamp, value)
+            self._current_bytes += size
+            while self._current_bytes > self.max_bytes:
+                oldest_path = next(iter(self._entries))
+                self._remove(oldest_path)
+                self.evictions += 1
+
+    def invalidate(self, path: str) -> None:
+        with self._lock:
+            self._remove(path)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._current_bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _remove(self, path: str) -> None:
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            self._current_bytes -= sum(entry[0][2::3])
+
+
+cache = CalendarCache()
@@ -1,14 +1,28 @@
-import json
-import os
 import random
+import threading
 import time
-from datetime import datetime
-from typing import Dict, List, Optional, cast
+from datetime import date, datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, cast
 
 from flask import current_app
 
 import flask_calendar.constants as constants
+from flask_calendar import hidden_repetitions, recurrence
+from flask_calendar.calendar_schema import RepetitiveTask, Task
+from flask_calendar.change_feed import CHANGE_CREATED, CHANGE_DELETED, CHANGE_HIDDEN, CHANGE_MOVED, ChangeFeed
 from flask_calendar.gregorian_calendar import GregorianCalendar
+from flask_calendar.occurrences import Occurrences, occurrences_between
+from flask_calendar.recurrence import ExpansionKey, RecurrenceIndex
+from flask_calendar.recurrence import cache as recurrence_cache
+from flask_calendar.storage import (
+    KEY_JOURNAL_SEQUENCE,
+    KEY_VERSION,
+    CalendarConflictError,
+    CalendarStorage,
+    IndexedCalendarStorage,
+    JsonStorage,
+    NormalTaskEntry,
+)
 
 KEY_TASKS = "tasks"
 KEY_USERS = "users"
@@ -16,25 +30,62 @@ KEY_NORMAL_TASK = "normal"
 KEY_REPETITIVE_TASK = "repetition"
 KEY_REPETITIVE_HIDDEN_TASK = "hidden_repetition"
 
+# times a change is applied again over the latest calendar when someone else saved it meanwhile, waiting a random
+# time up to SAVE_CONFLICT_BACKOFF_SECONDS * 2 ^ attempt in between so conflicting writers don't keep conflicting
+SAVE_CONFLICT_ATTEMPTS = 8
+SAVE_CONFLICT_BACKOFF_SECONDS = 0.005
+
+_task_id_lock = threading.Lock()
+_last_task_id = 0
+
 
 class CalendarData:
-    REPETITION_TYPE_WEEKLY = "w"
-    REPETITION_TYPE_MONTHLY = "m"
-    REPETITION_SUBTYPE_WEEK_DAY = "w"
-    REPETITION_SUBTYPE_MONTH_DAY = "m"
+    REPETITION_TYPE_WEEKLY = recurrence.REPETITION_TYPE_WEEKLY
+    REPETITION_TYPE_MONTHLY = recurrence.REPETITION_TYPE_MONTHLY
+    REPETITION_SUBTYPE_WEEK_DAY = recurrence.REPETITION_SUBTYPE_WEEK_DAY
+    REPETITION_SUBTYPE_MONTH_DAY = recurrence.REPETITION_SUBTYPE_MONTH_DAY
 
-    def __init__(self, data_folder: str, first_weekday: int = constants.WEEK_START_DAY_MONDAY) -> None:
+    def __init__(
+        self,
+        data_folder: str,
+        first_weekday: int = constants.WEEK_START_DAY_MONDAY,
+        storage: Optional[CalendarStorage] = None,
+        documents: Optional[Dict[str, Dict]] = None,
+        change_feed: Optional[ChangeFeed] = None,
+    ) -> None:
+        """
+        `documents` keeps the calendars loaded through this instance by id, so they are only fetched once while it
+        lives (see `app_utils.get_calendar_data`, which shares one per request).
+        Changes of tasks are published to `change_feed` if given.
+        """
         self.data_folder = data_folder
+        self.storage = storage if storage is not None else JsonStorage(data_folder)
+        self.documents = documents
+        self.change_feed = change_feed
         self.gregorian_calendar = GregorianCalendar
-        self.gregorian_calendar.setfirstweekday(first_weekday)
-
-    def load_calendar(self, filename: str) -> Dict:
-        with open(os.path.join(".", self.data_folder, "{}.json".format(filename))) as file:
-            contents = json.load(file)
+        # per instance, so concurrent requests can use different week starts
+        self.first_weekday = first_weekday
+
+    def load_calendar(self, filename: str, use_cache: bool = True) -> Dict:
+        """
+        Cached calendars are shared across requests: only pass `use_cache=False` if you're going to modify the
+        returned data (and then save it).
+        """
+        if use_cache and self.documents is not None and filename in self.documents:
+            return self.documents[filename]
+        contents = self.storage.load(filename, use_cache=use_cache)
         if type(contents) is not dict:
             raise ValueError("Error loading calendar from file '{}'".format(filename))
+        if use_cache and self.documents is not None:
+            self.documents[filename] = contents
         return contents
 
+    def calendar_revision(self, filename: str) -> Tuple[int, int, int]:
+        """
+        Changes whenever the calendar does, so it can validate anything rendered from it.
+        """
+        return self.storage.revision(filename)
+
     def users_list(self, data: Optional[Dict] = None, calendar_id: Optional[str] = None) -> List:
         if data is None:
             if calendar_id is None:
@@ -94,12 +145,16 @@ class CalendarData:
                 and month_str in data[KEY_TASKS][KEY_NORMAL_TASK][year_str]
                 and month_str not in tasks
             ):
-                tasks[month_str] = data[KEY_TASKS][KEY_NORMAL_TASK][year_str][month_str]
+                # copy day lists, as callers append repetitive tasks and hide past ones on the result
+                tasks[month_str] = {
+                    day_str: list(day_tasks)
+                    for day_str, day_tasks in data[KEY_TASKS][KEY_NORMAL_TASK][year_str][month_str].items()
+                }
 
         return tasks
 
     def hide_past_tasks(self, iterdays, current_date, tasks: Dict) -> None:
-        (current_day, current_month, current_year) = current_date
+        current_day, current_month, current_year = current_date
 
         for day in iterdays:
             month_str = str(day.month)
@@ -121,6 +176,7 @@ class CalendarData:
 
         for index, task in enumerate(data[KEY_TASKS][KEY_NORMAL_TASK][year_str][month_str][day_str]):
             if task["id"] == task_id:
+                task = dict(task)
                 task["repeats"] = False
                 task["date"] = self.date_for_frontend(year, month, day)
                 return cast(Dict, task)
@@ -129,7 +185,7 @@ class CalendarData:
     def repetitive_task_from_calendar(self, calendar_id: str, year: int, month: int, task_id: int) -> Dict:
         data = self.load_calendar(calendar_id)
 
-        task = [task for task in data[KEY_TASKS][KEY_REPETITIVE_TASK] if task["id"] == task_id][0]  # type: Dict
+        task = dict([task for task in data[KEY_TASKS][KEY_REPETITIVE_TASK] if task["id"] == task_id][0])  # type: Dict
         task["repeats"] = True
         task["date"] = self.date_for_frontend(year, month, 1)
         return task
@@ -138,8 +194,13 @@ class CalendarData:
     def date_for_frontend(year: int, month: int, day: int) -> str:
         return "{0}-{1:02d}-{2:02d}".format(int(year), int(month), int(day))
 
-    def add_repetitive_tasks_from_calendar(self, iterdays, data: Dict, tasks: Dict) -> Dict:
-        repetitive_tasks = self._repetitive_tasks_from_calendar(iterdays, data)
+    def add_repetitive_tasks_from_calendar(
+        self, iterdays, data: Dict, tasks: Dict, calendar_id: Optional[str] = None
+    ) -> Dict:
+        """
+        Pass `calendar_id` to reuse the expansions of previous calls for the same calendar version.
+        """
+        repetitive_tasks = self._repetitive_tasks_from_calendar(iterdays, data, calendar_id)
 
         for repetitive_tasks_month in repetitive_tasks:
             for day, day_tasks in repetitive_tasks[repetitive_tasks_month].items():
@@ -153,6 +214,27 @@ class CalendarData:
 
         return tasks
 
+    def occurrences_between(
+        self, start: date, end: date, data: Optional[Dict] = None, calendar_id: Optional[str] = None
+    ) -> Occurrences:
+        """
+        Occurrences of normal and repetitive tasks from `start` to `end` (both included), for ranges longer than what
+        views show, like exports or summaries. `tasks_by_month()` of a view's months gives the same tasks as
+        `tasks_from_calendar` plus `add_repetitive_tasks_from_calendar`.
+        """
+        if data is None:
+            if calendar_id is None:
+                raise ValueError("Need to provide either calendar_id or loaded data")
+            data = self.load_calendar(calendar_id)
+        return occurrences_between(
+            data[KEY_TASKS][KEY_NORMAL_TASK],
+            data[KEY_TASKS][KEY_REPETITIVE_TASK],
+            data[KEY_TASKS][KEY_REPETITIVE_HIDDEN_TASK],
+            start,
+            end,
+            self.first_weekday,
+        )
+
     def delete_task(
         self,
         calendar_id: str,
@@ -161,8 +243,26 @@ class CalendarData:
         day_str: str,
         task_id: int,
     ) -> None:
+        is_normal = self.is_normal_task(calendar_id, year_str, month_str, day_str, task_id)
+        if isinstance(self.storage, IndexedCalendarStorage):
+            self.storage.delete_task(calendar_id, year_str, month_str, day_str, task_id)
+        else:
+            self._update_calendar(
+                calendar_id, lambda data: self.delete_task_from_data(data, year_str, month_str, day_str, task_id)
+            )
+        self._forget_document(calendar_id)
+        if not is_normal:
+            recurrence_cache.invalidate(calendar_id)
+        self._publish(calendar_id, CHANGE_DELETED, [(year_str, month_str, day_str)], [task_id], repeats=not is_normal)
+
+    def is_normal_task(self, calendar_id: str, year_str: str, month_str: str, day_str: str, task_id: int) -> bool:
+        normal_tasks = self.load_calendar(calendar_id)[KEY_TASKS][KEY_NORMAL_TASK]
+        day_tasks = normal_tasks.get(year_str, {}).get(month_str, {}).get(day_str, [])
+        return any(task["id"] == task_id for task in day_tasks)
+
+    @staticmethod
+    def delete_task_from_data(data: Dict, year_str: str, month_str: str, day_str: str, task_id: int) -> None:
         deleted = False
-        data = self.load_calendar(calendar_id)
 
         if (
             year_str in data[KEY_TASKS][KEY_NORMAL_TASK]
@@ -181,8 +281,6 @@ class CalendarData:
                     if str(task_id) in data[KEY_TASKS][KEY_REPETITIVE_HIDDEN_TASK]:
                         del data[KEY_TASKS][KEY_REPETITIVE_HIDDEN_TASK][str(task_id)]
 
-        self._save_calendar(data, filename=calendar_id)
-
     def update_task_day(
         self,
         calendar_id: str,
@@ -192,21 +290,34 @@ class CalendarData:
         task_id: int,
         new_day_str: str,
     ) -> None:
-        data = self.load_calendar(calendar_id)
+        if isinstance(self.storage, IndexedCalendarStorage):
+            self.storage.update_task_day(calendar_id, year_str, month_str, day_str, task_id, new_day_str)
+            self._forget_document(calendar_id)
+        else:
+            self._update_calendar(
+                calendar_id,
+                lambda data: self.update_task_day_in_data(data, year_str, month_str, day_str, task_id, new_day_str),
+            )
+        self._publish(
+            calendar_id, CHANGE_MOVED, [(year_str, month_str, day_str), (year_str, month_str, new_day_str)], [task_id]
+        )
 
+    @staticmethod
+    def update_task_day_in_data(
+        data: Dict, year_str: str, month_str: str, day_str: str, task_id: int, new_day_str: str
+    ) -> bool:
         task_to_update = None
         for index, task in enumerate(data[KEY_TASKS][KEY_NORMAL_TASK][year_str][month_str][day_str]):
             if task["id"] == task_id:
                 task_to_update = data[KEY_TASKS][KEY_NORMAL_TASK][year_str][month_str][day_str].pop(index)
 
         if task_to_update is None:
-            return
+            return False
 
         if new_day_str not in data[KEY_TASKS][KEY_NORMAL_TASK][year_str][month_str]:
             data[KEY_TASKS][KEY_NORMAL_TASK][year_str][month_str][new_day_str] = []
         data[KEY_TASKS][KEY_NORMAL_TASK][year_str][month_str][new_day_str].append(task_to_update)
-
-        self._save_calendar(data, filename=calendar_id)
+        return True
 
     def create_task(
         self,
@@ -225,30 +336,161 @@ class CalendarData:
         repetition_value: int,
         travel_to: Optional[str] = None,
         end_time: Optional[str] = None,
+        starts_on: Optional[str] = None,
+        until: Optional[str] = None,
+        count: Optional[int] = None,
+        details_markup: Optional[str] = None,
     ) -> bool:
-        details = details if len(details) > 0 else "&nbsp;"
-        data = self.load_calendar(calendar_id)
-
-        new_task = {
-            "id": int(time.time()),
-            "color": color,
-            "start_time": start_time,
-            "end_time": end_time if end_time else start_time,
-            "is_all_day": is_all_day,
-            "title": title,
-            "details": details,
-            "travel_to": travel_to,
-        }
+        return self.create_tasks(
+            calendar_id=calendar_id,
+            dates=[(year, month, day)],
+            title=title,
+            is_all_day=is_all_day,
+            start_time=start_time,
+            details=details,
+            color=color,
+            has_repetition=has_repetition,
+            repetition_type=repetition_type,
+            repetition_subtype=repetition_subtype,
+            repetition_value=repetition_value,
+            travel_to=travel_to,
+            end_time=end_time,
+            starts_on=starts_on,
+            until=until,
+            count=count,
+            details_markup=details_markup,
+        )
+
+    def create_tasks(
+        self,
+        calendar_id: str,
+        dates: Sequence[Tuple[Optional[int], Optional[int], Optional[int]]],
+        title: str,
+        is_all_day: bool,
+        start_time: str,
+        details: str,
+        color: str,
+        has_repetition: bool,
+        repetition_type: Optional[str],
+        repetition_subtype: Optional[str],
+        repetition_value: int,
+        travel_to: Optional[str] = None,
+        end_time: Optional[str] = None,
+        starts_on: Optional[str] = None,
+        until: Optional[str] = None,
+        count: Optional[int] = None,
+        details_markup: Optional[str] = None,
+    ) -> bool:
+        """
+        Creates a copy of the task for each (year, month, day) in `dates` with a single load and save of the calendar.
+        Nothing is saved if any of the tasks is not valid.
+        Repetitive tasks can be bounded with `starts_on` and `until` dates (as "YYYY-MM-DD") and a `count` of
+        occurrences, which starts at `starts_on` or else at the date of the task.
+        """
         if has_repetition:
             if repetition_type == self.REPETITION_SUBTYPE_MONTH_DAY and repetition_value == 0:
                 return False
-            new_task["repetition_type"] = repetition_type
-            new_task["repetition_subtype"] = repetition_subtype
-            new_task["repetition_value"] = repetition_value
-            data[KEY_TASKS][KEY_REPETITIVE_TASK].append(new_task)
+            if not self._valid_repetition_bounds(dates, starts_on, until, count):
+                return False
+        elif any(year is None or month is None or day is None for year, month, day in dates):
+            return False
+
+        details = details if len(details) > 0 else "&nbsp;"
+
+        normal_tasks = []  # type: List[NormalTaskEntry]
+        repetitive_tasks = []  # type: List[Task]
+        for task_id, (year, month, day) in zip(self._new_task_ids(len(dates)), dates):
+            if has_repetition:
+                task_starts_on = starts_on or None
+                if task_starts_on is None and count is not None:
+                    task_starts_on = self.date_for_frontend(cast(int, year), cast(int, month), cast(int, day))
+                repetitive_tasks.append(
+                    RepetitiveTask(
+                        id=task_id,
+                        color=color,
+                        start_time=start_time,
+                        end_time=end_time if end_time else start_time,
+                        is_all_day=is_all_day,
+                        title=title,
+                        details=details,
+                        travel_to=travel_to,
+                        details_markup=details_markup,
+                        repetition_type=repetition_type,
+                        repetition_subtype=repetition_subtype,
+                        repetition_value=repetition_value,
+                        starts_on=task_starts_on,
+                        until=until or None,
+                        count=count,
+                    )
+                )
+            else:
+                new_task = Task(
+                    id=task_id,
+                    color=color,
+                    start_time=start_time,
+                    end_time=end_time if end_time else start_time,
+                    is_all_day=is_all_day,
+                    title=title,
+                    details=details,
+                    travel_to=travel_to,
+                    details_markup=details_markup,
+                )
+                normal_tasks.append((cast(int, year), cast(int, month), cast(int, day), new_task))
+
+        if count is not None:
+            # counted repetitions must end within the calendar, views can't go past it
+            max_year = current_app.config.get("MAX_YEAR", date.max.year)
+            for task in repetitive_tasks:
+                window = recurrence.rule_window(task, self.first_weekday)
+                if window is not None and window[1].year > max_year:
+                    return False
+
+        if isinstance(self.storage, IndexedCalendarStorage):
+            self.storage.add_tasks(calendar_id, normal_tasks, repetitive_tasks)
         else:
-            if year is None or month is None or day is None:
+            self._update_calendar(
+                calendar_id, lambda data: self.add_tasks_to_data(data, normal_tasks, repetitive_tasks)
+            )
+        self._forget_document(calendar_id)
+        if repetitive_tasks:
+            recurrence_cache.invalidate(calendar_id)
+        self._publish(
+            calendar_id,
+            CHANGE_CREATED,
+            [(str(year), str(month), str(day)) for year, month, day, _ in normal_tasks],
+            [task.id for _, _, _, task in normal_tasks] + [task.id for task in repetitive_tasks],
+            repeats=bool(repetitive_tasks),
+        )
+        return True
+
+    @staticmethod
+    def _valid_repetition_bounds(
+        dates: Sequence[Tuple[Optional[int], Optional[int], Optional[int]]],
+        starts_on: Optional[str],
+        until: Optional[str],
+        count: Optional[int],
+    ) -> bool:
+        try:
+            first = recurrence.parse_date(starts_on) if starts_on else None
+            last = recurrence.parse_date(until) if until else None
+        except ValueError:
+            return False
+        if first is not None and last is not None and last < first:
+            return False
+        if count is not None:
+            if count < 1 or count > recurrence.MAX_COUNT:
+                return False
+            # counted from the date of the task when there is no start
+            if first is None and any(year is None or month is None or day is None for year, month, day in dates):
                 return False
+        return True
+
+    @staticmethod
+    def add_tasks_to_data(
+        data: Dict, normal_tasks: Sequence[NormalTaskEntry], repetitive_tasks: Sequence[Task]
+    ) -> None:
+        data[KEY_TASKS][KEY_REPETITIVE_TASK].extend(repetitive_tasks)
+        for year, month, day, new_task in normal_tasks:
             year_str = str(year)
             month_str = str(month)
             day_str = str(day)
@@ -260,9 +502,6 @@ class CalendarData:
                 data[KEY_TASKS][KEY_NORMAL_TASK][year_str][month_str][day_str] = []
             data[KEY_TASKS][KEY_NORMAL_TASK][year_str][month_str][day_str].append(new_task)
 
-        self._save_calendar(data, filename=calendar_id)
-        return True
-
     def hide_repetition_task_instance(
         self,
         calendar_id: str,
@@ -271,17 +510,35 @@ class CalendarData:
         day_str: str,
         task_id_str: str,
     ) -> None:
-        data = self.load_calendar(calendar_id)
+        if isinstance(self.storage, IndexedCalendarStorage):
+            self.storage.hide_repetition_task_instance(calendar_id, year_str, month_str, day_str, task_id_str)
+        else:
+            self._update_calendar(
+                calendar_id,
+                lambda data: self.hide_repetition_task_instance_in_data(
+                    data, year_str, month_str, day_str, task_id_str
+                ),
+            )
+        self._forget_document(calendar_id)
+        recurrence_cache.invalidate(calendar_id)
+        self._publish(calendar_id, CHANGE_HIDDEN, [(year_str, month_str, day_str)], [int(task_id_str)])
 
-        if task_id_str not in data[KEY_TASKS][KEY_REPETITIVE_HIDDEN_TASK]:
-            data[KEY_TASKS][KEY_REPETITIVE_HIDDEN_TASK][task_id_str] = {}
-        if year_str not in data[KEY_TASKS][KEY_REPETITIVE_HIDDEN_TASK][task_id_str]:
-            data[KEY_TASKS][KEY_REPETITIVE_HIDDEN_TASK][task_id_str][year_str] = {}
-        if month_str not in data[KEY_TASKS][KEY_REPETITIVE_HIDDEN_TASK][task_id_str][year_str]:
-            data[KEY_TASKS][KEY_REPETITIVE_HIDDEN_TASK][task_id_str][year_str][month_str] = {}
-        data[KEY_TASKS][KEY_REPETITIVE_HIDDEN_TASK][task_id_str][year_str][month_str][day_str] = True
+    @staticmethod
+    def hide_repetition_task_instance_in_data(
+        data: Dict, year_str: str, month_str: str, day_str: str, task_id_str: str
+    ) -> None:
+        hidden_repetitions.hide(data[KEY_TASKS][KEY_REPETITIVE_HIDDEN_TASK], task_id_str, year_str, month_str, day_str)
 
-        self._save_calendar(data, filename=calendar_id)
+    @staticmethod
+    def _new_task_ids(count: int) -> List[int]:
+        # Task ids are creation timestamps in microseconds, so tasks created at the same time by different processes
+        # don't get the same id. Bumped when needed so that tasks created together (e.g. the copies of a multi-day
+        # task) still get different ids
+        global _last_task_id
+        with _task_id_lock:
+            first_id = max(time.time_ns() // 1000, _last_task_id + 1)
+            _last_task_id = first_id + count - 1
+        return list(range(first_id, first_id + count))
 
     @staticmethod
     def add_task_to_list(tasks: Dict, day_str: str, month_str: str, new_task: Dict) -> None:
@@ -289,7 +546,7 @@ class CalendarData:
             tasks[month_str][day_str] = []
         tasks[month_str][day_str].append(new_task)
 
-    def _repetitive_tasks_from_calendar(self, iterdays, data: Dict) -> Dict:
+    def _repetitive_tasks_from_calendar(self, iterdays, data: Dict, calendar_id: Optional[str] = None) -> Dict:
         if KEY_TASKS not in data:
             ValueError("Incomplete data for calendar")
         if KEY_REPETITIVE_TASK not in data[KEY_TASKS]:
@@ -297,68 +554,91 @@ class CalendarData:
 
         repetitive_tasks = {}  # type: Dict
         year_and_months = set([(source_day.year, source_day.month) for source_day in iterdays])
+        first_weekday = self.first_weekday
+        recurrence_index = None  # type: Optional[RecurrenceIndex]
 
         for source_year, source_month in year_and_months:
-            month_str = str(source_month)
-            year_str = str(source_year)
-            repetitive_tasks[month_str] = {}
-
-            for task in data[KEY_TASKS][KEY_REPETITIVE_TASK]:
-                id_str = str(task["id"])
-                monthly_task_assigned = False
-                for week in self.gregorian_calendar.month_days_with_weekday(source_year, source_month):
-                    for weekday, day in enumerate(week):
-                        if day == 0:
-                            continue
-                        day_str = str(day)
-                        if (
-                            task["repetition_type"] == self.REPETITION_TYPE_WEEKLY
-                            and not self._is_repetition_hidden_for_day(data, id_str, year_str, month_str, str(day))
-                            and task["repetition_value"] == weekday
-                        ):
-                            self.add_task_to_list(repetitive_tasks, day_str, month_str, task)
-                        elif task["repetition_type"] == self.REPETITION_TYPE_MONTHLY and not self._is_repetition_hidden(
-                            data, id_str, year_str, month_str
-                        ):
-                            if task["repetition_subtype"] == self.REPETITION_SUBTYPE_WEEK_DAY:
-                                if task["repetition_value"] == weekday and not monthly_task_assigned:
-                                    monthly_task_assigned = True
-                                    self.add_task_to_list(repetitive_tasks, day_str, month_str, task)
-                            else:
-                                if task["repetition_value"] == day:
-                                    self.add_task_to_list(repetitive_tasks, day_str, month_str, task)
+            key = None  # type: Optional[ExpansionKey]
+            month_tasks = None
+            if calendar_id is not None:
+                key = (
+                    calendar_id,
+                    data.get(KEY_VERSION, 0),
+                    data.get(KEY_JOURNAL_SEQUENCE, 0),
+                    source_year,
+                    source_month,
+                    first_weekday,
+                )
+                month_tasks = recurrence_cache.get(key)
+            if month_tasks is None:
+                if recurrence_index is None:
+                    recurrence_index = RecurrenceIndex(
+                        data[KEY_TASKS][KEY_REPETITIVE_TASK], data[KEY_TASKS][KEY_REPETITIVE_HIDDEN_TASK]
+                    )
+                month_tasks = recurrence_index.month_tasks(source_year, source_month, first_weekday)
+                if key is not None:
+                    recurrence_cache.put(key, month_tasks)
+            repetitive_tasks[str(source_month)] = month_tasks
 
         return repetitive_tasks
 
-    @staticmethod
-    def _is_repetition_hidden_for_day(data: Dict, id_str: str, year_str: str, month_str: str, day_str: str) -> bool:
-        if id_str in data[KEY_TASKS][KEY_REPETITIVE_HIDDEN_TASK]:
-            if (
-                year_str in data[KEY_TASKS][KEY_REPETITIVE_HIDDEN_TASK][id_str]
-                and month_str in data[KEY_TASKS][KEY_REPETITIVE_HIDDEN_TASK][id_str][year_str]
-                and day_str in data[KEY_TASKS][KEY_REPETITIVE_HIDDEN_TASK][id_str][year_str][month_str]
-            ):
-                return True
-        return False
+    def _update_calendar(self, calendar_id: str, change: Callable[[Dict], Optional[bool]]) -> None:
+        """
+        Applies `change` to a private copy of the calendar and saves it, unless `change` returns False.
+        Saving only succeeds if nobody saved the calendar in between, otherwise the change is applied again over the
+        latest version.
+        """
+        for attempt in range(SAVE_CONFLICT_ATTEMPTS):
+            if attempt == 0 and self.documents is not None and calendar_id in self.documents:
+                # already loaded during this request (e.g. to authorize it), copying is cheaper than decoding again
+                data = self._copy_document(self.documents[calendar_id])
+            else:
+                data = self.load_calendar(calendar_id, use_cache=False)
+            if change(data) is False:
+                return
+            try:
+                self._save_calendar(data, filename=calendar_id)
+                self._forget_document(calendar_id)
+                return
+            except CalendarConflictError:
+                if attempt == SAVE_CONFLICT_ATTEMPTS - 1:
+                    raise
+                time.sleep(random.uniform(0, SAVE_CONFLICT_BACKOFF_SECONDS * 2**attempt))
+
+    def _publish(
+        self,
+        calendar_id: str,
+        op: str,
+        days: Sequence[Tuple[str, str, str]],
+        task_ids: Sequence[int],
+        repeats: bool = False,
+    ) -> None:
+        if self.change_feed is None:
+            return
+        dates = [self.date_for_frontend(int(year), int(month), int(day)) for year, month, day in days]
+        self.change_feed.publish(calendar_id, op, dates, task_ids, repeats=repeats)
+
+    def _forget_document(self, calendar_id: str) -> None:
+        if self.documents is not None:
+            self.documents.pop(calendar_id, None)
 
     @staticmethod
-    def _is_repetition_hidden(data: Dict, id_str: str, year_str: str, month_str: str) -> bool:
-        if id_str in data[KEY_TASKS][KEY_REPETITIVE_HIDDEN_TASK]:
-            if (
-                year_str in data[KEY_TASKS][KEY_REPETITIVE_HIDDEN_TASK][id_str]
-                and month_str in data[KEY_TASKS][KEY_REPETITIVE_HIDDEN_TASK][id_str][year_str]
-            ):
-                return True
-        return False
+    def _copy_document(data: Any) -> Any:
+        # copies the dicts and lists of a calendar but shares the tasks, which changes replace instead of modifying
+        if isinstance(data, dict):
+            return {key: CalendarData._copy_document(value) for key, value in data.items()}
+        elif isinstance(data, list):
+            return [CalendarData._copy_document(value) for value in data]
+        return data
 
     def _save_calendar(self, data: Dict, filename: str) -> None:
+        # `data` keeps the version it was loaded at, so saving fails if someone else saved the calendar meanwhile
         if random.randint(0, 99) < current_app.config.get("GC_ON_SAVE_CHANCE", 100):
             pass
             # self._clear_empty_entries(data)
             # self._clear_past_hidden_entries(data)
 
-        with open(os.path.join(".", self.data_folder, "{}.json".format(filename)), "w+") as file:
-            json.dump(data, file)
+        self.storage.save(filename, data, expected_version=data.get(KEY_VERSION, 0))
 
     @staticmethod
     def _clear_empty_entries(data: Dict) -> None:
@@ -391,14 +671,14 @@ class CalendarData:
 
         for task_id in data[KEY_TASKS][KEY_REPETITIVE_HIDDEN_TASK]:
             for year in data[KEY_TASKS][KEY_REPETITIVE_HIDDEN_TASK][task_id]:
-                for month in data[KEY_TASKS][KEY_REPETITIVE_HIDDEN_TASK][task_id][year]:
-                    task_date = datetime(int(year), int(month), 1, 0, 0)
+                for month in hidden_repetitions.hidden_months(
+                    data[KEY_TASKS][KEY_REPETITIVE_HIDDEN_TASK][task_id][year]
+                ):
+                    task_date = datetime(int(year), month, 1, 0, 0)
                     if (current_date - task_date).days > current_app.config["DAYS_PAST_TO_KEEP_HIDDEN_TASKS"]:
                         pass
                         # tasks_to_delete.append((year, month, task_id))
 
         for task_info in tasks_to_delete:
             year, month, task_id = task_info
-            del data[KEY_TASKS][KEY_REPETITIVE_HIDDEN_TASK][task_id][year][month]
-            if len(data[KEY_TASKS][KEY_REPETITIVE_HIDDEN_TASK][task_id]) == 0:
-                del data[KEY_TASKS][KEY_REPETITIVE_HIDDEN_TASK][task_id]
+            hidden_repetitions.unhide_month(data[KEY_TASKS][KEY_REPETITIVE_HIDDEN_TASK], task_id, year, month)
@@ -0,0 +1,123 @@
+from typing import Any, Dict, Iterable, List, Optional, TypedDict, Union, cast
+
+import msgspec
+from flask_calendar.hidden_repetitions import from_nested, is_nested
+
+
+class _TaskMapping(msgspec.Struct, omit_defaults=True):
+    # Read-only dict-like access, as templates and existing code use `task["title"]` and `"repetition_type" in task`
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self.__struct_fields__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self.__struct_fields__
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key) if key in self.__struct_fields__ else default
+
+    def keys(self) -> Iterable[str]:
+        return self.__struct_fields__
+
+
+# Tasks only hold scalars, so they can't be part of reference cycles and don't need to be tracked by the GC
+class Task(_TaskMapping, gc=False):
+    id: int
+    color: str
+    start_time: str
+    end_time: str
+    is_all_day: bool
+    title: str
+    details: str
+    travel_to: Optional[str] = None
+    # decorated `details`, only stored if STORE_TASK_DETAILS_MARKUP is enabled and they have links
+    details_markup: Optional[str] = None
+
+
+class RepetitiveTask(Task, gc=False, kw_only=True):
+    repetition_type: Optional[str]
+    repetition_subtype: Optional[str]
+    repetition_value: int
+    # optional bounds, see `recurrence.rule_window`: dates as "YYYY-MM-DD", `count` occurrences from `starts_on`
+    starts_on: Optional[str] = None
+    until: Optional[str] = None
+    count: Optional[int] = None
+
+
+# {day_str: [task, ...]}
+MonthTasks = Dict[str, List[Task]]
+NormalTasks = Dict[str, Dict[str, MonthTasks]]
+# {task_id_str: {year_str: bitmap}} (see `hidden_repetitions`), calendars saved before bitmaps have the nested
+# {task_id_str: {year_str: {month_str: {day_str: true}}}} form, converted when decoding
+HiddenRepetitions = Dict[str, Dict[str, Union[str, Dict[str, Dict[str, bool]]]]]
+
+
+class CalendarTasks(TypedDict):
+    normal: NormalTasks
+    repetition: List[RepetitiveTask]
+    hidden_repetition: HiddenRepetitions
+
+
+class _CalendarDocumentOptionalFields(TypedDict, total=False):
+    name: str
+    version: int
+    journal_sequence: int
+    revision: int
+
+
+class CalendarDocument(_CalendarDocumentOptionalFields):
+    # Containers stay dicts (code and tests index and update them by key), tasks are structs
+    users: List[str]
+    tasks: CalendarTasks
+
+
+_calendar_decoder = msgspec.json.Decoder(CalendarDocument)
+_month_tasks_decoder = msgspec.json.Decoder(MonthTasks)
+_task_decoder = msgspec.json.Decoder(Task)
+_repetitive_task_decoder = msgspec.json.Decoder(RepetitiveTask)
+_encoder = msgspec.json.Encoder()
+
+
+def decode_calendar(contents: bytes) -> Dict:
+    try:
+        data = cast(Dict, _calendar_decoder.decode(contents))
+    except msgspec.DecodeError as error:
+        raise ValueError("Invalid calendar data: {}".format(error)) from error
+    if is_nested(data["tasks"]["hidden_repetition"]):
+        data["tasks"]["hidden_repetition"] = from_nested(data["tasks"]["hidden_repetition"])
+    return data
+
+
+def encode_calendar(data: Dict) -> bytes:
+    return _encoder.encode(data)
+
+
+def decode_month_tasks(contents: bytes) -> MonthTasks:
+    try:
+        return _month_tasks_decoder.decode(contents)
+    except msgspec.DecodeError as error:
+        raise ValueError("Invalid month tasks data: {}".format(error)) from error
+
+
+def encode_json(value: Any) -> bytes:
+    # any other value containing tasks, like journal records
+    return _encoder.encode(value)
+
+
+def decode_task(contents: bytes, repeats: bool) -> Task:
+    if repeats:
+        return _repetitive_task_decoder.decode(contents)
+    return _task_decoder.decode(contents)
+
+
+def encode_task(task: Task) -> bytes:
+    return _encoder.encode(task)
+
+
+def to_task(task: Any) -> Task:
+    # converts tasks coming from other sources (like journal records) to the struct types
+    if isinstance(task, Task):
+        return task
+    return msgspec.convert(task, type=RepetitiveTask if "repetition_type" in task else Task)
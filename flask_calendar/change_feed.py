@@ -0,0 +1,203 @@
+import itertools
+import json
+import os
+import time
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, cast
+
+from flask_calendar.storage import CalendarLocks, append_line, write_atomically
+
+CHANGE_CREATED = "created"
+CHANGE_DELETED = "deleted"
+CHANGE_MOVED = "moved"
+CHANGE_HIDDEN = "hidden"
+
+# bytes read at a time from the end of a log looking for its last record
+TAIL_CHUNK_BYTES = 4096
+# idle streams send a comment this often, so proxies don't close them
+KEEPALIVE_SECONDS = 15
+
+# (inode of the log, offset read up to, last sequence number seen)
+Cursor = Tuple[Optional[int], int, int]
+
+
+class ChangeFeed:
+    """
+    Changes of the tasks of each calendar as JSON lines in a `<calendar_id>.changes` log inside `folder`:
+    `{"seq": 3, "at": 1513987200, "op": "moved", "days": ["2017-12-25", "2017-12-26"], "tasks": [1], "repeats": false}`.
+    `repeats` changes (of repetitive tasks) affect every day the task happens on, `days` only lists the ones given
+    when it changed. `at` is the unix time of the change.
+
+    Every process appends to and tails the same files, so subscribers see the changes made by any worker. Records
+    older than `retention_seconds` are dropped, and once a log grows over `max_bytes` its older half too. The last
+    record is always kept, so sequence numbers keep growing.
+    """
+
+    def __init__(self, folder: str, max_bytes: int, retention_seconds: int) -> None:
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.retention_seconds = retention_seconds
+        self.locks = CalendarLocks(folder)
+
+    def publish(
+        self, calendar_id: str, op: str, days: Sequence[str], task_ids: Sequence[int], repeats: bool = False
+    ) -> None:
+        path = self.path(calendar_id)
+        # not the calendar lock, storages may hold it
+        with self.locks.hold("{}.changes".format(calendar_id)):
+            now = int(time.time())
+            record = {
+                "seq": self._last_sequence(path) + 1,
+                "at": now,
+                "op": op,
+                "days": list(days),
+                "tasks": list(task_ids),
+                "repeats": repeats,
+            }
+            append_line(path, (json.dumps(record, separators=(",", ":")) + "\n").encode("UTF-8"))
+            size = os.path.getsize(path)
+            first_record = self._first_record(path)
+            oldest_time = now - self.retention_seconds
+            if size > self.max_bytes or first_record.get("at", 0) < oldest_time:
+                self._trim(path, oldest_time)
+
+    def read(self, calendar_id: str, cursor: Cursor) -> Tuple[List[Dict], Cursor]:
+        """
+        Records appended since `cursor` and the cursor to continue from. A cursor from `cursor_at_end` only sees
+        later changes, one from `cursor_after` the ones after a sequence number.
+        """
+        inode, offset, last_sequence = cursor
+        try:
+            file = open(self.path(calendar_id), "rb")
+        except FileNotFoundError:
+            return [], (None, 0, last_sequence)
+        with file:
+            current_inode = os.fstat(file.fileno()).st_ino
+            if current_inode != inode:
+                # replaced when trimmed, already seen records are skipped by sequence
+                offset = 0
+            file.seek(offset)
+            contents = file.read()
+        # a line being appended is read once complete
+        complete = contents[: contents.rfind(b"\n") + 1]
+        records = []  # type: List[Dict]
+        for line in complete.splitlines():
+            record = self._parse_record(line)
+            if record is not None and record["seq"] > last_sequence:
+                records.append(record)
+                last_sequence = record["seq"]
+        return records, (current_inode, offset + len(complete), last_sequence)
+
+    def cursor_at_end(self, calendar_id: str) -> Cursor:
+        path = self.path(calendar_id)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None, 0, 0
+        return stat.st_ino, stat.st_size, self._last_sequence(path)
+
+    @staticmethod
+    def cursor_after(sequence: int) -> Cursor:
+        return None, 0, sequence
+
+    def first_sequence(self, calendar_id: str) -> Optional[int]:
+        return self._first_record(self.path(calendar_id)).get("seq")
+
+    def last_sequence(self, calendar_id: str) -> int:
+        return self._last_sequence(self.path(calendar_id))
+
+    def path(self, calendar_id: str) -> str:
+        return os.path.join(".", self.folder, "{}.changes".format(calendar_id))
+
+    def _trim(self, path: str, oldest_time: int) -> None:
+        with open(path, "rb") as file:
+            lines = file.read().splitlines(keepends=True)
+        kept = list(itertools.dropwhile(lambda line: self._record_time(line) < oldest_time, lines[:-1])) + lines[-1:]
+        if sum(len(line) for line in kept) > self.max_bytes:
+            kept = kept[len(kept) // 2 :]
+        write_atomically(path, b"".join(kept))
+
+    @classmethod
+    def _record_time(cls, line: bytes) -> int:
+        # unreadable lines count as the oldest, so trimming drops them
+        record = cls._parse_record(line)
+        return int(record.get("at", 0)) if record is not None else 0
+
+    @classmethod
+    def _first_record(cls, path: str) -> Dict:
+        try:
+            file = open(path, "rb")
+        except FileNotFoundError:
+            return {}
+        with file:
+            for line in file:
+                record = cls._parse_record(line)
+                if record is not None:
+                    return record
+        return {}
+
+    @staticmethod
+    def _parse_record(line: bytes) -> Optional[Dict]:
+        """
+        Record of a line, or None if it isn't one: cut by a crash before `append_line` dropped cut lines, or without
+        a sequence number.
+        """
+        try:
+            record = json.loads(line)
+        except ValueError:
+            return None
+        if not isinstance(record, dict) or not isinstance(record.get("seq"), int):
+            return None
+        return record
+
+    @classmethod
+    def _last_sequence(cls, path: str) -> int:
+        try:
+            file = open(path, "rb")
+        except FileNotFoundError:
+            return 0
+        with file:
+            position = file.seek(0, os.SEEK_END)
+            tail = b""
+            # until the tail holds a whole line before the final newline
+            while position > 0 and tail.rstrip(b"\n").count(b"\n") == 0:
+                step = min(TAIL_CHUNK_BYTES, position)
+                position -= step
+                file.seek(position)
+                tail = file.read(step) + tail
+        for line in reversed(tail.splitlines()):
+            record = cls._parse_record(line)
+            if record is not None:
+                return cast(int, record["seq"])
+        return 0
+
+
+def event_stream(
+    feed: ChangeFeed, calendar_id: str, last_event_id: Optional[int], duration: float, poll_seconds: float
+) -> Iterator[str]:
+    """
+    Server-Sent Events of the changes of a calendar, after `last_event_id` if given (browsers send it when
+    reconnecting) or else from now. Ends after `duration` seconds, so it doesn't keep a worker forever: browsers
+    reconnect on their own. A `reset` event tells that changes were trimmed from the log before being sent.
+    """
+    yield "retry: {}\n\n".format(int(poll_seconds * 1000))
+    if last_event_id is None:
+        cursor = feed.cursor_at_end(calendar_id)
+    else:
+        cursor = feed.cursor_after(last_event_id)
+        first_sequence = feed.first_sequence(calendar_id)
+        if first_sequence is not None and first_sequence > last_event_id + 1:
+            yield "event: reset\ndata: {}\n\n"
+
+    ends_at = time.monotonic() + duration
+    sent_at = time.monotonic()
+    while True:
+        records, cursor = feed.read(calendar_id, cursor)
+        for record in records:
+            yield "id: {}\ndata: {}\n\n".format(record["seq"], json.dumps(record, separators=(",", ":")))
+            sent_at = time.monotonic()
+        if time.monotonic() >= ends_at:
+            return
+        if time.monotonic() - sent_at >= KEEPALIVE_SECONDS:
+            yield ": keepalive\n\n"
+            sent_at = time.monotonic()
+        time.sleep(poll_seconds)
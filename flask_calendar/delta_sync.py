@@ -0,0 +1,57 @@
+from datetime import date
+from typing import Dict, Iterable, List, Set
+
+from flask_calendar.change_feed import CHANGE_DELETED
+from flask_calendar.hidden_repetitions import hidden_days
+from flask_calendar.recurrence import parse_date
+
+
+def compact_changes(records: Iterable[Dict], data: Dict) -> Dict:
+    """
+    What the change `records` of a calendar did, as the current state of each task they touched:
+    `{"tasks": [{"date": "2017-12-25", "task": task}], "repetitive_tasks": [{"task": task, "hidden": [dates]}],
+    "removed": [task_id]}`. A task changed many times appears once, deleted tasks only as their id.
+    """
+    # normal tasks can only be on the days their changes listed
+    candidate_days = {}  # type: Dict[int, Set[str]]
+    removed = set()  # type: Set[int]
+    for record in records:
+        for task_id in record.get("tasks", []):
+            if record["op"] == CHANGE_DELETED:
+                candidate_days.pop(task_id, None)
+                removed.add(task_id)
+            else:
+                candidate_days.setdefault(task_id, set()).update(record["days"])
+                removed.discard(task_id)
+
+    tasks = data["tasks"]
+    normal_tasks = []  # type: List[Dict]
+    repetitive_tasks = []  # type: List[Dict]
+    found = set()  # type: Set[int]
+    for task_id, days in candidate_days.items():
+        for day in sorted(days):
+            try:
+                day_date = parse_date(day)
+            except ValueError:
+                continue
+            month_tasks = tasks["normal"].get(str(day_date.year), {}).get(str(day_date.month), {})
+            for task in month_tasks.get(str(day_date.day), []):
+                if task["id"] == task_id:
+                    normal_tasks.append({"date": day, "task": task})
+                    found.add(task_id)
+    for task in tasks["repetition"]:
+        if task["id"] in candidate_days:
+            repetitive_tasks.append({"task": task, "hidden": _hidden_dates(tasks["hidden_repetition"], task["id"])})
+            found.add(task["id"])
+
+    # no longer in the calendar, if changed while the log was off
+    removed.update(set(candidate_days) - found)
+    return {"tasks": normal_tasks, "repetitive_tasks": repetitive_tasks, "removed": sorted(removed)}
+
+
+def _hidden_dates(hidden: Dict, task_id: int) -> List[str]:
+    return [
+        date(int(year_str), month, day).isoformat()
+        for year_str, encoded in sorted(hidden.get(str(task_id), {}).items())
+        for month, day in hidden_days(encoded)
+    ]
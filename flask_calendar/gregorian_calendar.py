@@ -1,6 +1,22 @@
 import calendar
 from datetime import date, datetime, timedelta
-from typing import Iterable, List, Tuple
+from functools import lru_cache
+from typing import Iterable, Sequence, Tuple
+
+from flask_calendar import constants
+
+DAYS_IN_WEEK = 7
+
+
+@lru_cache(maxsize=None)
+def _month_grid(year: int, month: int, first_weekday: int) -> Tuple[date, ...]:
+    # views clamp years to MIN_YEAR..MAX_YEAR, which bounds the grids kept to (years * 12 months * 7 first weekdays)
+    return tuple(calendar.Calendar(first_weekday).itermonthdates(year, month))
+
+
+@lru_cache(maxsize=None)
+def _month_weeks(year: int, month: int, first_weekday: int) -> Tuple[Tuple[int, ...], ...]:
+    return tuple(tuple(week) for week in calendar.Calendar(first_weekday).monthdayscalendar(year, month))
 
 
 class GregorianCalendar:
@@ -20,10 +36,6 @@ class GregorianCalendar:
         "December",
     ]
 
-    @staticmethod
-    def setfirstweekday(weekday: int) -> None:
-        calendar.setfirstweekday(weekday)
-
     @staticmethod
     def previous_month_and_year(year: int, month: int) -> Tuple[int, int]:
         previous_month_date = date(year, month, 1) - timedelta(days=2)
@@ -50,25 +62,27 @@ class GregorianCalendar:
         return today_date.day, today_date.month, today_date.year
 
     @staticmethod
-    def month_days(year: int, month: int) -> Iterable[date]:
-        return calendar.Calendar(calendar.firstweekday()).itermonthdates(year, month)
+    def month_days(year: int, month: int, first_weekday: int = constants.WEEK_START_DAY_MONDAY) -> Iterable[date]:
+        """
+        Days of the weeks of the month, starting on `first_weekday`. Grids are computed once and shared, don't modify
+        them.
+        """
+        return _month_grid(year, month, first_weekday)
 
     @staticmethod
-    def month_days_with_weekday(year: int, month: int) -> List[List[int]]:
-        return calendar.Calendar(calendar.firstweekday()).monthdayscalendar(year, month)
+    def month_days_with_weekday(
+        year: int, month: int, first_weekday: int = constants.WEEK_START_DAY_MONDAY
+    ) -> Sequence[Sequence[int]]:
+        return _month_weeks(year, month, first_weekday)
 
     @staticmethod
-    def week_days(year, month, day):
-        first_weekday = calendar.firstweekday()
-
-        current_date = datetime(year, month, day)
-        current_day = current_date.weekday()
-
-        while current_day != first_weekday:
-            current_date -= timedelta(days=1)
-            current_day = current_date.weekday()
-
-        for _ in range(7):
-            yield current_date
-            current_date += timedelta(days=1)
+    def week_start(year: int, month: int, day: int, first_weekday: int = constants.WEEK_START_DAY_MONDAY) -> date:
+        current_date = date(year, month, day)
+        return current_date - timedelta(days=(current_date.weekday() - first_weekday) % DAYS_IN_WEEK)
 
+    @staticmethod
+    def week_days(
+        year: int, month: int, day: int, first_weekday: int = constants.WEEK_START_DAY_MONDAY
+    ) -> Iterable[date]:
+        week_start = GregorianCalendar.week_start(year, month, day, first_weekday)
+        return [week_start + timedelta(days=weekday) for weekday in range(DAYS_IN_WEEK)]
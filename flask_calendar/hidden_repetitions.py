@@ -0,0 +1,115 @@
+import base64
+from typing import Any, Dict, Iterator, List, Mapping, Tuple
+
+MONTHS_IN_YEAR = 12
+# every month gets 31 slots, so any (month, day) key of the previous nested form has its own bit
+DAY_SLOTS_PER_MONTH = 31
+MONTH_MASK = (1 << DAY_SLOTS_PER_MONTH) - 1
+
+# {task_id_str: {year_str: bitmap}}, where each bitmap is the base64 of a little-endian bitfield with bit
+# `(month - 1) * 31 + (day - 1)` set for every hidden instance of the task during that year
+HiddenRepetitions = Dict[str, Dict[str, str]]
+
+
+def day_bit(month: int, day: int) -> int:
+    if not 1 <= month <= MONTHS_IN_YEAR or not 1 <= day <= DAY_SLOTS_PER_MONTH:
+        raise ValueError("Invalid month '{}' or day '{}'".format(month, day))
+    return (month - 1) * DAY_SLOTS_PER_MONTH + day - 1
+
+
+def month_mask(month: int) -> int:
+    return MONTH_MASK << day_bit(month, 1)
+
+
+def decode_bitmap(encoded: str) -> int:
+    return int.from_bytes(base64.b64decode(encoded), "little")
+
+
+def encode_bitmap(bitmap: int) -> str:
+    # trailing empty bytes are left out, so years with only early instances hidden take less space
+    return base64.b64encode(bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little")).decode("ascii")
+
+
+def year_bitmap(hidden: Mapping, task_id_str: str, year_str: str) -> int:
+    encoded = hidden.get(task_id_str, {}).get(year_str)
+    return 0 if encoded is None else decode_bitmap(encoded)
+
+
+def is_hidden(hidden: Mapping, task_id_str: str, year_str: str, month_str: str, day_str: str) -> bool:
+    return bool(year_bitmap(hidden, task_id_str, year_str) >> day_bit(int(month_str), int(day_str)) & 1)
+
+
+def is_month_hidden(hidden: Mapping, task_id_str: str, year_str: str, month_str: str) -> bool:
+    """
+    Whether any instance of the task was hidden during the month.
+    """
+    return bool(year_bitmap(hidden, task_id_str, year_str) & month_mask(int(month_str)))
+
+
+def hide(hidden: HiddenRepetitions, task_id_str: str, year_str: str, month_str: str, day_str: str) -> None:
+    bitmap = year_bitmap(hidden, task_id_str, year_str) | 1 << day_bit(int(month_str), int(day_str))
+    # replaces the years of the task instead of modifying them, so shallow copies of `hidden` don't see the change
+    hidden[task_id_str] = dict(hidden.get(task_id_str, {}))
+    hidden[task_id_str][year_str] = encode_bitmap(bitmap)
+
+
+def hidden_days(encoded: str) -> Iterator[Tuple[int, int]]:
+    """
+    (month, day) of each hidden instance in a year bitmap, in order.
+    """
+    bitmap = decode_bitmap(encoded)
+    while bitmap:
+        bit = (bitmap & -bitmap).bit_length() - 1
+        yield bit // DAY_SLOTS_PER_MONTH + 1, bit % DAY_SLOTS_PER_MONTH + 1
+        bitmap &= bitmap - 1
+
+
+def hidden_months(encoded: str) -> List[int]:
+    bitmap = decode_bitmap(encoded)
+    return [month for month in range(1, MONTHS_IN_YEAR + 1) if bitmap & month_mask(month)]
+
+
+def unhide_month(hidden: HiddenRepetitions, task_id_str: str, year_str: str, month: int) -> None:
+    bitmap = year_bitmap(hidden, task_id_str, year_str) & ~month_mask(month)
+    years = hidden[task_id_str] = dict(hidden.get(task_id_str, {}))
+    if bitmap:
+        years[year_str] = encode_bitmap(bitmap)
+    else:
+        years.pop(year_str, None)
+        if not years:
+            del hidden[task_id_str]
+
+
+def from_nested(nested: Mapping) -> HiddenRepetitions:
+    """
+    Converts the previous `{task_id: {year: {month: {day: true}}}}` form. Empty months and days set to a false value
+    hide nothing, so they are skipped; raises ValueError for months or days that don't exist.
+    """
+    hidden = {}  # type: HiddenRepetitions
+    for task_id_str, years in nested.items():
+        for year_str, months in years.items():
+            if isinstance(months, str):
+                # already converted
+                hidden.setdefault(task_id_str, {})[year_str] = months
+                continue
+            bitmap = 0
+            for month_str, days in months.items():
+                for day_str, value in days.items():
+                    if value:
+                        bitmap |= 1 << day_bit(int(month_str), int(day_str))
+            if bitmap:
+                hidden.setdefault(task_id_str, {})[year_str] = encode_bitmap(bitmap)
+    return hidden
+
+
+def to_nested(hidden: Mapping) -> Dict[str, Dict[str, Dict[str, Dict[str, bool]]]]:
+    nested = {}  # type: Dict[str, Dict[str, Dict[str, Dict[str, bool]]]]
+    for task_id_str, years in hidden.items():
+        for year_str, encoded in years.items():
+            for month, day in hidden_days(encoded):
+                nested.setdefault(task_id_str, {}).setdefault(year_str, {}).setdefault(str(month), {})[str(day)] = True
+    return nested
+
+
+def is_nested(hidden: Mapping[str, Mapping[str, Any]]) -> bool:
+    return any(not isinstance(encoded, str) for years in hidden.values() for encoded in years.values())
@@ -0,0 +1,159 @@
+from datetime import date, timedelta
+from typing import Dict, Iterator, List, Mapping, Optional
+
+from flask_calendar.calendar_schema import Task
+from flask_calendar.hidden_repetitions import hidden_days
+from flask_calendar.occurrences import occurrences_between
+from flask_calendar.recurrence import (
+    DAYS_IN_WEEK,
+    REPETITION_SUBTYPE_WEEK_DAY,
+    REPETITION_TYPE_WEEKLY,
+    RuleBuckets,
+    first_occurrence,
+    is_bounded,
+    rule_window,
+)
+
+PRODUCT_ID = "-//flask-calendar//ICS export//EN"
+UID_DOMAIN = "flask-calendar"
+# RFC 5545 content lines are folded at 75 octets
+MAX_LINE_OCTETS = 75
+# indexed by `date.weekday()`
+ICS_WEEKDAYS = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")
+
+
+def calendar_lines(
+    calendar_id: str, data: Dict, start: date, end: date, first_weekday: int, stamp: date
+) -> Iterator[str]:
+    """
+    iCalendar document of a calendar, one folded CRLF-ended line at a time so it can be streamed.
+
+    Normal tasks from `start` to `end` become one event each. Repetitive tasks become a single event with a RRULE
+    starting on their first occurrence from `start` on, and an EXDATE per hidden instance. Times are floating (local
+    to whoever reads them), as the calendar stores no time zone.
+    """
+    yield from _line("BEGIN", "VCALENDAR")
+    yield from _line("VERSION", "2.0")
+    yield from _line("PRODID", PRODUCT_ID)
+    yield from _line("X-WR-CALNAME", _text(data.get("name", calendar_id)))
+
+    tasks = data["tasks"]
+    for day, task in occurrences_between(tasks["normal"], [], {}, start, end, first_weekday):
+        yield from _event(
+            "{}-{}-{}@{}".format(calendar_id, day.isoformat(), task["id"], UID_DOMAIN), task, day, stamp, []
+        )
+
+    for task in tasks["repetition"]:
+        yield from _repetitive_event(calendar_id, task, tasks["hidden_repetition"], start, first_weekday, stamp)
+
+    yield from _line("END", "VCALENDAR")
+
+
+def _repetitive_event(
+    calendar_id: str, task: Task, hidden_repetitions: Mapping, start: date, first_weekday: int, stamp: date
+) -> Iterator[str]:
+    first, last = date.min, date.max
+    if is_bounded(task):
+        window = rule_window(task, first_weekday)
+        if window is None:
+            return
+        first, last = window
+    first_day = first_occurrence(task, max(start, first), first_weekday)
+    if first_day is None or first_day > last:
+        return
+
+    weekday = ICS_WEEKDAYS[(task["repetition_value"] + first_weekday) % DAYS_IN_WEEK]
+    if task["repetition_type"] == REPETITION_TYPE_WEEKLY:
+        rule = "FREQ=WEEKLY;BYDAY={}".format(weekday)
+    elif task["repetition_subtype"] == REPETITION_SUBTYPE_WEEK_DAY:
+        rule = "FREQ=MONTHLY;BYDAY=1{}".format(weekday)
+    else:
+        rule = "FREQ=MONTHLY;BYMONTHDAY={}".format(task["repetition_value"])
+    if last != date.max:
+        # UNTIL has the value type of DTSTART
+        rule += ";UNTIL={}".format(_date_value(last) if task["is_all_day"] else _date_time_value(last, "23:59"))
+
+    excluded_days = [
+        day for day in _hidden_occurrences(task, hidden_repetitions, first_weekday) if first_day <= day <= last
+    ]
+    yield from _event(
+        "{}-repetition-{}@{}".format(calendar_id, task["id"], UID_DOMAIN), task, first_day, stamp, excluded_days, rule
+    )
+
+
+def _hidden_occurrences(task: Task, hidden_repetitions: Mapping, first_weekday: int) -> List[date]:
+    """
+    Occurrences hidden like `RecurrenceIndex` hides them: weekly ones by their day, monthly ones by any day of their
+    month.
+    """
+    buckets = RuleBuckets([(0, task)])
+    weekly = task["repetition_type"] == REPETITION_TYPE_WEEKLY
+    hidden = []  # type: List[date]
+    for year_str, encoded in sorted(hidden_repetitions.get(str(task["id"]), {}).items(), key=lambda item: item[0]):
+        year = int(year_str)
+        months = {}  # type: Dict[int, List[int]]
+        for month, day in hidden_days(encoded):
+            months.setdefault(month, []).append(day)
+        for month, days in sorted(months.items()):
+            for day, _, _ in buckets.month_days(year, month, first_weekday):
+                if not weekly or day in days:
+                    hidden.append(date(year, month, day))
+    return sorted(hidden)
+
+
+def _event(
+    uid: str, task: Task, day: date, stamp: date, excluded_days: List[date], rule: Optional[str] = None
+) -> Iterator[str]:
+    yield from _line("BEGIN", "VEVENT")
+    yield from _line("UID", uid)
+    yield from _line("DTSTAMP", "{}T000000Z".format(stamp.strftime("%Y%m%d")))
+    if task["is_all_day"]:
+        yield from _line("DTSTART;VALUE=DATE", _date_value(day))
+        yield from _line("DTEND;VALUE=DATE", _date_value(day + timedelta(days=1)))
+    else:
+        yield from _line("DTSTART", _date_time_value(day, task["start_time"]))
+        # tasks ending at or before their start (like the "00:00" default) are left without duration
+        if task["end_time"] > task["start_time"]:
+            yield from _line("DTEND", _date_time_value(day, task["end_time"]))
+    if rule is not None:
+        yield from _line("RRULE", rule)
+    for excluded_day in excluded_days:
+        if task["is_all_day"]:
+            yield from _line("EXDATE;VALUE=DATE", _date_value(excluded_day))
+        else:
+            yield from _line("EXDATE", _date_time_value(excluded_day, task["start_time"]))
+    yield from _line("SUMMARY", _text(task["title"]))
+    details = task["details"].replace("<br>", "\n").replace("&nbsp;", "")
+    if details:
+        yield from _line("DESCRIPTION", _text(details))
+    yield from _line("END", "VEVENT")
+
+
+def _date_value(day: date) -> str:
+    return day.strftime("%Y%m%d")
+
+
+def _date_time_value(day: date, time: str) -> str:
+    return "{}T{}00".format(day.strftime("%Y%m%d"), time.replace(":", ""))
+
+
+def _text(value: str) -> str:
+    return value.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+
+def _line(name: str, value: str) -> Iterator[str]:
+    """
+    Content line folded in chunks of at most 75 octets, without splitting UTF-8 sequences.
+    """
+    line = "{}:{}".format(name, value)
+    chunk = ""
+    chunk_octets = 0
+    for character in line:
+        octets = len(character.encode("utf-8"))
+        if chunk_octets + octets > MAX_LINE_OCTETS:
+            yield chunk + "\r\n"
+            # continuation lines start with a space, which counts towards their length
+            chunk, chunk_octets = " ", 1
+        chunk += character
+        chunk_octets += octets
+    yield chunk + "\r\n"
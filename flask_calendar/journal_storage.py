@@ -0,0 +1,240 @@
+import json
+import os
+import threading
+from typing import IO, ContextManager, Dict, List, Optional, Sequence, Tuple, cast
+
+from flask_calendar.calendar_cache import FileStamp, cache, file_stamp
+from flask_calendar.calendar_schema import Task, decode_calendar, encode_calendar, encode_json, to_task
+from flask_calendar.calendar_data import (
+    KEY_NORMAL_TASK,
+    KEY_REPETITIVE_HIDDEN_TASK,
+    KEY_REPETITIVE_TASK,
+    KEY_TASKS,
+    CalendarData,
+)
+from flask_calendar.storage import (
+    KEY_JOURNAL_SEQUENCE,
+    IndexedCalendarStorage,
+    JsonStorage,
+    NormalTaskEntry,
+    append_line,
+    write_atomically,
+    write_temporary_file,
+)
+
+OPERATION_ADD_TASKS = "add_tasks"
+OPERATION_DELETE_TASK = "delete_task"
+OPERATION_UPDATE_TASK_DAY = "update_task_day"
+OPERATION_HIDE_REPETITION_TASK_INSTANCE = "hide_repetition_task_instance"
+
+DEFAULT_COMPACTION_THRESHOLD_BYTES = 256 * 1024
+
+NO_FILE_STAMP = (0, 0, 0)
+
+
+class JournaledJsonStorage(JsonStorage, IndexedCalendarStorage):
+    """
+    JSON snapshot per calendar plus an append-only `<calendar_id>.journal` file with one JSON record per change, so
+    writes cost the size of the change instead of the size of the calendar. Loading replays the journal over the
+    snapshot, and once the journal grows over `compaction_threshold_bytes` a background thread folds it into a new
+    snapshot.
+
+    Records carry an increasing sequence number and snapshots store the last one folded into them, so records left in
+    the journal by an interrupted compaction are skipped instead of applied twice.
+    Appends and file replacements happen under the calendar lock, so several processes can share the data folder.
+    """
+
+    def __init__(self, data_folder: str, compaction_threshold_bytes: int = DEFAULT_COMPACTION_THRESHOLD_BYTES) -> None:
+        super().__init__(data_folder)
+        self.compaction_threshold_bytes = compaction_threshold_bytes
+        self._compaction_locks = {}  # type: Dict[str, threading.Lock]
+        self._locks_lock = threading.Lock()
+
+    def load(self, calendar_id: str, use_cache: bool = True) -> Dict:
+        journal_path = self.journal_path(calendar_id)
+        with self._lock(calendar_id):
+            snapshot_file = open(self.path(calendar_id), "rb")
+            journal_file = open(journal_path) if os.path.exists(journal_path) else None
+        try:
+            stamp = self._stamp(snapshot_file, journal_file)
+            if use_cache:
+                cached = cache.get(journal_path, stamp)
+                if cached is not None:
+                    return cast(Dict, cached)
+            data = decode_calendar(snapshot_file.read())
+            journal = journal_file.read() if journal_file is not None else ""
+        finally:
+            snapshot_file.close()
+            if journal_file is not None:
+                journal_file.close()
+
+        # only complete lines, a crash while appending can leave the last one cut
+        for line in journal.split("\n")[:-1]:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # cut by a crash before `append_line` dropped cut lines
+                continue
+            if record["seq"] > data.get(KEY_JOURNAL_SEQUENCE, 0):
+                self._apply(data, record)
+
+        if use_cache:
+            cache.put(journal_path, stamp, data)
+        return data
+
+    def _write(self, calendar_id: str, data: Dict) -> None:
+        # Whole calendar replaced, so previous changes are no longer needed. Called with the calendar lock held.
+        # If interrupted before removing the journal, its records are skipped as `data` has their sequence numbers.
+        # Not through `JsonStorage._write`, calendars are only cached under their journal path.
+        write_atomically(self.path(calendar_id), encode_calendar(data))
+        journal_path = self.journal_path(calendar_id)
+        if os.path.exists(journal_path):
+            os.remove(journal_path)
+        cache.put(journal_path, self._stamp_from_paths(calendar_id), data)
+
+    def add_tasks(
+        self, calendar_id: str, normal_tasks: Sequence[NormalTaskEntry], repetitive_tasks: Sequence[Task]
+    ) -> None:
+        self._append(
+            calendar_id, OPERATION_ADD_TASKS, [[list(entry) for entry in normal_tasks], list(repetitive_tasks)]
+        )
+
+    def delete_task(self, calendar_id: str, year_str: str, month_str: str, day_str: str, task_id: int) -> None:
+        self._append(calendar_id, OPERATION_DELETE_TASK, [year_str, month_str, day_str, task_id])
+
+    def update_task_day(
+        self, calendar_id: str, year_str: str, month_str: str, day_str: str, task_id: int, new_day_str: str
+    ) -> None:
+        self._append(calendar_id, OPERATION_UPDATE_TASK_DAY, [year_str, month_str, day_str, task_id, new_day_str])
+
+    def hide_repetition_task_instance(
+        self, calendar_id: str, year_str: str, month_str: str, day_str: str, task_id_str: str
+    ) -> None:
+        self._append(calendar_id, OPERATION_HIDE_REPETITION_TASK_INSTANCE, [year_str, month_str, day_str, task_id_str])
+
+    def compact(self, calendar_id: str) -> None:
+        with self._compaction_lock(calendar_id):
+            self._compact(calendar_id)
+
+    def journal_path(self, calendar_id: str) -> str:
+        return os.path.join(".", self.data_folder, "{}.journal".format(calendar_id))
+
+    def _compact(self, calendar_id: str) -> None:
+        journal_path = self.journal_path(calendar_id)
+        with self._lock(calendar_id):
+            if not os.path.exists(journal_path):
+                return
+            data = self.load(calendar_id)
+            folded_journal = os.stat(journal_path)
+
+        # Slowest part, done without the lock so changes keep being appended meanwhile
+        snapshot_path, _ = write_temporary_file(self.path(calendar_id), encode_calendar(data))
+
+        with self._lock(calendar_id):
+            if not os.path.exists(journal_path) or os.stat(journal_path).st_ino != folded_journal.st_ino:
+                # another process compacted or saved the whole calendar meanwhile
+                os.remove(snapshot_path)
+                return
+            os.replace(snapshot_path, self.path(calendar_id))
+            with open(journal_path, "rb") as journal_file:
+                journal_file.seek(folded_journal.st_size)
+                pending_changes = journal_file.read()
+            write_atomically(journal_path, pending_changes)
+            if pending_changes:
+                cache.invalidate(journal_path)
+            else:
+                cache.put(journal_path, self._stamp_from_paths(calendar_id), data)
+
+    def _append(self, calendar_id: str, operation: str, arguments: List) -> None:
+        journal_path = self.journal_path(calendar_id)
+        with self._lock(calendar_id):
+            data = self.load(calendar_id)
+            record = {"seq": data.get(KEY_JOURNAL_SEQUENCE, 0) + 1, "op": operation, "args": arguments}
+
+            # Applied first to a copy of the cached calendar: invalid changes fail before being written, and the
+            # cache stays up to date without reading the calendar again
+            updated_data = self._copy_for_change(data, operation, arguments)
+            self._apply(updated_data, record)
+
+            append_line(journal_path, encode_json(record) + b"\n")
+            cache.put(journal_path, self._stamp_from_paths(calendar_id), updated_data)
+            journal_size = os.path.getsize(journal_path)
+
+        if journal_size > self.compaction_threshold_bytes:
+            self._compact_in_background(calendar_id)
+
+    @staticmethod
+    def _apply(data: Dict, record: Dict) -> None:
+        operation, arguments = record["op"], record["args"]
+        if operation == OPERATION_ADD_TASKS:
+            normal_tasks = [(year, month, day, to_task(task)) for year, month, day, task in arguments[0]]
+            CalendarData.add_tasks_to_data(data, normal_tasks, [to_task(task) for task in arguments[1]])
+        elif operation == OPERATION_DELETE_TASK:
+            CalendarData.delete_task_from_data(data, *arguments)
+        elif operation == OPERATION_UPDATE_TASK_DAY:
+            CalendarData.update_task_day_in_data(data, *arguments)
+        elif operation == OPERATION_HIDE_REPETITION_TASK_INSTANCE:
+            CalendarData.hide_repetition_task_instance_in_data(data, *arguments)
+        else:
+            raise ValueError("Unknown journal operation '{}'".format(operation))
+        data[KEY_JOURNAL_SEQUENCE] = record["seq"]
+
+    @staticmethod
+    def _copy_for_change(data: Dict, operation: str, arguments: List) -> Dict:
+        # Cached calendars are shared, so only copy the containers the change is going to modify
+        updated_data = dict(data)
+        tasks = updated_data[KEY_TASKS] = dict(data[KEY_TASKS])
+        tasks[KEY_REPETITIVE_TASK] = list(tasks[KEY_REPETITIVE_TASK])
+        normal_tasks = tasks[KEY_NORMAL_TASK] = dict(tasks[KEY_NORMAL_TASK])
+        # hiding replaces the bitmaps of the task instead of modifying them
+        tasks[KEY_REPETITIVE_HIDDEN_TASK] = dict(tasks[KEY_REPETITIVE_HIDDEN_TASK])
+
+        months = []  # type: List[Tuple[str, str]]
+        if operation == OPERATION_ADD_TASKS:
+            months = [(str(entry[0]), str(entry[1])) for entry in arguments[0]]
+        elif operation in (OPERATION_DELETE_TASK, OPERATION_UPDATE_TASK_DAY):
+            months = [(arguments[0], arguments[1])]
+
+        for year_str, month_str in set(months):
+            if year_str in normal_tasks:
+                normal_tasks[year_str] = dict(normal_tasks[year_str])
+                if month_str in normal_tasks[year_str]:
+                    normal_tasks[year_str][month_str] = {
+                        day_str: list(day_tasks) for day_str, day_tasks in normal_tasks[year_str][month_str].items()
+                    }
+        return updated_data
+
+    def _compact_in_background(self, calendar_id: str) -> None:
+        compaction_lock = self._compaction_lock(calendar_id)
+        # if already compacting, that compaction or the next change will take care of it
+        if not compaction_lock.acquire(blocking=False):
+            return
+
+        def compact() -> None:
+            try:
+                self._compact(calendar_id)
+            finally:
+                compaction_lock.release()
+
+        threading.Thread(target=compact, daemon=True).start()
+
+    def _lock(self, calendar_id: str) -> ContextManager[None]:
+        return self.locks.hold(calendar_id)
+
+    def _compaction_lock(self, calendar_id: str) -> threading.Lock:
+        with self._locks_lock:
+            if calendar_id not in self._compaction_locks:
+                self._compaction_locks[calendar_id] = threading.Lock()
+            return self._compaction_locks[calendar_id]
+
+    def _stamp_from_paths(self, calendar_id: str) -> FileStamp:
+        journal_path = self.journal_path(calendar_id)
+        return file_stamp(os.stat(self.path(calendar_id))) + (
+            file_stamp(os.stat(journal_path)) if os.path.exists(journal_path) else NO_FILE_STAMP
+        )
+
+    @staticmethod
+    def _stamp(snapshot_file: IO, journal_file: Optional[IO]) -> FileStamp:
+        return file_stamp(os.fstat(snapshot_file.fileno())) + (
+            file_stamp(os.fstat(journal_file.fileno())) if journal_file is not None else NO_FILE_STAMP
+        )
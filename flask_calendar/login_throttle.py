@@ -0,0 +1,204 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Mapping, Optional, Tuple
+
+from cachelib.simple import SimpleCache
+from flask_calendar.session_store import SESSION_STORE_FILESYSTEM, SESSION_STORE_MEMORY, SESSION_STORE_SQLITE
+from flask_calendar.storage import write_atomically
+
+# failed logins are forgotten after this many seconds without new ones
+FAILED_LOGINS_TIMEOUT = 7200  # 2h
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS failed_logins (
+    key TEXT PRIMARY KEY,
+    attempts INTEGER NOT NULL,
+    blocked_until REAL NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS failed_logins_by_expiration ON failed_logins (expires_at);
+"""
+
+# (failed attempts, timestamp until which new login attempts are rejected)
+FailedLogins = Tuple[int, float]
+
+
+class FailedLoginsStore:
+    def get(self, key: str) -> Optional[FailedLogins]:
+        raise NotImplementedError()
+
+    def set(self, key: str, failed_logins: FailedLogins) -> None:
+        raise NotImplementedError()
+
+    def remove(self, key: str) -> None:
+        raise NotImplementedError()
+
+    def sweep_expired(self) -> int:
+        raise NotImplementedError()
+
+
+class LoginThrottle:
+    """
+    After each failed login, rejects further attempts for the same username and from the same client IP during
+    `delay_base ^ attempts` seconds. Instead of making the worker sleep, requests are rejected up front, so an attacker
+    can't keep workers busy.
+    """
+
+    def __init__(self, store: FailedLoginsStore, delay_base: int) -> None:
+        self.store = store
+        self.delay_base = delay_base
+
+    def retry_after(self, username: str, client_ip: str) -> int:
+        """
+        Seconds until a login attempt is allowed again, 0 if allowed now.
+        """
+        now = time.time()
+        blocked_until = max(
+            [
+                failed_logins[1]
+                for failed_logins in self._failed_logins(username, client_ip)
+                if failed_logins is not None
+            ]
+            + [now]
+        )
+        return int(blocked_until - now + 0.999)
+
+    def failed_attempt(self, username: str, client_ip: str) -> None:
+        now = time.time()
+        for key, failed_logins in zip(self._keys(username, client_ip), self._failed_logins(username, client_ip)):
+            attempts = 0 if failed_logins is None else failed_logins[0] + 1
+            self.store.set(key, (attempts, now + self.delay_base**attempts))
+
+    def successful_attempt(self, username: str) -> None:
+        # other usernames might still be under attack from the same IP, so that one is kept
+        self.store.remove(self._keys(username, "")[0])
+
+    @staticmethod
+    def _keys(username: str, client_ip: str) -> Tuple[str, str]:
+        return "LF_{}".format(username), "LF_IP_{}".format(client_ip)
+
+    def _failed_logins(self, username: str, client_ip: str) -> Tuple[Optional[FailedLogins], ...]:
+        return tuple(self.store.get(key) for key in self._keys(username, client_ip))
+
+
+class MemoryFailedLoginsStore(FailedLoginsStore):
+    def __init__(self) -> None:
+        self._cache = SimpleCache()
+
+    def get(self, key: str) -> Optional[FailedLogins]:
+        return self._cache.get(key)  # type: ignore
+
+    def set(self, key: str, failed_logins: FailedLogins) -> None:
+        self._cache.set(key, failed_logins, timeout=FAILED_LOGINS_TIMEOUT)
+
+    def remove(self, key: str) -> None:
+        self._cache.delete(key)
+
+    def sweep_expired(self) -> int:
+        # SimpleCache already drops expired entries when it grows over its threshold
+        return 0
+
+
+class FileSystemFailedLoginsStore(FailedLoginsStore):
+    def __init__(self, folder: str) -> None:
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+
+    def get(self, key: str) -> Optional[FailedLogins]:
+        try:
+            with open(self._path(key)) as file:
+                attempts, blocked_until, expires_at = json.load(file)
+        except (FileNotFoundError, ValueError):
+            return None
+        if expires_at <= time.time():
+            return None
+        return attempts, blocked_until
+
+    def set(self, key: str, failed_logins: FailedLogins) -> None:
+        contents = json.dumps([failed_logins[0], failed_logins[1], time.time() + FAILED_LOGINS_TIMEOUT])
+        write_atomically(self._path(key), contents.encode("UTF-8"))
+
+    def remove(self, key: str) -> None:
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def sweep_expired(self) -> int:
+        now = time.time()
+        removed = 0
+        for filename in os.listdir(self.folder):
+            if not filename.endswith(".json"):
+                continue
+            path = os.path.join(self.folder, filename)
+            try:
+                with open(path) as file:
+                    expires_at = json.load(file)[2]
+                if expires_at <= now:
+                    os.remove(path)
+                    removed += 1
+            except (FileNotFoundError, ValueError):
+                # removed meanwhile by another process
+                continue
+        return removed
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.folder, "{}.json".format(hashlib.sha256(key.encode("UTF-8")).hexdigest()))
+
+
+class SqliteFailedLoginsStore(FailedLoginsStore):
+    def __init__(self, database_path: str) -> None:
+        self.database_path = database_path
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.executescript(SQLITE_SCHEMA)
+
+    def get(self, key: str) -> Optional[FailedLogins]:
+        cursor = self._connection().execute(
+            "SELECT attempts, blocked_until FROM failed_logins WHERE key = ? AND expires_at > ?", (key, time.time())
+        )
+        row = cursor.fetchone()
+        return None if row is None else (int(row[0]), float(row[1]))
+
+    def set(self, key: str, failed_logins: FailedLogins) -> None:
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO failed_logins (key, attempts, blocked_until, expires_at) VALUES (?, ?, ?, ?)",
+                (key, failed_logins[0], failed_logins[1], time.time() + FAILED_LOGINS_TIMEOUT),
+            )
+
+    def remove(self, key: str) -> None:
+        with self._connection() as connection:
+            connection.execute("DELETE FROM failed_logins WHERE key = ?", (key,))
+
+    def sweep_expired(self) -> int:
+        with self._connection() as connection:
+            return connection.execute("DELETE FROM failed_logins WHERE expires_at <= ?", (time.time(),)).rowcount
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared between threads
+        connection = getattr(self._local, "connection", None)  # type: Optional[sqlite3.Connection]
+        if connection is None:
+            connection = sqlite3.connect(self.database_path, timeout=10)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+
+def create_login_throttle(config: Mapping) -> LoginThrottle:
+    # kept in the same place as the sessions, so it's shared by the same processes
+    backend = config.get("SESSION_STORE", SESSION_STORE_MEMORY)
+    store = None  # type: Optional[FailedLoginsStore]
+    if backend == SESSION_STORE_MEMORY:
+        store = MemoryFailedLoginsStore()
+    elif backend == SESSION_STORE_FILESYSTEM:
+        store = FileSystemFailedLoginsStore(folder=os.path.join(config["SESSIONS_FOLDER"], "failed_logins"))
+    elif backend == SESSION_STORE_SQLITE:
+        store = SqliteFailedLoginsStore(database_path=config["SESSIONS_DATABASE_PATH"])
+    else:
+        raise ValueError("Unknown session store '{}'".format(backend))
+    return LoginThrottle(store, delay_base=config["FAILED_LOGIN_DELAY_BASE"])
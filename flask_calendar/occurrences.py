@@ -0,0 +1,226 @@
+from datetime import date
+from typing import Dict, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from flask_calendar.calendar_schema import NormalTasks, Task
+from flask_calendar.hidden_repetitions import DAY_SLOTS_PER_MONTH, MONTHS_IN_YEAR, decode_bitmap
+from flask_calendar.recurrence import (
+    DAYS_IN_WEEK,
+    REPETITION_SUBTYPE_WEEK_DAY,
+    REPETITION_TYPE_MONTHLY,
+    REPETITION_TYPE_WEEKLY,
+    is_bounded,
+    rule_window,
+)
+
+# days are numbered like `date.toordinal()` does, 1 being 0001-01-01 (a Monday)
+EPOCH_DAY_NUMBER = date(1970, 1, 1).toordinal()
+YEAR_SLOTS = MONTHS_IN_YEAR * DAY_SLOTS_PER_MONTH
+
+KIND_NORMAL = 0
+KIND_REPETITIVE = 1
+
+RULE_WEEKLY = "weekly"
+RULE_MONTHLY_BY_WEEK_DAY = "monthly_by_week_day"
+RULE_MONTHLY_BY_MONTH_DAY = "monthly_by_month_day"
+
+
+class Occurrences:
+    """
+    Task occurrences of a date range as parallel arrays, sorted by day and, within a day, as views list them: normal
+    tasks in calendar order followed by repetitive tasks in calendar order.
+    """
+
+    def __init__(self, tasks: Sequence[Task], days: np.ndarray, task_indexes: np.ndarray) -> None:
+        self.tasks = tasks
+        # day number of each occurrence and index in `tasks` of its task
+        self.days = days
+        self.task_indexes = task_indexes
+
+    def __len__(self) -> int:
+        return len(self.days)
+
+    def __iter__(self) -> Iterator[Tuple[date, Task]]:
+        for day_number, task_index in zip(self.days.tolist(), self.task_indexes.tolist()):
+            yield date.fromordinal(day_number), self.tasks[task_index]
+
+    def tasks_by_month(self) -> Dict[str, Dict[str, List[Task]]]:
+        """
+        {month_str: {day_str: [task, ...]}}, the `tasks` views render. Months of different years are not told apart,
+        so the range should span less than a year.
+        """
+        tasks = {}  # type: Dict[str, Dict[str, List[Task]]]
+        for day, task in self:
+            tasks.setdefault(str(day.month), {}).setdefault(str(day.day), []).append(task)
+        return tasks
+
+
+def occurrences_between(
+    normal_tasks: NormalTasks,
+    repetitive_tasks: Sequence[Task],
+    hidden_repetitions: Mapping,
+    start: date,
+    end: date,
+    first_weekday: int,
+) -> Occurrences:
+    """
+    Occurrences of all tasks from `start` to `end`, both included. Repetitive tasks are expanded for the whole range
+    at once: each kind of rule as a (rules x weeks or months) array of day numbers, masked by the rule bounds and
+    hidden instances.
+    """
+    start_number = start.toordinal()
+    end_number = end.toordinal()
+
+    normal_list = []  # type: List[Task]
+    normal_days = []  # type: List[int]
+    for year in range(start.year, end.year + 1):
+        for month_str, month_tasks in normal_tasks.get(str(year), {}).items():
+            for day_str, day_tasks in month_tasks.items():
+                day_number = _day_number(year, int(month_str), int(day_str))
+                if day_number is not None and start_number <= day_number <= end_number:
+                    normal_list.extend(day_tasks)
+                    normal_days.extend([day_number] * len(day_tasks))
+
+    positions, repetitive_days = _repetitive_occurrences(
+        repetitive_tasks, hidden_repetitions, start, end, first_weekday
+    )
+
+    days = np.concatenate([np.array(normal_days, dtype=np.int64), repetitive_days])
+    kinds = np.concatenate(
+        [np.full(len(normal_days), KIND_NORMAL, dtype=np.int64), np.full(len(positions), KIND_REPETITIVE, np.int64)]
+    )
+    # repetitive tasks go after the normal ones in `tasks`, so indexes also keep the calendar order within a kind
+    task_indexes = np.concatenate([np.arange(len(normal_days), dtype=np.int64), positions + len(normal_list)])
+    order = np.lexsort((task_indexes, kinds, days))
+    return Occurrences(normal_list + list(repetitive_tasks), days[order], task_indexes[order])
+
+
+def _day_number(year: int, month: int, day: int) -> Optional[int]:
+    try:
+        return date(year, month, day).toordinal()
+    except ValueError:
+        return None
+
+
+def _repetitive_occurrences(
+    repetitive_tasks: Sequence[Task], hidden_repetitions: Mapping, start: date, end: date, first_weekday: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (positions of the tasks, day numbers) of every occurrence of the repetitive tasks, unsorted.
+    """
+    start_number = start.toordinal()
+    end_number = end.toordinal()
+
+    # (position, repetition value, first day number, last day number) by kind of rule
+    rules = {
+        RULE_WEEKLY: [],
+        RULE_MONTHLY_BY_WEEK_DAY: [],
+        RULE_MONTHLY_BY_MONTH_DAY: [],
+    }  # type: Dict[str, List[Tuple[int, int, int, int]]]
+    for position, task in enumerate(repetitive_tasks):
+        first, last = start_number, end_number
+        if is_bounded(task):
+            window = rule_window(task, first_weekday)
+            if window is None:
+                continue
+            first, last = max(first, window[0].toordinal()), min(last, window[1].toordinal())
+        if task["repetition_type"] == REPETITION_TYPE_WEEKLY:
+            kind = RULE_WEEKLY
+        elif task["repetition_type"] != REPETITION_TYPE_MONTHLY:
+            continue
+        elif task["repetition_subtype"] == REPETITION_SUBTYPE_WEEK_DAY:
+            kind = RULE_MONTHLY_BY_WEEK_DAY
+        else:
+            kind = RULE_MONTHLY_BY_MONTH_DAY
+        rules[kind].append((position, task["repetition_value"], first, last))
+
+    # every month the range touches: day number of its 1st, its length and the weekday column of its 1st
+    month_bounds = np.arange(np.datetime64(start, "M"), np.datetime64(end, "M") + 2).astype("datetime64[D]")
+    month_starts = month_bounds[:-1].astype(np.int64) + EPOCH_DAY_NUMBER
+    month_lengths = np.diff(month_bounds.astype(np.int64))
+    month_columns = (month_starts - 1 - first_weekday) % DAYS_IN_WEEK
+
+    all_positions = []  # type: List[np.ndarray]
+    all_days = []  # type: List[np.ndarray]
+    all_monthly = []  # type: List[np.ndarray]
+    for kind, kind_rules in rules.items():
+        if not kind_rules:
+            continue
+        positions, values, firsts, lasts = (column[:, None] for column in np.array(kind_rules, dtype=np.int64).T)
+        if kind == RULE_WEEKLY:
+            # first day of the range in the weekday column of each rule, then every week
+            first_days = start_number + (values + first_weekday - (start_number - 1)) % DAYS_IN_WEEK
+            days = first_days + DAYS_IN_WEEK * np.arange((end_number - start_number) // DAYS_IN_WEEK + 1)
+            valid = (values >= 0) & (values < DAYS_IN_WEEK)
+        elif kind == RULE_MONTHLY_BY_WEEK_DAY:
+            # first day of each month in the weekday column of each rule
+            days = month_starts + (values - month_columns) % DAYS_IN_WEEK
+            valid = (values >= 0) & (values < DAYS_IN_WEEK)
+        else:
+            days = month_starts + values - 1
+            valid = (values >= 1) & (values <= month_lengths)
+        valid = valid & (days >= firsts) & (days <= lasts)
+        all_positions.append(np.broadcast_to(positions, days.shape)[valid])
+        all_days.append(days[valid])
+        all_monthly.append(np.full(np.count_nonzero(valid), kind != RULE_WEEKLY))
+
+    if not all_days:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    positions = np.concatenate(all_positions)
+    days = np.concatenate(all_days)
+    hidden = _hidden(
+        repetitive_tasks, hidden_repetitions, start.year, end.year, positions, days, np.concatenate(all_monthly)
+    )
+    return positions[~hidden], days[~hidden]
+
+
+def _hidden(
+    repetitive_tasks: Sequence[Task],
+    hidden_repetitions: Mapping,
+    first_year: int,
+    last_year: int,
+    positions: np.ndarray,
+    days: np.ndarray,
+    monthly: np.ndarray,
+) -> np.ndarray:
+    """
+    Whether each occurrence is hidden, looking it up in the unpacked bitmaps of the tasks with hidden instances:
+    weekly occurrences by their day bit, monthly ones by any bit of their month.
+    """
+    # row in `bits` of each task, -1 if none of its instances in the range are hidden
+    rows = np.full(len(repetitive_tasks), -1, dtype=np.int64)
+    year_bits = []  # type: List[np.ndarray]
+    for position, task in enumerate(repetitive_tasks):
+        years = hidden_repetitions.get(str(task["id"]))
+        if not years or not any(str(year) in years for year in range(first_year, last_year + 1)):
+            continue
+        rows[position] = len(year_bits)
+        year_bits.append(np.stack([_unpack(years.get(str(year))) for year in range(first_year, last_year + 1)]))
+
+    hidden = np.zeros(len(days), dtype=bool)
+    if not year_bits:
+        return hidden
+    # (task, year, slot) and (task, year, month)
+    bits = np.stack(year_bits)
+    month_bits = np.logical_or.reduce(bits.reshape(bits.shape[:2] + (MONTHS_IN_YEAR, DAY_SLOTS_PER_MONTH)), axis=3)
+
+    candidates = np.flatnonzero(rows[positions] >= 0)
+    candidate_rows = rows[positions[candidates]]
+    dates = (days[candidates] - EPOCH_DAY_NUMBER).astype("datetime64[D]")
+    months = dates.astype("datetime64[M]")
+    years = months.astype(np.int64) // MONTHS_IN_YEAR + 1970 - first_year
+    month_indexes = months.astype(np.int64) % MONTHS_IN_YEAR
+    day_indexes = (dates - months.astype("datetime64[D]")).astype(np.int64)
+    hidden[candidates] = np.where(
+        monthly[candidates],
+        month_bits[candidate_rows, years, month_indexes],
+        bits[candidate_rows, years, month_indexes * DAY_SLOTS_PER_MONTH + day_indexes],
+    )
+    return hidden
+
+
+def _unpack(encoded: Optional[str]) -> np.ndarray:
+    bitmap = 0 if encoded is None else decode_bitmap(encoded)
+    packed = np.frombuffer(bitmap.to_bytes((YEAR_SLOTS + 7) // 8, "little"), dtype=np.uint8)
+    return np.asarray(np.unpackbits(packed, bitorder="little"))[:YEAR_SLOTS].astype(bool)
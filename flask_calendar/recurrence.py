@@ -0,0 +1,268 @@
+import calendar
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import date
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+from flask_calendar.calendar_schema import Task
+from flask_calendar.hidden_repetitions import day_bit, month_mask, year_bitmap
+
+REPETITION_TYPE_WEEKLY = "w"
+REPETITION_TYPE_MONTHLY = "m"
+REPETITION_SUBTYPE_WEEK_DAY = "w"
+REPETITION_SUBTYPE_MONTH_DAY = "m"
+
+DAYS_IN_WEEK = 7
+MONTHS_IN_YEAR = 12
+# highest `count` of a task, finding its last occurrence walks that many weeks or months
+MAX_COUNT = 10000
+
+# (position of the task in the calendar's repetitive tasks, task)
+IndexedTask = Tuple[int, Task]
+# first and last day a rule can happen on
+Window = Tuple[date, date]
+
+
+def parse_date(value: str) -> date:
+    """
+    Dates of rule bounds are stored as `YYYY-MM-DD`, like the date inputs of the task form send them.
+    """
+    return date.fromisoformat(value)
+
+
+def is_bounded(task: Task) -> bool:
+    return any(task.get(field) is not None for field in ("starts_on", "until", "count"))
+
+
+class RuleBuckets:
+    """
+    Repetitive tasks grouped by where they fall, so expanding a month only visits the days and tasks that produce an
+    occurrence instead of every task for every day:
+    - weekly tasks by weekday column (their `repetition_value`, counted from the first weekday of the calendar)
+    - monthly tasks by week day by the same column, they only happen on the first such day of the month
+    - monthly tasks by month day by day number
+    """
+
+    def __init__(self, indexed_tasks: Iterable[IndexedTask] = ()) -> None:
+        self.weekly = [[] for _ in range(DAYS_IN_WEEK)]  # type: List[List[IndexedTask]]
+        self.monthly_by_week_day = [[] for _ in range(DAYS_IN_WEEK)]  # type: List[List[IndexedTask]]
+        self.monthly_by_month_day = {}  # type: Dict[int, List[IndexedTask]]
+        for indexed_task in indexed_tasks:
+            self.add(indexed_task)
+
+    def add(self, indexed_task: IndexedTask) -> None:
+        task = indexed_task[1]
+        value = task["repetition_value"]
+        if task["repetition_type"] == REPETITION_TYPE_WEEKLY:
+            if value in range(DAYS_IN_WEEK):
+                self.weekly[value].append(indexed_task)
+        elif task["repetition_type"] == REPETITION_TYPE_MONTHLY:
+            if task["repetition_subtype"] == REPETITION_SUBTYPE_WEEK_DAY:
+                if value in range(DAYS_IN_WEEK):
+                    self.monthly_by_week_day[value].append(indexed_task)
+            else:
+                self.monthly_by_month_day.setdefault(value, []).append(indexed_task)
+
+    def month_days(self, year: int, month: int, first_weekday: int) -> Iterator[Tuple[int, IndexedTask, bool]]:
+        """
+        (day, task, whether it is a monthly task) for every day of the month a task falls on, ignoring bounds and
+        hidden instances.
+        """
+        month_first_weekday, days_in_month = calendar.monthrange(year, month)
+        # weekday column (as in `monthdayscalendar`) of the 1st of the month
+        first_day_column = (month_first_weekday - first_weekday) % DAYS_IN_WEEK
+
+        for column in range(DAYS_IN_WEEK):
+            first_day = 1 + (column - first_day_column) % DAYS_IN_WEEK
+            for indexed_task in self.weekly[column]:
+                for day in range(first_day, days_in_month + 1, DAYS_IN_WEEK):
+                    yield day, indexed_task, False
+            for indexed_task in self.monthly_by_week_day[column]:
+                yield first_day, indexed_task, True
+
+        for day, day_tasks in self.monthly_by_month_day.items():
+            if 1 <= day <= days_in_month:
+                for indexed_task in day_tasks:
+                    yield day, indexed_task, True
+
+
+def rule_window(task: Task, first_weekday: int) -> Optional[Window]:
+    """
+    Days between which the task can happen, or None if it never does. `count` is counted from `starts_on` (and
+    ignored without it), including hidden instances. Counts reaching past `date.max` leave the window open.
+    """
+    starts_on = task.get("starts_on")
+    until = task.get("until")
+    first = parse_date(starts_on) if starts_on is not None else date.min
+    last = parse_date(until) if until is not None else date.max
+    count = task.get("count")
+    if count is not None and starts_on is not None:
+        nth_occurrence = _nth_occurrence(task, first, count, first_weekday)
+        if nth_occurrence is None:
+            return None
+        last = min(last, nth_occurrence)
+    return (first, last) if first <= last else None
+
+
+def first_occurrence(task: Task, first: date, first_weekday: int) -> Optional[date]:
+    """
+    First day on or after `first` the task falls on, ignoring bounds and hidden instances.
+    """
+    return _nth_occurrence(task, first, 1, first_weekday)
+
+
+def _nth_occurrence(task: Task, first: date, count: int, first_weekday: int) -> Optional[date]:
+    buckets = RuleBuckets([(0, task)])
+    year, month = first.year, first.month
+    # every rule happens at least once in any two consecutive months, so if it does at all this finds it
+    for _ in range(2 * count + 1):
+        if year > date.max.year:
+            return date.max
+        for day in sorted(day for day, _, _ in buckets.month_days(year, month, first_weekday)):
+            if date(year, month, day) >= first:
+                count -= 1
+                if count == 0:
+                    return date(year, month, day)
+        year, month = (year + 1, 1) if month == MONTHS_IN_YEAR else (year, month + 1)
+    return None
+
+
+class RuleWindows:
+    """
+    Interval index of the bounded rules, sorted by the last day they can happen on: the rules that ended before a
+    month, which long-lived calendars accumulate, are skipped with a bisection instead of being checked one by one.
+    """
+
+    def __init__(self, rules: Iterable[Tuple[Window, IndexedTask]]) -> None:
+        self._rules = sorted(rules, key=lambda rule: rule[0][1])
+        self._lasts = [window[1] for window, _ in self._rules]
+
+    def active(self, first: date, last: date) -> List[Tuple[Window, IndexedTask]]:
+        return [rule for rule in self._rules[bisect_left(self._lasts, first) :] if rule[0][0] <= last]
+
+
+class RecurrenceIndex:
+    """
+    Repetitive tasks of a calendar indexed (see `RuleBuckets`) so expanding a month only visits the days and tasks
+    that produce an occurrence. Tasks with `starts_on`/`until`/`count` bounds are only bucketed for the months they
+    are active in, found through `RuleWindows`.
+
+    Produces the same occurrences, in the same order, as checking each task against each day of `monthdayscalendar`.
+    """
+
+    def __init__(self, repetitive_tasks: Sequence[Task], hidden_repetitions: Mapping) -> None:
+        self.hidden_repetitions = hidden_repetitions
+        self._year_bitmaps = {}  # type: Dict[Tuple[int, str], int]
+        self.unbounded = RuleBuckets()
+        self.bounded = []  # type: List[IndexedTask]
+        # windows of `count` bounded rules depend on the first weekday, as weekday columns do
+        self._windows = {}  # type: Dict[int, RuleWindows]
+
+        for indexed_task in enumerate(repetitive_tasks):
+            if is_bounded(indexed_task[1]):
+                self.bounded.append(indexed_task)
+            else:
+                self.unbounded.add(indexed_task)
+
+    def month_tasks(self, year: int, month: int, first_weekday: int) -> Dict[str, List[Task]]:
+        """
+        Occurrences of the repetitive tasks in a month, as {day_str: [task, ...]}. Hidden instances are left out.
+        """
+        year_str = str(year)
+        first_bit = day_bit(month, 1)
+        month_bits = month_mask(month)
+        month_first = date(year, month, 1)
+        month_last = date(year, month, calendar.monthrange(year, month)[1])
+
+        occurrences = {}  # type: Dict[int, List[IndexedTask]]
+        for day, (position, task), monthly in self.unbounded.month_days(year, month, first_weekday):
+            hidden = self._year_bitmap(task, year_str)
+            if not (hidden & month_bits if monthly else hidden >> (first_bit + day - 1) & 1):
+                occurrences.setdefault(day, []).append((position, task))
+
+        active = self._rule_windows(first_weekday).active(month_first, month_last)
+        if active:
+            windows = {position: window for window, (position, _) in active}
+            buckets = RuleBuckets(indexed_task for _, indexed_task in active)
+            for day, (position, task), monthly in buckets.month_days(year, month, first_weekday):
+                first, last = windows[position]
+                hidden = self._year_bitmap(task, year_str)
+                if first <= date(year, month, day) <= last and not (
+                    hidden & month_bits if monthly else hidden >> (first_bit + day - 1) & 1
+                ):
+                    occurrences.setdefault(day, []).append((position, task))
+
+        return {
+            str(day): [task for _, task in sorted(day_tasks, key=lambda indexed_task: indexed_task[0])]
+            for day, day_tasks in sorted(occurrences.items())
+        }
+
+    def _rule_windows(self, first_weekday: int) -> RuleWindows:
+        if first_weekday not in self._windows:
+            rules = []  # type: List[Tuple[Window, IndexedTask]]
+            for indexed_task in self.bounded:
+                window = rule_window(indexed_task[1], first_weekday)
+                if window is not None:
+                    rules.append((window, indexed_task))
+            self._windows[first_weekday] = RuleWindows(rules)
+        return self._windows[first_weekday]
+
+    def _year_bitmap(self, task: Task, year_str: str) -> int:
+        # decoded once per task and year, then each check is a single bit operation
+        key = (task["id"], year_str)
+        if key not in self._year_bitmaps:
+            self._year_bitmaps[key] = year_bitmap(self.hidden_repetitions, str(task["id"]), year_str)
+        return self._year_bitmaps[key]
+
+
+DEFAULT_MAX_ENTRIES = 4096
+
+# (calendar id, calendar version, journal sequence, year, month, first weekday)
+ExpansionKey = Tuple[str, int, int, int, int, int]
+
+
+class RecurrenceCache:
+    """
+    Process-wide LRU of month expansions of repetitive tasks. Keyed by the calendar version (and journal sequence
+    for journaled calendars), which storages increase whenever repetitive tasks or hidden instances change, so
+    entries of previous versions are never served; they just age out. Changes done by this process also drop the
+    entries of their calendar right away.
+    Expansions are shared between requests, so callers must not mutate what `get` returns.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES) -> None:
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # type: OrderedDict[ExpansionKey, Dict[str, List[Task]]]
+        self._lock = threading.Lock()
+
+    def get(self, key: ExpansionKey) -> Optional[Dict[str, List[Task]]]:
+        with self._lock:
+            month_tasks = self._entries.get(key)
+            if month_tasks is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return month_tasks
+
+    def put(self, key: ExpansionKey, month_tasks: Dict[str, List[Task]]) -> None:
+        with self._lock:
+            self._entries[key] = month_tasks
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, calendar_id: str) -> None:
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == calendar_id]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+cache = RecurrenceCache()
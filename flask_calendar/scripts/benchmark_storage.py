@@ -0,0 +1,133 @@
+"""
+Compares the JSON and SQLite storages on a generated calendar: reading the tasks of a month and the write actions.
+
+Usage (from the project root): python -m flask_calendar.scripts.benchmark_storage [number_of_tasks]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Callable, Dict
+
+from flask import Flask
+
+from flask_calendar.calendar_cache import cache
+from flask_calendar.calendar_data import CalendarData
+from flask_calendar.gregorian_calendar import GregorianCalendar
+from flask_calendar.sqlite_storage import SqliteStorage
+from flask_calendar.storage import JsonStorage
+
+CALENDAR_ID = "benchmark"
+ROUNDS = 10
+
+
+def generate_calendar(number_of_tasks: int) -> Dict:
+    normal = {}  # type: Dict
+    for task_id in range(number_of_tasks):
+        year, month, day = str(random.randint(2017, 2030)), str(random.randint(1, 12)), str(random.randint(1, 28))
+        normal.setdefault(year, {}).setdefault(month, {}).setdefault(day, []).append(
+            {
+                "id": task_id,
+                "color": "#7bd188",
+                "start_time": "10:00",
+                "end_time": "11:00",
+                "is_all_day": False,
+                "title": "Task {}".format(task_id),
+                "details": "Some details of task {}".format(task_id),
+                "travel_to": None,
+            }
+        )
+    repetition = [
+        {
+            "id": number_of_tasks + index,
+            "color": "#a0c0ea",
+            "start_time": "00:00",
+            "end_time": "00:00",
+            "is_all_day": True,
+            "title": "Weekly {}".format(index),
+            "details": "&nbsp;",
+            "travel_to": None,
+            "repetition_type": "w",
+            "repetition_subtype": "w",
+            "repetition_value": index % 7,
+        }
+        for index in range(20)
+    ]
+    return {"users": ["a_username"], "tasks": {"normal": normal, "repetition": repetition, "hidden_repetition": {}}}
+
+
+def timed(description: str, action: Callable[[int], None]) -> None:
+    start = time.perf_counter()
+    for round_number in range(ROUNDS):
+        action(round_number)
+    print("  {:<24} {:8.2f} ms".format(description, (time.perf_counter() - start) * 1000 / ROUNDS))
+
+
+def benchmark(calendar_data: CalendarData) -> None:
+    def read_month(round_number: int) -> None:
+        data = calendar_data.load_calendar(CALENDAR_ID)
+        tasks = calendar_data.tasks_from_calendar(GregorianCalendar.month_days(2024, 1 + round_number % 12), data)
+        calendar_data.add_repetitive_tasks_from_calendar(
+            GregorianCalendar.month_days(2024, 1 + round_number % 12), data, tasks
+        )
+
+    def create(round_number: int) -> None:
+        calendar_data.create_task(
+            calendar_id=CALENDAR_ID,
+            year=2024,
+            month=1,
+            day=1 + round_number,
+            title="New task",
+            is_all_day=True,
+            start_time="00:00",
+            details="",
+            color="#7bd188",
+            has_repetition=False,
+            repetition_type=None,
+            repetition_subtype=None,
+            repetition_value=0,
+        )
+
+    def created_task_id(day_str: str) -> int:
+        day_tasks = calendar_data.load_calendar(CALENDAR_ID)["tasks"]["normal"]["2024"]["1"][day_str]
+        return int([task["id"] for task in day_tasks if task["title"] == "New task"][0])
+
+    def move(round_number: int) -> None:
+        day_str = str(1 + round_number)
+        calendar_data.update_task_day(CALENDAR_ID, "2024", "1", day_str, created_task_id(day_str), "28")
+
+    def hide(round_number: int) -> None:
+        task_id = calendar_data.load_calendar(CALENDAR_ID)["tasks"]["repetition"][0]["id"]
+        calendar_data.hide_repetition_task_instance(CALENDAR_ID, "2024", "2", str(1 + round_number), str(task_id))
+
+    def delete(round_number: int) -> None:
+        calendar_data.delete_task(CALENDAR_ID, "2024", "1", "28", created_task_id("28"))
+
+    def read_month_uncached(round_number: int) -> None:
+        cache.clear()
+        read_month(round_number)
+
+    timed("month view", read_month)
+    timed("month view (no cache)", read_month_uncached)
+    timed("create task", create)
+    timed("move task", move)
+    timed("hide repetition", hide)
+    timed("delete task", delete)
+
+
+if __name__ == "__main__":
+    number_of_tasks = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    calendar = generate_calendar(number_of_tasks)
+
+    with tempfile.TemporaryDirectory() as folder, Flask(__name__).app_context():
+        json_storage = JsonStorage(folder)
+        json_storage.save(CALENDAR_ID, calendar)
+        sqlite_storage = SqliteStorage(os.path.join(folder, "benchmark.sqlite"))
+        sqlite_storage.save(CALENDAR_ID, calendar)
+        print("File size: {} bytes".format(os.path.getsize(json_storage.path(CALENDAR_ID))))
+
+        for name, storage in (("json", json_storage), ("sqlite", sqlite_storage)):
+            print("{} storage, {} tasks:".format(name, number_of_tasks))
+            benchmark(CalendarData(folder, storage=storage))
@@ -0,0 +1,11 @@
+#!/bin/bash
+
+if [[ $# -eq 0 ]] ; then
+    echo 'Must pass as an argument the data folder'
+    exit 0
+fi
+DATA_FOLDER=$1
+
+python -m flask_calendar.scripts.json_to_sharded $DATA_FOLDER || exit 1
+
+echo 'Migration of json data complete. Set STORAGE_BACKEND = "sharded_json" in config.py to use the migrated calendars. Original json files are kept.'
@@ -0,0 +1,11 @@
+#!/bin/bash
+
+if [[ $# -eq 0 ]] ; then
+    echo 'Must pass as an argument the data folder'
+    exit 0
+fi
+DATA_FOLDER=$1
+
+python -m flask_calendar.scripts.hidden_repetitions_to_bitmaps $DATA_FOLDER || exit 1
+
+echo 'Migration of json data complete. Hidden repetitions are now stored as bitmaps.'
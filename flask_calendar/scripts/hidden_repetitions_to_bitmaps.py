@@ -0,0 +1,38 @@
+"""
+Rewrites the hidden repetition instances of every `<calendar_id>.json` calendar of a data folder as per-year bitmaps.
+Calendars are converted anyway when they are next saved, so this only saves doing it on every load until then.
+A calendar with hidden instances that have no bitmap equivalent is left untouched and reported.
+
+Usage (from the project root): python -m flask_calendar.scripts.hidden_repetitions_to_bitmaps <data_folder>
+"""
+
+import os
+import sys
+
+from flask_calendar.storage import JsonStorage
+
+
+def convert(data_folder: str) -> int:
+    storage = JsonStorage(data_folder)
+
+    converted = 0
+    for filename in sorted(os.listdir(data_folder)):
+        calendar_id, extension = os.path.splitext(filename)
+        if extension != ".json" or not os.path.isfile(os.path.join(data_folder, filename)):
+            continue
+        try:
+            data = storage.load(calendar_id, use_cache=False)
+        except ValueError as error:
+            print("Skipped '{}': {}".format(filename, error))
+            continue
+        storage.save(calendar_id, data)
+        converted += 1
+    return converted
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Must pass as an argument the data folder")
+        sys.exit(1)
+    count = convert(data_folder=sys.argv[1])
+    print("Converted {} calendars inside '{}'".format(count, sys.argv[1]))
@@ -0,0 +1,35 @@
+"""
+Splits every `<calendar_id>.json` calendar of a data folder into the `<calendar_id>/` month files used with
+`STORAGE_BACKEND = "sharded_json"`. Calendars already sharded are overwritten; JSON files are left untouched, so
+they can be kept as a backup or removed once the sharded calendars work.
+
+Usage (from the project root): python -m flask_calendar.scripts.json_to_sharded <data_folder>
+"""
+
+import os
+import sys
+
+from flask_calendar.sharded_storage import ShardedJsonStorage
+from flask_calendar.storage import JsonStorage
+
+
+def convert(data_folder: str) -> int:
+    json_storage = JsonStorage(data_folder)
+    sharded_storage = ShardedJsonStorage(data_folder)
+
+    converted = 0
+    for filename in sorted(os.listdir(data_folder)):
+        calendar_id, extension = os.path.splitext(filename)
+        if extension != ".json" or not os.path.isfile(os.path.join(data_folder, filename)):
+            continue
+        sharded_storage.save(calendar_id, json_storage.load(calendar_id, use_cache=False))
+        converted += 1
+    return converted
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Must pass as an argument the data folder")
+        sys.exit(1)
+    count = convert(data_folder=sys.argv[1])
+    print("Converted {} calendars inside '{}'".format(count, sys.argv[1]))
@@ -0,0 +1,34 @@
+"""
+Copies every `<calendar_id>.json` calendar of a data folder into a SQLite database usable with
+`STORAGE_BACKEND = "sqlite"`. Calendars already in the database are overwritten; JSON files are left untouched.
+
+Usage (from the project root): python -m flask_calendar.scripts.json_to_sqlite <data_folder> <database_path>
+"""
+
+import os
+import sys
+
+from flask_calendar.sqlite_storage import SqliteStorage
+from flask_calendar.storage import JsonStorage
+
+
+def convert(data_folder: str, database_path: str) -> int:
+    json_storage = JsonStorage(data_folder)
+    sqlite_storage = SqliteStorage(database_path)
+
+    converted = 0
+    for filename in sorted(os.listdir(data_folder)):
+        calendar_id, extension = os.path.splitext(filename)
+        if extension != ".json":
+            continue
+        sqlite_storage.save(calendar_id, json_storage.load(calendar_id, use_cache=False))
+        converted += 1
+    return converted
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Must pass as arguments the data folder and the SQLite database path")
+        sys.exit(1)
+    count = convert(data_folder=sys.argv[1], database_path=sys.argv[2])
+    print("Converted {} calendars into '{}'".format(count, sys.argv[2]))
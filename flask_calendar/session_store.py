@@ -0,0 +1,156 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Mapping, Optional
+
+from cachelib.simple import SimpleCache
+from flask_calendar.storage import write_atomically
+
+SESSION_STORE_MEMORY = "memory"
+SESSION_STORE_FILESYSTEM = "filesystem"
+SESSION_STORE_SQLITE = "sqlite"
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    username TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_by_expiration ON sessions (expires_at);
+"""
+
+
+class SessionStore:
+    """
+    Maps session ids to the username that logged in with them, until the session expires.
+    """
+
+    def get_username(self, session_id: str) -> Optional[str]:
+        raise NotImplementedError()
+
+    def add(self, session_id: str, username: str, timeout: int) -> None:
+        raise NotImplementedError()
+
+    def sweep_expired(self) -> int:
+        """
+        Removes expired sessions, returning how many.
+        """
+        raise NotImplementedError()
+
+
+class MemorySessionStore(SessionStore):
+    """
+    Sessions live inside the process, so the app must run as a single process. Default store.
+    """
+
+    def __init__(self) -> None:
+        self._cache = SimpleCache()
+
+    def get_username(self, session_id: str) -> Optional[str]:
+        return self._cache.get(session_id)  # type: ignore
+
+    def add(self, session_id: str, username: str, timeout: int) -> None:
+        self._cache.set(session_id, username, timeout=timeout)
+
+    def sweep_expired(self) -> int:
+        # SimpleCache already drops expired entries when it grows over its threshold
+        return 0
+
+
+class FileSystemSessionStore(SessionStore):
+    """
+    One small JSON file per session inside `folder`, which every process (and node, if on a shared volume) can read.
+    Files are named after a hash of the session id, so ids never become paths.
+    """
+
+    def __init__(self, folder: str) -> None:
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+
+    def get_username(self, session_id: str) -> Optional[str]:
+        try:
+            with open(self._path(session_id)) as file:
+                session = json.load(file)
+        except (FileNotFoundError, ValueError):
+            return None
+        if session["expires_at"] <= time.time():
+            return None
+        return str(session["username"])
+
+    def add(self, session_id: str, username: str, timeout: int) -> None:
+        contents = json.dumps({"username": username, "expires_at": time.time() + timeout})
+        write_atomically(self._path(session_id), contents.encode("UTF-8"))
+
+    def sweep_expired(self) -> int:
+        now = time.time()
+        removed = 0
+        for filename in os.listdir(self.folder):
+            if not filename.endswith(".json"):
+                continue
+            path = os.path.join(self.folder, filename)
+            try:
+                with open(path) as file:
+                    expires_at = json.load(file)["expires_at"]
+                if expires_at <= now:
+                    os.remove(path)
+                    removed += 1
+            except (FileNotFoundError, ValueError):
+                # removed meanwhile by another process
+                continue
+        return removed
+
+    def _path(self, session_id: str) -> str:
+        return os.path.join(self.folder, "{}.json".format(hashlib.sha256(session_id.encode("UTF-8")).hexdigest()))
+
+
+class SqliteSessionStore(SessionStore):
+    """
+    Sessions table in a SQLite database (can be the same one as the calendars), shared by every process of a node.
+    """
+
+    def __init__(self, database_path: str) -> None:
+        self.database_path = database_path
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.executescript(SQLITE_SCHEMA)
+
+    def get_username(self, session_id: str) -> Optional[str]:
+        cursor = self._connection().execute(
+            "SELECT username FROM sessions WHERE session_id = ? AND expires_at > ?", (session_id, time.time())
+        )
+        row = cursor.fetchone()
+        return None if row is None else str(row[0])
+
+    def add(self, session_id: str, username: str, timeout: int) -> None:
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, username, expires_at) VALUES (?, ?, ?)",
+                (session_id, username, time.time() + timeout),
+            )
+
+    def sweep_expired(self) -> int:
+        with self._connection() as connection:
+            return connection.execute("DELETE FROM sessions WHERE expires_at <= ?", (time.time(),)).rowcount
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared between threads
+        connection = getattr(self._local, "connection", None)  # type: Optional[sqlite3.Connection]
+        if connection is None:
+            connection = sqlite3.connect(self.database_path, timeout=10)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+
+def create_session_store(config: Mapping) -> SessionStore:
+    backend = config.get("SESSION_STORE", SESSION_STORE_MEMORY)
+    if backend == SESSION_STORE_MEMORY:
+        return MemorySessionStore()
+    elif backend == SESSION_STORE_FILESYSTEM:
+        return FileSystemSessionStore(folder=config["SESSIONS_FOLDER"])
+    elif backend == SESSION_STORE_SQLITE:
+        return SqliteSessionStore(database_path=config["SESSIONS_DATABASE_PATH"])
+    raise ValueError("Unknown session store '{}'".format(backend))
@@ -0,0 +1,309 @@
+import os
+from typing import Callable, Dict, Iterator, List, Mapping, Optional, Sequence, Set, Tuple, cast
+
+from flask_calendar.calendar_cache import cache, file_stamp
+from flask_calendar.calendar_data import (
+    KEY_NORMAL_TASK,
+    KEY_REPETITIVE_HIDDEN_TASK,
+    KEY_REPETITIVE_TASK,
+    KEY_TASKS,
+    CalendarData,
+)
+from flask_calendar.calendar_schema import (
+    MonthTasks,
+    Task,
+    decode_calendar,
+    decode_month_tasks,
+    encode_calendar,
+    encode_json,
+)
+from flask_calendar.storage import (
+    KEY_VERSION,
+    CalendarConflictError,
+    CalendarLocks,
+    CalendarNotFoundError,
+    IndexedCalendarStorage,
+    NormalTaskEntry,
+    calendar_revision,
+    write_atomically,
+)
+
+HEADER_FILENAME = "calendar.json"
+# number of changes of normal tasks, see `ShardedJsonStorage.revision`
+REVISION_FILENAME = "revision"
+
+
+class ShardedJsonStorage(IndexedCalendarStorage):
+    """
+    One folder per calendar inside the data folder: `calendar.json` keeps the users, repetitive tasks and hidden
+    instances, and normal tasks live in one `<year>/<month>.json` file per month. Views only read the (at most two)
+    months they render, and changes only rewrite the files they touch.
+
+    Loaded documents fetch normal tasks lazily one month at a time when accessed.
+    Files are replaced atomically while holding the calendar lock, so several processes can share the data folder.
+    """
+
+    def __init__(self, data_folder: str) -> None:
+        self.data_folder = data_folder
+        self.locks = CalendarLocks(data_folder)
+
+    def load(self, calendar_id: str, use_cache: bool = True) -> Dict:
+        data = self._read_header(calendar_id, use_cache=use_cache)
+        if use_cache:
+            # header is shared with the cache, so only copy the containers replaced here
+            data = dict(data)
+            data[KEY_TASKS] = dict(data[KEY_TASKS])
+            data[KEY_TASKS][KEY_NORMAL_TASK] = _ShardedNormalTasks(self, calendar_id)
+        else:
+            # callers are going to modify the data, so give them plain dicts
+            data[KEY_TASKS][KEY_NORMAL_TASK] = {
+                year_str: {
+                    month_str: self._read_month(calendar_id, year_str, month_str, use_cache=False)
+                    for month_str in self._months(calendar_id, year_str)
+                }
+                for year_str in self._years(calendar_id)
+            }
+        return data
+
+    def revision(self, calendar_id: str) -> Tuple[int, int, int]:
+        # changes of normal tasks don't write the header, they increase the number in the revision file instead
+        version, journal_sequence, _ = calendar_revision(self._read_header(calendar_id, use_cache=True))
+        return version, journal_sequence, self._read_revision(calendar_id)
+
+    def save(self, calendar_id: str, data: Dict, expected_version: Optional[int] = None) -> None:
+        normal_tasks = data[KEY_TASKS][KEY_NORMAL_TASK]
+        with self.locks.hold(calendar_id):
+            if expected_version is not None:
+                current_version = self._read_header(calendar_id, use_cache=False).get(KEY_VERSION, 0)
+                if current_version != expected_version:
+                    raise CalendarConflictError("Calendar '{}' changed since it was loaded".format(calendar_id))
+            os.makedirs(self.path(calendar_id), exist_ok=True)
+            data = dict(data)
+            data[KEY_VERSION] = data.get(KEY_VERSION, 0) + 1
+            self._write_header(calendar_id, data)
+
+            saved_months = set()  # type: Set[Tuple[str, str]]
+            for year_str, months in normal_tasks.items():
+                os.makedirs(os.path.join(self.path(calendar_id), year_str), exist_ok=True)
+                for month_str, days in months.items():
+                    self._write_month(calendar_id, year_str, month_str, days)
+                    saved_months.add((year_str, month_str))
+
+            for year_str in self._years(calendar_id):
+                for month_str in self._months(calendar_id, year_str):
+                    if (year_str, month_str) not in saved_months:
+                        os.remove(self.month_path(calendar_id, year_str, month_str))
+                        cache.invalidate(self.month_path(calendar_id, year_str, month_str))
+                if year_str not in normal_tasks and not os.listdir(os.path.join(self.path(calendar_id), year_str)):
+                    os.rmdir(os.path.join(self.path(calendar_id), year_str))
+
+    def add_tasks(
+        self, calendar_id: str, normal_tasks: Sequence[NormalTaskEntry], repetitive_tasks: Sequence[Task]
+    ) -> None:
+        self._change(
+            calendar_id,
+            [(str(year), str(month)) for year, month, _, _ in normal_tasks],
+            lambda data: CalendarData.add_tasks_to_data(data, normal_tasks, repetitive_tasks),
+        )
+
+    def delete_task(self, calendar_id: str, year_str: str, month_str: str, day_str: str, task_id: int) -> None:
+        self._change(
+            calendar_id,
+            [(year_str, month_str)],
+            lambda data: CalendarData.delete_task_from_data(data, year_str, month_str, day_str, task_id),
+        )
+
+    def update_task_day(
+        self, calendar_id: str, year_str: str, month_str: str, day_str: str, task_id: int, new_day_str: str
+    ) -> None:
+        self._change(
+            calendar_id,
+            [(year_str, month_str)],
+            lambda data: CalendarData.update_task_day_in_data(data, year_str, month_str, day_str, task_id, new_day_str),
+        )
+
+    def hide_repetition_task_instance(
+        self, calendar_id: str, year_str: str, month_str: str, day_str: str, task_id_str: str
+    ) -> None:
+        self._change(
+            calendar_id,
+            [],
+            lambda data: CalendarData.hide_repetition_task_instance_in_data(
+                data, year_str, month_str, day_str, task_id_str
+            ),
+        )
+
+    def path(self, calendar_id: str) -> str:
+        return os.path.join(".", self.data_folder, calendar_id)
+
+    def header_path(self, calendar_id: str) -> str:
+        return os.path.join(self.path(calendar_id), HEADER_FILENAME)
+
+    def revision_path(self, calendar_id: str) -> str:
+        return os.path.join(self.path(calendar_id), REVISION_FILENAME)
+
+    def month_path(self, calendar_id: str, year_str: str, month_str: str) -> str:
+        return os.path.join(self.path(calendar_id), year_str, "{}.json".format(month_str))
+
+    def _change(self, calendar_id: str, months: List[Tuple[str, str]], change: Callable[[Dict], object]) -> None:
+        # The document helpers of CalendarData are applied over a document holding only the months the change
+        # touches, then only the files whose contents changed are written
+        with self.locks.hold(calendar_id):
+            data = self._read_header(calendar_id, use_cache=False)
+            normal_tasks = {}  # type: Dict[str, Dict[str, MonthTasks]]
+            data[KEY_TASKS][KEY_NORMAL_TASK] = normal_tasks
+            original_months = {}  # type: Dict[Tuple[str, str], bytes]
+            for year_str, month_str in set(months):
+                if not _is_number(year_str) or not _is_number(month_str):
+                    continue
+                month_tasks = self._read_month(calendar_id, year_str, month_str, use_cache=False)
+                if month_tasks is not None:
+                    normal_tasks.setdefault(year_str, {})[month_str] = month_tasks
+                    original_months[(year_str, month_str)] = encode_json(month_tasks)
+            original_header = encode_calendar(self._header(data))
+
+            change(data)
+
+            if encode_calendar(self._header(data)) != original_header:
+                # repetitive tasks changed, which memoized expansions of them notice through the version
+                data[KEY_VERSION] = data.get(KEY_VERSION, 0) + 1
+                self._write_header(calendar_id, data)
+            months_changed = False
+            for year_str, months_tasks in normal_tasks.items():
+                for month_str, month_tasks in months_tasks.items():
+                    if encode_json(month_tasks) != original_months.get((year_str, month_str)):
+                        self._write_month(calendar_id, year_str, month_str, month_tasks)
+                        months_changed = True
+            if months_changed:
+                # after the months, so a new revision is never read along the previous months
+                write_atomically(self.revision_path(calendar_id), str(self._read_revision(calendar_id) + 1).encode())
+
+    def _read_header(self, calendar_id: str, use_cache: bool) -> Dict:
+        path = self.header_path(calendar_id)
+        try:
+            file = open(path, "rb")
+        except FileNotFoundError as error:
+            raise CalendarNotFoundError("Calendar '{}' not found".format(calendar_id)) from error
+        with file:
+            stamp = file_stamp(os.fstat(file.fileno()))
+            if use_cache:
+                cached = cache.get(path, stamp)
+                if cached is not None:
+                    return cast(Dict, cached)
+            data = decode_calendar(file.read())
+        if use_cache:
+            cache.put(path, stamp, data)
+        return data
+
+    def _read_revision(self, calendar_id: str) -> int:
+        try:
+            with open(self.revision_path(calendar_id), "rb") as file:
+                return int(file.read())
+        except FileNotFoundError:
+            return 0
+
+    def _write_header(self, calendar_id: str, data: Dict) -> None:
+        header = self._header(data)
+        path = self.header_path(calendar_id)
+        stamp = write_atomically(path, encode_calendar(header))
+        cache.put(path, stamp, header)
+
+    def _read_month(self, calendar_id: str, year_str: str, month_str: str, use_cache: bool) -> Optional[MonthTasks]:
+        path = self.month_path(calendar_id, year_str, month_str)
+        try:
+            file = open(path, "rb")
+        except FileNotFoundError:
+            return None
+        with file:
+            stamp = file_stamp(os.fstat(file.fileno()))
+            if use_cache:
+                cached = cache.get(path, stamp)
+                if cached is not None:
+                    return cast(MonthTasks, cached)
+            month_tasks = decode_month_tasks(file.read())
+        if use_cache:
+            cache.put(path, stamp, month_tasks)
+        return month_tasks
+
+    def _write_month(self, calendar_id: str, year_str: str, month_str: str, month_tasks: MonthTasks) -> None:
+        path = self.month_path(calendar_id, year_str, month_str)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        stamp = write_atomically(path, encode_json(month_tasks))
+        cache.put(path, stamp, month_tasks)
+
+    def _years(self, calendar_id: str) -> List[str]:
+        return _numbered_entries(self.path(calendar_id), "")
+
+    def _months(self, calendar_id: str, year_str: str) -> List[str]:
+        return _numbered_entries(os.path.join(self.path(calendar_id), year_str), ".json")
+
+    @staticmethod
+    def _header(data: Dict) -> Dict:
+        # calendar document without normal tasks, so it decodes with the same schema as a whole calendar
+        header = dict(data)
+        header[KEY_TASKS] = {
+            KEY_NORMAL_TASK: {},
+            KEY_REPETITIVE_TASK: data[KEY_TASKS][KEY_REPETITIVE_TASK],
+            KEY_REPETITIVE_HIDDEN_TASK: data[KEY_TASKS][KEY_REPETITIVE_HIDDEN_TASK],
+        }
+        return header
+
+
+class _ShardedNormalTasks(Mapping):
+    # {year_str: {month_str: {day_str: [task, ...]}}} view over the month files, read on access
+
+    def __init__(self, storage: ShardedJsonStorage, calendar_id: str) -> None:
+        self.storage = storage
+        self.calendar_id = calendar_id
+        self._years = {}  # type: Dict[str, _ShardedNormalTasksYear]
+
+    def __getitem__(self, year_str: str) -> "_ShardedNormalTasksYear":
+        if year_str not in self._years:
+            year_path = os.path.join(self.storage.path(self.calendar_id), year_str)
+            if not _is_number(year_str) or not os.path.isdir(year_path):
+                raise KeyError(year_str)
+            self._years[year_str] = _ShardedNormalTasksYear(self, year_str)
+        return self._years[year_str]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.storage._years(self.calendar_id))
+
+    def __len__(self) -> int:
+        return len(self.storage._years(self.calendar_id))
+
+
+class _ShardedNormalTasksYear(Mapping):
+    def __init__(self, normal_tasks: _ShardedNormalTasks, year_str: str) -> None:
+        self.normal_tasks = normal_tasks
+        self.year_str = year_str
+        self._months = {}  # type: Dict[str, MonthTasks]
+
+    def __getitem__(self, month_str: str) -> MonthTasks:
+        if month_str not in self._months:
+            month_tasks = None
+            if _is_number(month_str):
+                month_tasks = self.normal_tasks.storage._read_month(
+                    self.normal_tasks.calendar_id, self.year_str, month_str, use_cache=True
+                )
+            if month_tasks is None:
+                raise KeyError(month_str)
+            self._months[month_str] = month_tasks
+        return self._months[month_str]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.normal_tasks.storage._months(self.normal_tasks.calendar_id, self.year_str))
+
+    def __len__(self) -> int:
+        return len(self.normal_tasks.storage._months(self.normal_tasks.calendar_id, self.year_str))
+
+
+def _is_number(value: str) -> bool:
+    # keys become path components, so only accept the ones `str(int)` produces
+    return value.isdigit() and str(int(value)) == value
+
+
+def _numbered_entries(folder: str, extension: str) -> List[str]:
+    if not os.path.isdir(folder):
+        return []
+    names = [name[: len(name) - len(extension)] for name in os.listdir(folder) if name.endswith(extension)]
+    return sorted([name for name in names if _is_number(name)], key=int)
@@ -0,0 +1,305 @@
+import json
+import sqlite3
+import threading
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+from flask_calendar.calendar_schema import Task, decode_task, encode_task
+from flask_calendar.calendar_data import KEY_NORMAL_TASK, KEY_REPETITIVE_HIDDEN_TASK, KEY_REPETITIVE_TASK, KEY_TASKS
+from flask_calendar.hidden_repetitions import HiddenRepetitions, hidden_days, hide
+from flask_calendar.storage import (
+    KEY_REVISION,
+    KEY_VERSION,
+    CalendarConflictError,
+    CalendarNotFoundError,
+    IndexedCalendarStorage,
+    NormalTaskEntry,
+    calendar_revision,
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS calendars (
+    calendar_id TEXT PRIMARY KEY,
+    header TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    calendar_id TEXT NOT NULL,
+    task_id INTEGER NOT NULL,
+    repeats INTEGER NOT NULL,
+    year INTEGER,
+    month INTEGER,
+    day INTEGER,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tasks_by_date ON tasks (calendar_id, year, month, day);
+CREATE INDEX IF NOT EXISTS tasks_by_id ON tasks (calendar_id, task_id);
+CREATE INDEX IF NOT EXISTS repetitive_tasks ON tasks (calendar_id) WHERE repeats = 1;
+CREATE TABLE IF NOT EXISTS hidden_repetitions (
+    calendar_id TEXT NOT NULL,
+    task_id INTEGER NOT NULL,
+    year INTEGER NOT NULL,
+    month INTEGER NOT NULL,
+    day INTEGER NOT NULL,
+    PRIMARY KEY (calendar_id, task_id, year, month, day)
+);
+"""
+
+
+class SqliteStorage(IndexedCalendarStorage):
+    """
+    All calendars in a single SQLite database. Normal tasks are indexed by (calendar, year, month, day) and by id,
+    so reading a month or changing a task doesn't depend on the size of the calendar.
+
+    Loaded documents contain the users, repetitive tasks and hidden instances, while normal tasks are fetched lazily
+    one month at a time when accessed.
+    """
+
+    def __init__(self, database_path: str) -> None:
+        self.database_path = database_path
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.executescript(SCHEMA)
+
+    def load(self, calendar_id: str, use_cache: bool = True) -> Dict:
+        connection = self._connection()
+        row = connection.execute("SELECT header FROM calendars WHERE calendar_id = ?", (calendar_id,)).fetchone()
+        if row is None:
+            raise CalendarNotFoundError("Calendar '{}' not found".format(calendar_id))
+        data = json.loads(row[0])  # type: Dict
+
+        hidden = {}  # type: HiddenRepetitions
+        for task_id, year, month, day in connection.execute(
+            "SELECT task_id, year, month, day FROM hidden_repetitions WHERE calendar_id = ?", (calendar_id,)
+        ):
+            hide(hidden, str(task_id), str(year), str(month), str(day))
+
+        normal_tasks = _NormalTasks(connection, calendar_id)  # type: Mapping
+        if not use_cache:
+            # callers are going to modify the data, so give them plain dicts
+            normal_tasks = {
+                year_str: {month_str: dict(days) for month_str, days in months.items()}
+                for year_str, months in normal_tasks.items()
+            }
+
+        data[KEY_TASKS] = {
+            KEY_NORMAL_TASK: normal_tasks,
+            KEY_REPETITIVE_TASK: [
+                decode_task(task_data, repeats=True)
+                for (task_data,) in connection.execute(
+                    "SELECT data FROM tasks WHERE calendar_id = ? AND repeats = 1 ORDER BY rowid", (calendar_id,)
+                )
+            ],
+            KEY_REPETITIVE_HIDDEN_TASK: hidden,
+        }
+        return data
+
+    def revision(self, calendar_id: str) -> Tuple[int, int, int]:
+        row = (
+            self._connection().execute("SELECT header FROM calendars WHERE calendar_id = ?", (calendar_id,)).fetchone()
+        )
+        if row is None:
+            raise CalendarNotFoundError("Calendar '{}' not found".format(calendar_id))
+        return calendar_revision(json.loads(row[0]))
+
+    def save(self, calendar_id: str, data: Dict, expected_version: Optional[int] = None) -> None:
+        header = {key: value for key, value in data.items() if key != KEY_TASKS}
+        header[KEY_VERSION] = header.get(KEY_VERSION, 0) + 1
+        tasks = data[KEY_TASKS]
+
+        with self._connection() as connection:
+            # takes the write lock before reading the version, so nobody can save in between
+            connection.execute("BEGIN IMMEDIATE")
+            if expected_version is not None:
+                row = connection.execute(
+                    "SELECT header FROM calendars WHERE calendar_id = ?", (calendar_id,)
+                ).fetchone()
+                if row is None or json.loads(row[0]).get(KEY_VERSION, 0) != expected_version:
+                    raise CalendarConflictError("Calendar '{}' changed since it was loaded".format(calendar_id))
+            connection.execute(
+                "INSERT OR REPLACE INTO calendars (calendar_id, header) VALUES (?, ?)",
+                (calendar_id, json.dumps(header)),
+            )
+            connection.execute("DELETE FROM tasks WHERE calendar_id = ?", (calendar_id,))
+            connection.execute("DELETE FROM hidden_repetitions WHERE calendar_id = ?", (calendar_id,))
+            self._insert_tasks(
+                connection,
+                calendar_id,
+                [
+                    (int(year_str), int(month_str), int(day_str), task)
+                    for year_str, months in tasks[KEY_NORMAL_TASK].items()
+                    for month_str, days in months.items()
+                    for day_str, day_tasks in days.items()
+                    for task in day_tasks
+                ],
+                tasks[KEY_REPETITIVE_TASK],
+            )
+            connection.executemany(
+                "INSERT OR IGNORE INTO hidden_repetitions (calendar_id, task_id, year, month, day) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [
+                    (calendar_id, int(task_id_str), int(year_str), month, day)
+                    for task_id_str, years in tasks[KEY_REPETITIVE_HIDDEN_TASK].items()
+                    for year_str, encoded in years.items()
+                    for month, day in hidden_days(encoded)
+                ],
+            )
+
+    def add_tasks(
+        self, calendar_id: str, normal_tasks: Sequence[NormalTaskEntry], repetitive_tasks: Sequence[Task]
+    ) -> None:
+        with self._connection() as connection:
+            self._insert_tasks(connection, calendar_id, normal_tasks, repetitive_tasks)
+            if repetitive_tasks:
+                self._increase_version(connection, calendar_id)
+            self._increase_version(connection, calendar_id, KEY_REVISION)
+
+    def delete_task(self, calendar_id: str, year_str: str, month_str: str, day_str: str, task_id: int) -> None:
+        with self._connection() as connection:
+            cursor = connection.execute(
+                "DELETE FROM tasks WHERE calendar_id = ? AND year = ? AND month = ? AND day = ? AND task_id = ? "
+                "AND repeats = 0",
+                (calendar_id, int(year_str), int(month_str), int(day_str), task_id),
+            )
+            if cursor.rowcount == 0:
+                connection.execute(
+                    "DELETE FROM tasks WHERE calendar_id = ? AND task_id = ? AND repeats = 1", (calendar_id, task_id)
+                )
+                connection.execute(
+                    "DELETE FROM hidden_repetitions WHERE calendar_id = ? AND task_id = ?", (calendar_id, task_id)
+                )
+                self._increase_version(connection, calendar_id)
+            self._increase_version(connection, calendar_id, KEY_REVISION)
+
+    def update_task_day(
+        self, calendar_id: str, year_str: str, month_str: str, day_str: str, task_id: int, new_day_str: str
+    ) -> None:
+        with self._connection() as connection:
+            connection.execute(
+                "UPDATE tasks SET day = ? WHERE calendar_id = ? AND year = ? AND month = ? AND day = ? "
+                "AND task_id = ? AND repeats = 0",
+                (int(new_day_str), calendar_id, int(year_str), int(month_str), int(day_str), task_id),
+            )
+            self._increase_version(connection, calendar_id, KEY_REVISION)
+
+    def hide_repetition_task_instance(
+        self, calendar_id: str, year_str: str, month_str: str, day_str: str, task_id_str: str
+    ) -> None:
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT OR IGNORE INTO hidden_repetitions (calendar_id, task_id, year, month, day) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (calendar_id, int(task_id_str), int(year_str), int(month_str), int(day_str)),
+            )
+            self._increase_version(connection, calendar_id)
+            self._increase_version(connection, calendar_id, KEY_REVISION)
+
+    @staticmethod
+    def _increase_version(connection: sqlite3.Connection, calendar_id: str, key: str = KEY_VERSION) -> None:
+        # repetitive tasks changed, which memoized expansions of them notice through the version, or with `key`
+        # KEY_REVISION any task changed
+        connection.execute(
+            "UPDATE calendars SET header = json_set(header, '$.{0}', COALESCE(json_extract(header, '$.{0}'), 0) + 1) "
+            "WHERE calendar_id = ?".format(key),
+            (calendar_id,),
+        )
+
+    @staticmethod
+    def _insert_tasks(
+        connection: sqlite3.Connection,
+        calendar_id: str,
+        normal_tasks: Sequence[NormalTaskEntry],
+        repetitive_tasks: Sequence[Task],
+    ) -> None:
+        connection.executemany(
+            "INSERT INTO tasks (calendar_id, task_id, repeats, year, month, day, data) VALUES (?, ?, 0, ?, ?, ?, ?)",
+            [(calendar_id, task["id"], year, month, day, encode_task(task)) for year, month, day, task in normal_tasks],
+        )
+        connection.executemany(
+            "INSERT INTO tasks (calendar_id, task_id, repeats, data) VALUES (?, ?, 1, ?)",
+            [(calendar_id, task["id"], encode_task(task)) for task in repetitive_tasks],
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared between threads
+        connection = getattr(self._local, "connection", None)  # type: Optional[sqlite3.Connection]
+        if connection is None:
+            connection = sqlite3.connect(self.database_path, timeout=10)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+
+class _NormalTasks(Mapping):
+    # {year_str: {month_str: {day_str: [task, ...]}}} view over the tasks table, queried on access
+
+    def __init__(self, connection: sqlite3.Connection, calendar_id: str) -> None:
+        self.connection = connection
+        self.calendar_id = calendar_id
+        self._years = {}  # type: Dict[str, _NormalTasksYear]
+
+    def __getitem__(self, year_str: str) -> "_NormalTasksYear":
+        if year_str not in self._years:
+            year = _to_int(year_str)
+            if year is None or not self._exists("year = ?", (year,)):
+                raise KeyError(year_str)
+            self._years[year_str] = _NormalTasksYear(self, year)
+        return self._years[year_str]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter([str(year) for year in self._distinct("year", "", ())])
+
+    def __len__(self) -> int:
+        return len(self._distinct("year", "", ()))
+
+    def _exists(self, condition: str, parameters: tuple) -> bool:
+        row = self.connection.execute(
+            "SELECT 1 FROM tasks WHERE calendar_id = ? AND repeats = 0 AND {} LIMIT 1".format(condition),
+            (self.calendar_id,) + parameters,
+        ).fetchone()
+        return row is not None
+
+    def _distinct(self, column: str, condition: str, parameters: tuple) -> List[int]:
+        return [
+            row[0]
+            for row in self.connection.execute(
+                "SELECT DISTINCT {} FROM tasks WHERE calendar_id = ? AND repeats = 0 {} ORDER BY 1".format(
+                    column, condition
+                ),
+                (self.calendar_id,) + parameters,
+            )
+        ]
+
+
+class _NormalTasksYear(Mapping):
+    def __init__(self, normal_tasks: _NormalTasks, year: int) -> None:
+        self.normal_tasks = normal_tasks
+        self.year = year
+        self._months = {}  # type: Dict[str, Dict[str, List[Task]]]
+
+    def __getitem__(self, month_str: str) -> Dict[str, List[Task]]:
+        if month_str not in self._months:
+            month = _to_int(month_str)
+            days = {}  # type: Dict[str, List[Task]]
+            if month is not None:
+                for day, task_data in self.normal_tasks.connection.execute(
+                    "SELECT day, data FROM tasks WHERE calendar_id = ? AND year = ? AND month = ? AND repeats = 0 "
+                    "ORDER BY day, rowid",
+                    (self.normal_tasks.calendar_id, self.year, month),
+                ):
+                    days.setdefault(str(day), []).append(decode_task(task_data, repeats=False))
+            if not days:
+                raise KeyError(month_str)
+            self._months[month_str] = days
+        return self._months[month_str]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter([str(month) for month in self.normal_tasks._distinct("month", "AND year = ?", (self.year,))])
+
+    def __len__(self) -> int:
+        return len(self.normal_tasks._distinct("month", "AND year = ?", (self.year,)))
+
+
+def _to_int(value: Any) -> Optional[int]:
+    try:
+        return int(value)
+    except ValueError:
+        return None
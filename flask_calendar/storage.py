@@ -0,0 +1,247 @@
+import os
+import stat
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, Mapping, Optional, Sequence, Tuple, cast
+
+from flask_calendar.calendar_cache import FileStamp, cache, file_stamp
+from flask_calendar.calendar_schema import Task, decode_calendar, encode_calendar
+
+try:
+    import fcntl
+except ImportError:
+    # not available on Windows, where locks only work between threads of a single process
+    fcntl = None  # type: ignore
+
+STORAGE_JSON = "json"
+STORAGE_JOURNALED_JSON = "journaled_json"
+STORAGE_SHARDED_JSON = "sharded_json"
+STORAGE_SQLITE = "sqlite"
+
+# increased on every save of a whole calendar (see `CalendarStorage.save`) and on every change of its repetitive tasks
+KEY_VERSION = "version"
+# last change of a journaled calendar, see `JournaledJsonStorage`
+KEY_JOURNAL_SEQUENCE = "journal_sequence"
+# increased by `SqliteStorage` on every change, as changes of normal tasks don't increase the version
+KEY_REVISION = "revision"
+
+# (year, month, day, task)
+NormalTaskEntry = Tuple[int, int, int, Task]
+
+
+class CalendarNotFoundError(FileNotFoundError):
+    # Subclass of FileNotFoundError so existing "calendar does not exist" handling works for any storage
+    pass
+
+
+class CalendarConflictError(Exception):
+    pass
+
+
+class CalendarStorage:
+    """
+    Persists whole calendar documents, with the same structure as the JSON files.
+    """
+
+    def load(self, calendar_id: str, use_cache: bool = True) -> Dict:
+        raise NotImplementedError()
+
+    def revision(self, calendar_id: str) -> Tuple[int, int, int]:
+        """
+        Changes whenever the calendar does. Cached loads only stat the files, storages that can read it without
+        loading the calendar should override this.
+        """
+        return calendar_revision(self.load(calendar_id))
+
+    def save(self, calendar_id: str, data: Dict, expected_version: Optional[int] = None) -> None:
+        """
+        If `expected_version` is given and the stored calendar is no longer at that version (someone else saved it
+        after it was loaded) raises `CalendarConflictError` instead of overwriting those changes.
+        """
+        raise NotImplementedError()
+
+
+class IndexedCalendarStorage(CalendarStorage):
+    """
+    Storage that can read and change individual tasks without loading or writing the whole calendar.
+    `CalendarData` uses these methods instead of load + modify + save when available.
+    """
+
+    def add_tasks(
+        self, calendar_id: str, normal_tasks: Sequence[NormalTaskEntry], repetitive_tasks: Sequence[Task]
+    ) -> None:
+        raise NotImplementedError()
+
+    def delete_task(self, calendar_id: str, year_str: str, month_str: str, day_str: str, task_id: int) -> None:
+        raise NotImplementedError()
+
+    def update_task_day(
+        self, calendar_id: str, year_str: str, month_str: str, day_str: str, task_id: int, new_day_str: str
+    ) -> None:
+        raise NotImplementedError()
+
+    def hide_repetition_task_instance(
+        self, calendar_id: str, year_str: str, month_str: str, day_str: str, task_id_str: str
+    ) -> None:
+        raise NotImplementedError()
+
+
+class CalendarLocks:
+    """
+    Advisory per-calendar locks, held both between threads of this process and between processes (with `flock` on a
+    `<calendar_id>.lock` file inside `folder`). Reentrant for the thread holding them.
+    """
+
+    def __init__(self, folder: str) -> None:
+        self.folder = folder
+        self._locks = {}  # type: Dict[str, threading.RLock]
+        self._lock_files = {}  # type: Dict[str, Tuple[int, int]]
+        self._locks_lock = threading.Lock()
+
+    @contextmanager
+    def hold(self, calendar_id: str) -> Iterator[None]:
+        with self._locks_lock:
+            if calendar_id not in self._locks:
+                self._locks[calendar_id] = threading.RLock()
+            lock = self._locks[calendar_id]
+
+        with lock:
+            # only the thread holding `lock` changes its entry, so no need of `_locks_lock` from here on
+            file_descriptor, depth = self._lock_files.get(calendar_id, (-1, 0))
+            if depth == 0:
+                file_descriptor = os.open(
+                    os.path.join(self.folder, "{}.lock".format(calendar_id)), os.O_RDWR | os.O_CREAT, 0o644
+                )
+                if fcntl is not None:
+                    fcntl.flock(file_descriptor, fcntl.LOCK_EX)
+            self._lock_files[calendar_id] = (file_descriptor, depth + 1)
+            try:
+                yield
+            finally:
+                if depth == 0:
+                    del self._lock_files[calendar_id]
+                    # closing the file releases the flock
+                    os.close(file_descriptor)
+                else:
+                    self._lock_files[calendar_id] = (file_descriptor, depth)
+
+
+def calendar_revision(data: Mapping) -> Tuple[int, int, int]:
+    return data.get(KEY_VERSION, 0), data.get(KEY_JOURNAL_SEQUENCE, 0), data.get(KEY_REVISION, 0)
+
+
+def write_atomically(path: str, contents: bytes) -> FileStamp:
+    """
+    Writes to a temporary file that then replaces `path`, so readers (and a crash midway) see either the previous or
+    the new contents, never a truncated file. Returns the stamp of the new file.
+    """
+    temporary_path, stamp = write_temporary_file(path, contents)
+    try:
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.remove(temporary_path)
+        raise
+    return stamp
+
+
+def append_line(path: str, line: bytes) -> None:
+    """
+    Appends `line` (ending in a newline) to a file of lines. A last line cut by a crash while appending is dropped
+    first, so the new one isn't joined to it. Callers hold the lock of the file.
+    """
+    with open(path, "a+b") as file:
+        size = file.seek(0, os.SEEK_END)
+        if size > 0:
+            file.seek(size - 1)
+            if file.read(1) != b"\n":
+                file.seek(0)
+                file.truncate(file.read().rfind(b"\n") + 1)
+        file.write(line)
+
+
+def write_temporary_file(path: str, contents: bytes) -> Tuple[str, FileStamp]:
+    """
+    Writes `contents` to disk in a new file next to `path`, ready to `os.replace` it.
+    """
+    folder, filename = os.path.split(path)
+    file_descriptor, temporary_path = tempfile.mkstemp(dir=folder, prefix=".{}.".format(filename), suffix=".tmp")
+    try:
+        with os.fdopen(file_descriptor, "wb") as file:
+            file.write(contents)
+            file.flush()
+            os.fsync(file.fileno())
+            os.chmod(temporary_path, stat.S_IMODE(os.stat(path).st_mode) if os.path.exists(path) else 0o644)
+            stamp = file_stamp(os.fstat(file.fileno()))
+    except BaseException:
+        os.remove(temporary_path)
+        raise
+    return temporary_path, stamp
+
+
+class JsonStorage(CalendarStorage):
+    """
+    One `<calendar_id>.json` file per calendar inside the data folder. Default storage.
+
+    Saves replace the file atomically while holding the calendar lock, so several processes can share the data folder.
+    """
+
+    def __init__(self, data_folder: str) -> None:
+        self.data_folder = data_folder
+        self.locks = CalendarLocks(data_folder)
+
+    def load(self, calendar_id: str, use_cache: bool = True) -> Dict:
+        path = self.path(calendar_id)
+        with open(path, "rb") as file:
+            stamp = file_stamp(os.fstat(file.fileno()))
+            if use_cache:
+                cached = cache.get(path, stamp)
+                if cached is not None:
+                    return cast(Dict, cached)
+            contents = decode_calendar(file.read())
+        if use_cache:
+            cache.put(path, stamp, contents)
+        return contents
+
+    def save(self, calendar_id: str, data: Dict, expected_version: Optional[int] = None) -> None:
+        with self.locks.hold(calendar_id):
+            # not using the cache, as its file stamps can miss a change written within the same clock tick
+            if (
+                expected_version is not None
+                and self.load(calendar_id, use_cache=False).get(KEY_VERSION, 0) != expected_version
+            ):
+                raise CalendarConflictError("Calendar '{}' changed since it was loaded".format(calendar_id))
+            data = dict(data)
+            data[KEY_VERSION] = data.get(KEY_VERSION, 0) + 1
+            self._write(calendar_id, data)
+
+    def _write(self, calendar_id: str, data: Dict) -> None:
+        path = self.path(calendar_id)
+        stamp = write_atomically(path, encode_calendar(data))
+        # saved data becomes the cached copy, so the redirect after a change doesn't need to parse it again
+        cache.put(path, stamp, data)
+
+    def path(self, calendar_id: str) -> str:
+        return os.path.join(".", self.data_folder, "{}.json".format(calendar_id))
+
+
+def create_storage(config: Mapping) -> CalendarStorage:
+    backend = config.get("STORAGE_BACKEND", STORAGE_JSON)
+    if backend == STORAGE_JSON:
+        return JsonStorage(data_folder=config["DATA_FOLDER"])
+    elif backend == STORAGE_JOURNALED_JSON:
+        from flask_calendar.journal_storage import JournaledJsonStorage
+
+        return JournaledJsonStorage(
+            data_folder=config["DATA_FOLDER"],
+            compaction_threshold_bytes=config["JOURNAL_COMPACTION_THRESHOLD_BYTES"],
+        )
+    elif backend == STORAGE_SHARDED_JSON:
+        from flask_calendar.sharded_storage import ShardedJsonStorage
+
+        return ShardedJsonStorage(data_folder=config["DATA_FOLDER"])
+    elif backend == STORAGE_SQLITE:
+        from flask_calendar.sqlite_storage import SqliteStorage
+
+        return SqliteStorage(database_path=config["SQLITE_DATABASE_PATH"])
+    raise ValueError("Unknown storage backend '{}'".format(backend))
@@ -0,0 +1,126 @@
+import json
+import os
+import threading
+from typing import Dict, Optional
+
+from flask_calendar.calendar_cache import FileStamp, file_stamp
+from flask_calendar.storage import CalendarLocks, append_line, write_atomically
+
+USERS_FILENAME = "users.json"
+JOURNAL_FILENAME = "users.journal"
+LOCK_NAME = "users"
+
+OPERATION_SET_USER = "set"
+OPERATION_DELETE_USER = "delete"
+
+DEFAULT_COMPACTION_THRESHOLD_BYTES = 256 * 1024
+
+NO_FILE_STAMP = (0, 0, 0)
+
+
+class UserStore:
+    """
+    Users of a data folder, kept in memory by username and shared by every request of the process.
+    Before each lookup the files are stat'ed, and only read again when another process changed them.
+
+    Like `JournaledJsonStorage`, changes are appended as JSON lines to `users.journal` instead of rewriting
+    `users.json`, which is rewritten once the journal grows over `compaction_threshold_bytes`. Replaying a change twice
+    gives the same result, so a journal left behind by an interrupted compaction is harmless.
+    """
+
+    def __init__(self, data_folder: str, compaction_threshold_bytes: int = DEFAULT_COMPACTION_THRESHOLD_BYTES) -> None:
+        self.data_folder = data_folder
+        self.compaction_threshold_bytes = compaction_threshold_bytes
+        self.locks = CalendarLocks(data_folder)
+        self._users = {}  # type: Dict[str, Dict]
+        self._stamp = None  # type: Optional[FileStamp]
+        self._lock = threading.Lock()
+
+    def get(self, username: str) -> Optional[Dict]:
+        with self._lock:
+            self._reload_if_changed()
+            return self._users.get(username)
+
+    def __contains__(self, username: str) -> bool:
+        return self.get(username) is not None
+
+    def set(self, user: Dict) -> None:
+        self._append({"op": OPERATION_SET_USER, "user": user})
+
+    def delete(self, username: str) -> None:
+        self._append({"op": OPERATION_DELETE_USER, "username": username})
+
+    def compact(self) -> None:
+        with self.locks.hold(LOCK_NAME), self._lock:
+            self._reload_if_changed()
+            write_atomically(self.path(), json.dumps(self._users).encode("UTF-8"))
+            if os.path.exists(self.journal_path()):
+                os.remove(self.journal_path())
+            self._stamp = self._current_stamp()
+
+    def path(self) -> str:
+        return os.path.join(".", self.data_folder, USERS_FILENAME)
+
+    def journal_path(self) -> str:
+        return os.path.join(".", self.data_folder, JOURNAL_FILENAME)
+
+    def _append(self, record: Dict) -> None:
+        with self.locks.hold(LOCK_NAME):
+            with self._lock:
+                self._reload_if_changed()
+                append_line(self.journal_path(), (json.dumps(record) + "\n").encode("UTF-8"))
+                self._apply(self._users, record)
+                self._stamp = self._current_stamp()
+                journal_size = os.path.getsize(self.journal_path())
+            if journal_size > self.compaction_threshold_bytes:
+                self.compact()
+
+    def _reload_if_changed(self) -> None:
+        # called with `_lock` held
+        stamp = self._current_stamp()
+        if stamp == self._stamp:
+            return
+        with open(self.path()) as file:
+            users = json.load(file)  # type: Dict[str, Dict]
+        if os.path.exists(self.journal_path()):
+            with open(self.journal_path()) as journal_file:
+                journal = journal_file.read()
+            # only complete lines, a crash while appending can leave the last one cut
+            for line in journal.split("\n")[:-1]:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # cut by a crash before `append_line` dropped cut lines
+                    continue
+                self._apply(users, record)
+        self._users = users
+        self._stamp = stamp
+
+    def _current_stamp(self) -> FileStamp:
+        journal_path = self.journal_path()
+        return file_stamp(os.stat(self.path())) + (
+            file_stamp(os.stat(journal_path)) if os.path.exists(journal_path) else NO_FILE_STAMP
+        )
+
+    @staticmethod
+    def _apply(users: Dict[str, Dict], record: Dict) -> None:
+        if record["op"] == OPERATION_SET_USER:
+            users[record["user"]["username"]] = record["user"]
+        elif record["op"] == OPERATION_DELETE_USER:
+            users.pop(record["username"], None)
+        else:
+            raise ValueError("Unknown users journal operation '{}'".format(record["op"]))
+
+
+_stores = {}  # type: Dict[str, UserStore]
+_stores_lock = threading.Lock()
+
+
+def get_user_store(data_folder: str) -> UserStore:
+    """
+    Process-wide store of `data_folder`, so its users are only parsed again when the files change.
+    """
+    with _stores_lock:
+        if data_folder not in _stores:
+            _stores[data_folder] = UserStore(data_folder)
+        return _stores[data_folder]
@@ -1,17 +1,88 @@
 from enum import Enum
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from functools import cached_property
-from typing import Callable
+from typing import Callable, Dict, Sequence
 from typing import List, Optional, Tuple, cast  # noqa: F401
 
-from flask import abort, current_app, render_template, request
+from flask import abort, current_app, get_template_attribute, make_response, render_template, request
 from werkzeug.wrappers import Response
 
 from flask_calendar import constants
 from flask_calendar import app_utils
 from flask_calendar.calendar_data import CalendarData
+from flask_calendar.calendar_schema import Task
 from flask_calendar.gregorian_calendar import GregorianCalendar
 
+# days of the largest grid, a month of six weeks
+MAX_DAY_CELLS = 42
+
+
+def tasks_by_day(
+    calendar_data: CalendarData,
+    data: Dict,
+    calendar_id: str,
+    days: Sequence[date],
+    view_past_tasks: bool,
+    requested_date: Tuple[int, int, int],
+) -> Dict[date, List[Task]]:
+    """
+    Tasks of each day, sorted by start time, so templates only have to iterate them. Unless `view_past_tasks`, days
+    before the (day, month, year) `requested_date` of the view have none.
+    """
+    # days are hidden relative to the date the view shows, not to today
+    first_shown_day = tuple(reversed(requested_date))
+
+    day_tasks = {}  # type: Dict[date, List[Task]]
+    # tasks are keyed by month, so days of different years are looked up separately
+    for year in sorted(set(day.year for day in days)):
+        year_days = [day for day in days if day.year == year]
+        tasks = calendar_data.tasks_from_calendar(year_days, data)
+        tasks = calendar_data.add_repetitive_tasks_from_calendar(year_days, data, tasks, calendar_id=calendar_id)
+        for day in year_days:
+            if not view_past_tasks and (day.year, day.month, day.day) < first_shown_day:
+                day_tasks[day] = []
+            else:
+                day_tasks[day] = sorted(
+                    tasks.get(str(day.month), {}).get(str(day.day), []), key=lambda task: task["start_time"]
+                )
+    return day_tasks
+
+
+def day_cells(
+    calendar_id: str, days: Sequence[date], view_type: "ViewType", requested_date: Tuple[int, int, int]
+) -> Dict[str, str]:
+    """
+    HTML of the cells of `days` as the `view_type` view of `requested_date` (day, month, year) renders them, by ISO
+    date, so pages can replace the cells a change touched instead of reloading.
+    """
+    calendar_data = app_utils.get_calendar_data()
+    try:
+        data = calendar_data.load_calendar(calendar_id)
+    except FileNotFoundError:
+        abort(404)
+    current_day, current_month, current_year = GregorianCalendar.current_date()
+    day_tasks = tasks_by_day(calendar_data, data, calendar_id, days, view_past_tasks(), requested_date)
+    day_cell = get_template_attribute("day_cell.html", "day_cell")
+    return {
+        day.isoformat(): str(
+            day_cell(
+                day,
+                day_tasks[day],
+                requested_date[1],
+                calendar_id,
+                (current_year, current_month, current_day),
+                daily=view_type == ViewType.Daily,
+            )
+        )
+        for day in days
+    }
+
+
+def view_past_tasks() -> bool:
+    if current_app.config["HIDE_PAST_TASKS"]:
+        return False
+    return request.cookies.get("ViewPastTasks", "1") == "1"
+
 
 class CalendarView:
     previous_link: Callable
@@ -21,9 +92,13 @@ class CalendarView:
 
     def __init__(self, calendar_id: str) -> None:
         self.calendar_id = calendar_id
-        self.calendar_data = CalendarData(current_app.config["DATA_FOLDER"], current_app.config["WEEK_STARTING_DAY"])
+        self.calendar_data = app_utils.get_calendar_data()
+
+    @cached_property
+    def data(self) -> Dict:
+        # only loaded when rendering, a revalidated page doesn't need it
         try:
-            self.data = self.calendar_data.load_calendar(calendar_id)
+            return self.calendar_data.load_calendar(self.calendar_id)
         except FileNotFoundError:
             abort(404)
 
@@ -31,7 +106,7 @@ class CalendarView:
     def current_date(self):
         return GregorianCalendar.current_date()
 
-    @property
+    @cached_property
     def requested_date(self):
         current_day, current_month, current_year = self.current_date
 
@@ -42,22 +117,48 @@ class CalendarView:
         day = int(request.args.get("d", current_day))
         return day, month, year
 
-    def render(self, view_past_tasks: bool, weekdays_headers: list):
-        current_day, current_month, current_year = self.current_date
-        day, month, year = self.requested_date
-
-        tasks = self.calendar_data.tasks_from_calendar(
-            self.iterdays(self.requested_date),
-            self.data,
+    @cached_property
+    def days(self) -> List[date]:
+        """
+        Day grid of the view, computed once per render.
+        """
+        return [date(day.year, day.month, day.day) for day in self.iterdays(self.requested_date)]
+
+    def day_tasks(self, view_past_tasks: bool) -> Dict[date, List[Task]]:
+        return tasks_by_day(
+            self.calendar_data, self.data, self.calendar_id, self.days, view_past_tasks, self.requested_date
         )
-        tasks = self.calendar_data.add_repetitive_tasks_from_calendar(
-            self.iterdays(self.requested_date),
-            self.data,
-            tasks,
+
+    def etag(self, view_past_tasks: bool, weekdays_headers: list) -> str:
+        """
+        Strong validator of the rendered page: changes with the calendar and with anything else the render depends on.
+        """
+        try:
+            revision = self.calendar_data.calendar_revision(self.calendar_id)
+        except FileNotFoundError:
+            abort(404)
+        config = current_app.config
+        key = (
+            self.template,
+            # pages rendered by an earlier deploy
+            current_app.extensions["templates_digest"],
+            self.calendar_id,
+            revision,
+            self.requested_date,
+            self.current_date,
+            view_past_tasks,
+            weekdays_headers,
+            self.calendar_data.first_weekday,
+            config["BASE_URL"],
+            config["SHOW_VIEW_PAST_BUTTON"],
+            config["AUTO_DECORATE_TASK_DETAILS_HYPERLINK"],
+            config["FEATURE_FLAG_CHANGE_FEED"],
         )
+        return app_utils.strong_etag(key)
 
-        if not view_past_tasks:
-            self.calendar_data.hide_past_tasks(self.iterdays(self.requested_date), self.requested_date, tasks)
+    def render(self, view_past_tasks: bool, weekdays_headers: list):
+        current_day, current_month, current_year = self.current_date
+        day, month, year = self.requested_date
 
         return cast(
             Response,
@@ -67,17 +168,19 @@ class CalendarView:
                 year=year,
                 month=month,
                 defaultday=self.defaultday,
+                requested_day=day,
                 current_year=current_year,
                 current_month=current_month,
                 current_day=current_day,
                 future_months=list(self.calendar_data.gregorian_calendar.next_12_months(current_year, current_month)),
-                month_days=self.iterdays(self.requested_date),
+                month_days=self.days,
                 previous_link=self.previous_link,
                 next_link=self.next_link,
                 base_url=current_app.config["BASE_URL"],
-                tasks=tasks,
+                day_tasks=self.day_tasks(view_past_tasks),
                 display_view_past_button=current_app.config["SHOW_VIEW_PAST_BUTTON"],
                 weekdays_headers=weekdays_headers,
+                change_feed=current_app.config["FEATURE_FLAG_CHANGE_FEED"],
             ),
         )
 
@@ -87,12 +190,12 @@ class MonthlyView(CalendarView):
 
     @property
     def previous_link(self):
-        (_, month, year) = self.requested_date
+        _, month, year = self.requested_date
         return app_utils.previous_month_link(year, month)
 
     @property
     def next_link(self):
-        (_, month, year) = self.requested_date
+        _, month, year = self.requested_date
         return app_utils.next_month_link(year, month)
 
     @property
@@ -105,8 +208,8 @@ class MonthlyView(CalendarView):
 
     def iterdays(self, current_date):
         def iterr():
-            (_, month, year) = current_date
-            for date in self.calendar_data.gregorian_calendar.month_days(year, month):
+            _, month, year = current_date
+            for date in self.calendar_data.gregorian_calendar.month_days(year, month, self.calendar_data.first_weekday):
                 yield date
 
         return iterr()
@@ -130,14 +233,16 @@ class WeeklyView(CalendarView):
     @property
     def defaultday(self):
         _, month, _ = self.requested_date
-        for day in self.iterdays(self.requested_date):
+        for day in self.days:
             if month == day.month:
                 return day.day
 
     def iterdays(self, current_date):
         def iterr():
-            (day, month, year) = current_date
-            for date in self.calendar_data.gregorian_calendar.week_days(year, month, day):
+            day, month, year = current_date
+            for date in self.calendar_data.gregorian_calendar.week_days(
+                year, month, day, self.calendar_data.first_weekday
+            ):
                 yield date
 
         return iterr()
@@ -180,15 +285,19 @@ VIEWS = {ViewType.Daily: DailyView, ViewType.Weekly: WeeklyView, ViewType.Monthl
 
 
 def fetch(calendar_id, view_type: ViewType):
-    if current_app.config["HIDE_PAST_TASKS"]:
-        view_past_tasks = False
-    else:
-        view_past_tasks = request.cookies.get("ViewPastTasks", "1") == "1"
-
     if current_app.config["WEEK_STARTING_DAY"] == constants.WEEK_START_DAY_MONDAY:
         weekdays_headers = ["MON", "TUE", "WED", "THU", "FRI", "SAT", "SUN"]
     else:
         weekdays_headers = ["SUN", "MON", "TUE", "WED", "THU", "FRI", "SAT"]
 
     view = VIEWS[view_type](calendar_id)
-    return view.render(view_past_tasks, weekdays_headers)
+    past_tasks = view_past_tasks()
+    etag = view.etag(past_tasks, weekdays_headers)
+    if request.if_none_match.contains(etag):
+        response = make_response("", 304)
+    else:
+        response = make_response(view.render(past_tasks, weekdays_headers))
+    response.set_etag(etag)
+    # pages are per user and must be revalidated, as they change with the calendar
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
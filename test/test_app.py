@@ -1,6 +1,15 @@
+import gzip
+import json
+import os
+import shutil
+from typing import Dict, cast
+from unittest.mock import call, patch
+
 import pytest
 from flask.testing import FlaskClient
+from werkzeug.test import TestResponse as Response
 
+from flask_calendar.app import create_app
 from flask_calendar.constants import SESSION_ID
 
 
@@ -50,3 +59,296 @@ def test_redirects_to_calendar_when_logged_in(client: FlaskClient) -> None:
     response = client.get("/")
     assert response.status_code == 302
     assert response.headers["Location"] in ["http://localhost/sample/", "/sample/"]
+
+
+@pytest.mark.parametrize("session_store", ("filesystem", "sqlite"))
+def test_session_is_valid_in_other_processes(tmp_path: str, session_store: str) -> None:
+    config = {
+        "TESTING": True,
+        "SESSION_STORE": session_store,
+        "SESSIONS_FOLDER": os.path.join(tmp_path, "sessions"),
+        "SESSIONS_DATABASE_PATH": os.path.join(tmp_path, "sessions.sqlite"),
+    }
+    client = create_app(config).test_client()
+    client.post("/do_login", data=dict(username="a_username", password="a_password"))
+    cookie = client.get_cookie(SESSION_ID)
+    assert cookie is not None
+
+    other_process_client = create_app(config).test_client()
+    other_process_client.set_cookie(SESSION_ID, cookie.value)
+    response = other_process_client.get("/")
+    assert response.headers["Location"] in ["http://localhost/sample/", "/sample/"]
+
+
+def test_login_rejected_with_retry_after_while_throttled(client: FlaskClient) -> None:
+    client.post("/do_login", data=dict(username="a_username", password="wrong_password"))
+
+    response = client.post("/do_login", data=dict(username="a_username", password="a_password"))
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) > 0
+    assert client.get_cookie(SESSION_ID) is None
+
+
+def test_calendar_is_loaded_once_per_request(tmp_path: str) -> None:
+    shutil.copy(os.path.join("test", "fixtures", "sample_data_file.json"), os.path.join(tmp_path, "sample.json"))
+    app = create_app({"TESTING": True, "DATA_FOLDER": str(tmp_path)})
+    client = app.test_client()
+    client.post("/do_login", data=dict(username="a_username", password="a_password"))
+    storage = app.extensions["calendar_storage"]
+
+    with patch.object(storage, "load", wraps=storage.load) as load:
+        response = client.get("/sample/2017/12/25/1/")
+    assert response.status_code == 200
+    # by `authorized`, then reused by the action
+    assert load.call_args_list == [call("sample", use_cache=True)]
+
+    with patch.object(storage, "load", wraps=storage.load) as load:
+        response = client.delete("/sample/2017/12/25/1/")
+    assert response.status_code == 200
+    # the change is applied over a copy of the document loaded by `authorized`, only the version check of the save
+    # reads the file again
+    assert load.call_args_list == [call("sample", use_cache=True), call("sample", use_cache=False)]
+    assert [task["id"] for task in storage.load("sample")["tasks"]["normal"]["2017"]["12"]["25"]] == [0]
+
+
+# past tasks are the ones before the requested day, even of past months (like the baseline `hide_past_tasks`)
+@pytest.mark.parametrize(
+    ("hide_past_tasks", "requested_day", "shown"), ((False, 26, True), (True, 26, False), (True, 25, True))
+)
+def test_calendar_days_list_their_tasks_by_start_time(
+    tmp_path: str, hide_past_tasks: bool, requested_day: int, shown: bool
+) -> None:
+    with open(os.path.join("test", "fixtures", "sample_data_file.json")) as file:
+        data = json.load(file)
+    # stored after a task starting later
+    data["tasks"]["normal"]["2017"]["12"]["25"].reverse()
+    with open(os.path.join(tmp_path, "sample.json"), "w") as file:
+        json.dump(data, file)
+    app = create_app({"TESTING": True, "DATA_FOLDER": str(tmp_path), "HIDE_PAST_TASKS": hide_past_tasks})
+    client = app.test_client()
+    client.post("/do_login", data=dict(username="a_username", password="a_password"))
+
+    response = client.get("/sample/?y=2017&m=12&d={}".format(requested_day))
+    assert response.status_code == 200
+    page = response.get_data(as_text=True)
+    assert ("Task title" in page) is shown
+    if shown:
+        assert page.index("Task title") < page.index("Task #2")
+
+
+def test_unchanged_calendar_views_are_not_rendered_again(tmp_path: str) -> None:
+    shutil.copy(os.path.join("test", "fixtures", "sample_data_file.json"), os.path.join(tmp_path, "sample.json"))
+    app = create_app({"TESTING": True, "DATA_FOLDER": str(tmp_path)})
+    client = app.test_client()
+    client.post("/do_login", data=dict(username="a_username", password="a_password"))
+
+    response = client.get("/sample/?y=2017&m=12")
+    assert response.status_code == 200
+    assert response.headers["Cache-Control"] == "private, no-cache"
+    etag = response.headers["ETag"]
+
+    with patch("flask_calendar.view.render_template") as render_template:
+        response = client.get("/sample/?y=2017&m=12", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    render_template.assert_not_called()
+
+    assert client.get("/sample/?y=2017&m=11", headers={"If-None-Match": etag}).status_code == 200
+    client.set_cookie("ViewPastTasks", "0")
+    assert client.get("/sample/?y=2017&m=12", headers={"If-None-Match": etag}).status_code == 200
+    client.set_cookie("ViewPastTasks", "1")
+    assert client.get("/sample/?y=2017&m=12", headers={"If-None-Match": etag}).status_code == 304
+
+    # a deploy changing the templates
+    templates_digest = app.extensions["templates_digest"]
+    app.extensions["templates_digest"] = "another digest"
+    assert client.get("/sample/?y=2017&m=12", headers={"If-None-Match": etag}).status_code == 200
+    app.extensions["templates_digest"] = templates_digest
+
+    client.delete("/sample/2017/12/25/1/")
+    response = client.get("/sample/?y=2017&m=12", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_ics_export(tmp_path: str) -> None:
+    shutil.copy(os.path.join("test", "fixtures", "sample_data_file.json"), os.path.join(tmp_path, "sample.json"))
+    app = create_app({"TESTING": True, "DATA_FOLDER": str(tmp_path), "FEATURE_FLAG_ICAL_EXPORT": True})
+    client = app.test_client()
+
+    assert client.get("/sample/ics?key=a_wrong_key").status_code == 403
+    assert client.get("/missing/ics?key=an_ics_key").status_code == 404
+
+    response = client.get("/sample/ics?key=an_ics_key")
+    assert response.status_code == 200
+    assert response.mimetype == "text/calendar"
+    assert response.get_data(as_text=True).count("BEGIN:VEVENT") >= 4
+    etag = response.headers["ETag"]
+    assert client.get("/sample/ics?key=an_ics_key", headers={"If-None-Match": etag}).status_code == 304
+
+    app.config["FEATURE_FLAG_ICAL_EXPORT"] = False
+    assert client.get("/sample/ics?key=an_ics_key").status_code == 404
+
+
+def test_api_tasks(tmp_path: str) -> None:
+    shutil.copy(os.path.join("test", "fixtures", "sample_data_file.json"), os.path.join(tmp_path, "sample.json"))
+    app = create_app({"TESTING": True, "DATA_FOLDER": str(tmp_path)})
+    client = app.test_client()
+    client.post("/do_login", data=dict(username="a_username", password="a_password"))
+
+    response = client.get("/sample/api/tasks?from=2017-12-24&to=2017-12-25")
+    assert response.status_code == 200
+    payload = json.loads(response.get_data())
+    assert (payload["from"], payload["to"]) == ("2017-12-24", "2017-12-25")
+    assert [(task["id"], task["title"]) for task in payload["days"]["2017-12-25"]] == [
+        (0, "Task title"),
+        (1, "Task #2"),
+        (0, "Repetitive weekly weekday"),
+    ]
+    assert payload["days"]["2017-12-25"][2]["repetition_type"] == "w"
+    assert list(payload["days"]) == ["2017-12-25"]
+    etag = response.headers["ETag"]
+    assert (
+        client.get("/sample/api/tasks?from=2017-12-24&to=2017-12-25", headers={"If-None-Match": etag}).status_code
+        == 304
+    )
+
+    gzipped = client.get("/sample/api/tasks?from=2017-12-24&to=2017-12-25", headers={"Accept-Encoding": "gzip"})
+    assert gzipped.headers["Content-Encoding"] == "gzip"
+    assert gzipped.headers["ETag"] != etag
+    assert json.loads(gzip.decompress(gzipped.get_data())) == payload
+
+    assert client.get("/sample/api/tasks?from=2017-12-25&to=2017-12-24").status_code == 400
+    assert client.get("/sample/api/tasks?from=2017-01-01&to=2018-12-31").status_code == 400
+    assert client.get("/sample/api/tasks?from=2017-12-24").status_code == 400
+
+
+def day_cells(response: Response) -> Dict[str, str]:
+    return cast(Dict[str, str], json.loads(response.get_data())["cells"])
+
+
+def test_day_cells(tmp_path: str) -> None:
+    shutil.copy(os.path.join("test", "fixtures", "sample_data_file.json"), os.path.join(tmp_path, "sample.json"))
+    app = create_app({"TESTING": True, "DATA_FOLDER": str(tmp_path)})
+    client = app.test_client()
+    client.post("/do_login", data=dict(username="a_username", password="a_password"))
+
+    cells = day_cells(client.get("/sample/day_cells?days=2017-12-25,2017-12-26&month=12"))
+    assert list(cells) == ["2017-12-25", "2017-12-26"]
+    assert cells["2017-12-25"].index("Task title") < cells["2017-12-25"].index("Task #2")
+    assert 'class="accordion-hidden"' in cells["2017-12-25"]
+    assert "Task title" not in cells["2017-12-26"]
+    daily_cells = day_cells(client.get("/sample/day_cells?days=2017-12-25&view=daily"))
+    assert 'class="accordion-visible"' in daily_cells["2017-12-25"]
+    assert client.get("/sample/day_cells?days=2017-12-32").status_code == 400
+
+    # changes send back the cells they changed when asked to
+    assert client.put("/sample/2017/12/25/1/", data="26").json == {}
+    cells = day_cells(client.put("/sample/2017/12/26/1/?cells=1&month=12", data="27"))
+    assert list(cells) == ["2017-12-26", "2017-12-27"]
+    assert "Task #2" in cells["2017-12-27"] and "Task #2" not in cells["2017-12-26"]
+
+    cells = day_cells(client.delete("/sample/2017/12/27/1/?cells=1"))
+    assert "Task #2" not in cells["2017-12-27"]
+    cells = day_cells(client.post("/sample/2017/12/25/0/hide/?cells=1"))
+    assert "Repetitive weekly weekday" not in cells["2017-12-25"]
+    # a repetitive task changes every day it happens on
+    assert client.delete("/sample/2017/12/18/0/?cells=1").json == {}
+
+
+def test_change_feed_events(tmp_path: str) -> None:
+    shutil.copy(os.path.join("test", "fixtures", "sample_data_file.json"), os.path.join(tmp_path, "sample.json"))
+    app = create_app({"TESTING": True, "DATA_FOLDER": str(tmp_path)})
+    client = app.test_client()
+    client.post("/do_login", data=dict(username="a_username", password="a_password"))
+    assert client.get("/sample/events").status_code == 404
+
+    app = create_app(
+        {
+            "TESTING": True,
+            "DATA_FOLDER": str(tmp_path),
+            "FEATURE_FLAG_CHANGE_FEED": True,
+            "CHANGE_FEED_STREAM_SECONDS": 0,
+        }
+    )
+    client = app.test_client()
+    client.post("/do_login", data=dict(username="a_username", password="a_password"))
+    assert "new EventSource(" in client.get("/sample/?y=2017&m=12").get_data(as_text=True)
+
+    client.put("/sample/2017/12/25/1/", data="26")
+    client.post("/sample/2017/12/25/0/hide/")
+    client.delete("/sample/2017/12/18/0/")
+    response = client.get("/sample/events", headers={"Last-Event-ID": "0"})
+    assert response.mimetype == "text/event-stream"
+    changes = [
+        json.loads(line[len("data: ") :])
+        for line in response.get_data(as_text=True).splitlines()
+        if line.startswith("data: {")
+    ]
+    assert [(change["op"], change["days"], change["repeats"]) for change in changes] == [
+        ("moved", ["2017-12-25", "2017-12-26"], False),
+        ("hidden", ["2017-12-25"], False),
+        ("deleted", ["2017-12-18"], True),
+    ]
+
+
+def test_api_changes(tmp_path: str) -> None:
+    shutil.copy(os.path.join("test", "fixtures", "sample_data_file.json"), os.path.join(tmp_path, "sample.json"))
+    app = create_app({"TESTING": True, "DATA_FOLDER": str(tmp_path)})
+    client = app.test_client()
+    client.post("/do_login", data=dict(username="a_username", password="a_password"))
+    assert client.get("/sample/api/changes").status_code == 404
+
+    app = create_app({"TESTING": True, "DATA_FOLDER": str(tmp_path), "FEATURE_FLAG_SYNC_API": True})
+    client = app.test_client()
+    client.post("/do_login", data=dict(username="a_username", password="a_password"))
+    token = json.loads(client.get("/sample/api/changes").get_data())["token"]
+    assert token == "0"
+
+    client.put("/sample/2017/12/25/1/", data="26")
+    client.put("/sample/2017/12/26/1/", data="27")
+    client.delete("/sample/2017/12/25/0/")
+    changes = json.loads(client.get("/sample/api/changes?since={}".format(token)).get_data())
+    assert [(change["date"], change["task"]["title"]) for change in changes["tasks"]] == [("2017-12-27", "Task #2")]
+    assert changes["removed"] == [0]
+    assert changes["token"] == "3"
+
+    changes = json.loads(client.get("/sample/api/changes?since=3").get_data())
+    assert changes == {"tasks": [], "repetitive_tasks": [], "removed": [], "token": "3"}
+    assert client.get("/sample/api/changes?since=4").status_code == 410
+    assert client.get("/sample/api/changes?since=a_token").status_code == 400
+
+
+@pytest.mark.parametrize(
+    "bounds",
+    [
+        {"starts_on": "2017-12-10", "until": "2017-12-01"},
+        {"count": "500000"},
+    ],
+)
+def test_invalid_tasks_are_rejected(tmp_path: str, bounds: Dict) -> None:
+    shutil.copy(os.path.join("test", "fixtures", "sample_data_file.json"), os.path.join(tmp_path, "sample.json"))
+    app = create_app({"TESTING": True, "DATA_FOLDER": str(tmp_path)})
+    client = app.test_client()
+    client.post("/do_login", data=dict(username="a_username", password="a_password"))
+    form = dict(
+        title="an updated title",
+        date="2017-12-25",
+        enddate="2017-12-25",
+        start_time="00:00",
+        details="",
+        color="#000",
+        repeats="1",
+        repetition_type="w",
+        repetition_subtype="w",
+        repetition_value="0",
+        **bounds,
+    )
+
+    assert client.post("/sample/2017/12/25/task/1", data=form).status_code == 400
+    response = client.get("/sample/api/tasks?from=2017-12-25&to=2017-12-25")
+    assert "Task #2" in [task["title"] for task in json.loads(response.get_data())["days"]["2017-12-25"]]
+
+    assert client.post("/sample/new_task", data=form).status_code == 400
+    response = client.get("/sample/api/tasks?from=2017-12-01&to=2017-12-31")
+    assert "an updated title" not in response.get_data(as_text=True)
@@ -1,6 +1,17 @@
+import os
+from typing import Optional
+
 import pytest
 from flask import Flask
-from flask_calendar.app_utils import task_details_for_markup
+from flask_calendar.app_utils import (
+    DECORATED_URL_FORMAT,
+    decorate_task_details,
+    details_markup_to_store,
+    task_details_for_markup,
+    task_markup,
+    templates_digest,
+)
+from flask_calendar.calendar_schema import Task
 
 SOURCE_STRING_PLACEHOLDER = "pre {} post"
 EXPECTED_STRING_PLACEHOLDER = 'pre <a href="{}" target="_blank">{}</a> post'
@@ -43,3 +54,55 @@ def test_unsupported_task_details_for_markup(app: Flask, url: str, description:
         expected = EXPECTED_STRING_PLACEHOLDER.format(url, url)
         actual = task_details_for_markup(SOURCE_STRING_PLACEHOLDER.format(url))
         assert expected != actual
+
+
+def test_task_details_markup_is_memoized(app: Flask) -> None:
+    details = SOURCE_STRING_PLACEHOLDER.format("http://memo.test")
+    with app.app_context():
+        task_details_for_markup(details)
+        hits = decorate_task_details.cache_info().hits
+        task_details_for_markup(details)
+        assert decorate_task_details.cache_info().hits == hits + 1
+
+
+def test_task_markup_prefers_stored_markup(app: Flask) -> None:
+    task = Task(
+        id=1,
+        color="",
+        start_time="00:00",
+        end_time="00:00",
+        is_all_day=True,
+        title="",
+        details="http://test.test",
+        details_markup="stored",
+    )
+    with app.app_context():
+        assert task_markup(task) == "stored"
+        app.config["AUTO_DECORATE_TASK_DETAILS_HYPERLINK"] = False
+        assert task_markup(task) == "http://test.test"
+
+
+@pytest.mark.parametrize(
+    "store, details, expected",
+    [
+        (True, "http://test.test", DECORATED_URL_FORMAT.format("http://test.test", "http://test.test")),
+        (True, "no links", None),
+        (False, "http://test.test", None),
+    ],
+)
+def test_details_markup_to_store(app: Flask, store: bool, details: str, expected: Optional[str]) -> None:
+    app.config["STORE_TASK_DETAILS_MARKUP"] = store
+    with app.app_context():
+        assert details_markup_to_store(details) == expected
+
+
+def test_templates_digest_changes_with_the_templates(tmp_path: str) -> None:
+    os.mkdir(os.path.join(tmp_path, "partials"))
+    with open(os.path.join(tmp_path, "partials", "cell.html"), "w") as file:
+        file.write("<li>{{ day }}</li>")
+    digest = templates_digest(str(tmp_path))
+    assert templates_digest(str(tmp_path)) == digest
+
+    with open(os.path.join(tmp_path, "partials", "cell.html"), "w") as file:
+        file.write("<li class='day'>{{ day }}</li>")
+    assert templates_digest(str(tmp_path)) != digest
@@ -1,3 +1,6 @@
+import os
+import shutil
+
 import pytest
 from flask_calendar.authentication import Authentication
 
@@ -7,7 +10,7 @@ CORRECT_PASSWORD = "a_password"
 
 @pytest.fixture
 def authentication() -> Authentication:
-    return Authentication(data_folder="test/fixtures", password_salt="a test salt", failed_login_delay_base=0,)
+    return Authentication(data_folder="test/fixtures", password_salt="a test salt")
 
 
 @pytest.mark.parametrize(
@@ -34,3 +37,16 @@ def test_password_is_not_stored_plain(authentication: Authentication) -> None:
     user = authentication.user_data(username=EXISTING_USERNAME)
     assert user["password"] != CORRECT_PASSWORD
     assert user["password"] == authentication._hash_password(CORRECT_PASSWORD)
+
+
+def test_added_and_deleted_users(tmp_path: str) -> None:
+    shutil.copy(os.path.join("test", "fixtures", "users.json"), str(tmp_path))
+    authentication = Authentication(data_folder=str(tmp_path), password_salt="a test salt")
+
+    authentication.add_user("another_username", "another_password", default_calendar="sample")
+    assert authentication.is_valid("another_username", "another_password")
+    with pytest.raises(ValueError):
+        authentication.add_user("another_username", "another_password", default_calendar="sample")
+
+    authentication.delete_user("another_username")
+    assert not authentication.is_valid("another_username", "another_password")
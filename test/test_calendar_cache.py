@@ -0,0 +1,81 @@
+import os
+import shutil
+from typing import Dict
+
+import pytest
+from flask_calendar.calendar_cache import CalendarCache, cache
+from flask_calendar.calendar_data import CalendarData
+from flask_calendar.calendar_schema import encode_calendar
+
+
+@pytest.fixture
+def calendar_data(tmp_path: str) -> CalendarData:
+    cache.clear()
+    shutil.copy(os.path.join("test", "fixtures", "sample_data_file.json"), os.path.join(tmp_path, "a_calendar.json"))
+    return CalendarData(str(tmp_path))
+
+
+def test_second_load_is_served_from_cache(calendar_data: CalendarData) -> None:
+    hits_before = cache.hits
+
+    first = calendar_data.load_calendar("a_calendar")
+    second = calendar_data.load_calendar("a_calendar")
+
+    assert first is second
+    assert cache.hits == hits_before + 1
+
+
+def test_changed_file_is_decoded_again(calendar_data: CalendarData, tmp_path: str) -> None:
+    first = calendar_data.load_calendar("a_calendar")
+
+    changed = dict(first)
+    changed["name"] = "a changed name"
+    with open(os.path.join(tmp_path, "a_calendar.json"), "wb") as file:
+        file.write(encode_calendar(changed))
+
+    second = calendar_data.load_calendar("a_calendar")
+    assert second is not first
+    assert second["name"] == "a changed name"
+
+
+def test_uncached_load_returns_a_private_copy(calendar_data: CalendarData) -> None:
+    cached = calendar_data.load_calendar("a_calendar")
+    uncached = calendar_data.load_calendar("a_calendar", use_cache=False)
+
+    assert uncached is not cached
+    assert uncached == cached
+
+
+def test_read_helpers_dont_modify_cached_data(calendar_data: CalendarData) -> None:
+    data = calendar_data.load_calendar("a_calendar")
+    original = encode_calendar(data)
+
+    tasks = calendar_data.tasks_from_calendar(calendar_data.gregorian_calendar.month_days(2017, 11), data)
+    calendar_data.add_repetitive_tasks_from_calendar(calendar_data.gregorian_calendar.month_days(2017, 11), data, tasks)
+    calendar_data.task_from_calendar(calendar_id="a_calendar", year=2017, month=11, day=6, task_id=4)
+
+    assert encode_calendar(data) == original
+
+
+def test_least_recently_used_entries_are_evicted_over_budget() -> None:
+    lru = CalendarCache(max_bytes=10)
+    lru.put("a", (1, 1, 4), {"a": 1})
+    lru.put("b", (2, 1, 4), {"b": 1})
+    assert lru.get("a", (1, 1, 4)) is not None
+
+    lru.put("c", (3, 1, 4), {"c": 1})
+
+    assert lru.get("b", (2, 1, 4)) is None
+    assert lru.get("a", (1, 1, 4)) is not None
+    assert lru.get("c", (3, 1, 4)) is not None
+    stats = lru.stats()  # type: Dict
+    assert stats["evictions"] == 1
+    assert stats["bytes"] == 8
+
+
+def test_stale_stamp_is_a_miss() -> None:
+    lru = CalendarCache()
+    lru.put("a", (1, 1, 4), {"a": 1})
+
+    assert lru.get("a", (1, 2, 4)) is None
+    assert lru.misses == 1
@@ -261,3 +261,55 @@ def test_existing_repetitive_task_retrieval(calendar_data: CalendarData) -> None
 def test_non_existing_repetitive_task_retrieval(calendar_data: CalendarData) -> None:
     with pytest.raises(IndexError):
         calendar_data.repetitive_task_from_calendar(calendar_id="sample_data_file", year=2017, month=11, task_id=111)
+
+
+@patch("flask_calendar.calendar_data.CalendarData._save_calendar")
+def test_creates_multiple_tasks_with_a_single_save(save_calendar_mock: MagicMock, calendar_data: CalendarData) -> None:
+    calendar_id = "sample_empty_data_file"
+    dates = [(2017, 12, 30), (2017, 12, 31), (2018, 1, 1)]
+
+    result = calendar_data.create_tasks(
+        calendar_id=calendar_id,
+        dates=dates,
+        title="an irrelevant title",
+        is_all_day=True,
+        start_time="00:00",
+        details="",
+        color="an_irrelevant_color",
+        has_repetition=False,
+        repetition_type="",
+        repetition_subtype="",
+        repetition_value=0,
+    )
+    assert result is True
+
+    save_calendar_mock.assert_called_once_with(ANY, filename=calendar_id)
+    call_args, _ = save_calendar_mock.call_args
+    data = call_args[0]
+    task_ids = set()
+    for year, month, day in dates:
+        day_tasks = data["tasks"]["normal"][str(year)][str(month)][str(day)]
+        assert len(day_tasks) == 1
+        task_ids.add(day_tasks[0]["id"])
+    assert len(task_ids) == len(dates)
+
+
+@patch("flask_calendar.calendar_data.CalendarData._save_calendar")
+def test_doesnt_create_any_task_if_a_date_is_missing(
+    save_calendar_mock: MagicMock, calendar_data: CalendarData
+) -> None:
+    result = calendar_data.create_tasks(
+        calendar_id="sample_empty_data_file",
+        dates=[(2017, 12, 30), (None, None, None)],
+        title="an irrelevant title",
+        is_all_day=True,
+        start_time="00:00",
+        details="",
+        color="an_irrelevant_color",
+        has_repetition=False,
+        repetition_type="",
+        repetition_subtype="",
+        repetition_value=0,
+    )
+    assert result is False
+    save_calendar_mock.assert_not_called()
@@ -0,0 +1,55 @@
+import pytest
+from flask_calendar.calendar_schema import (
+    RepetitiveTask,
+    Task,
+    decode_calendar,
+    decode_task,
+    encode_calendar,
+    encode_task,
+    to_task,
+)
+
+
+def a_task() -> Task:
+    return Task(
+        id=1,
+        color="an_irrelevant_color",
+        start_time="00:00",
+        end_time="00:00",
+        is_all_day=True,
+        title="an irrelevant title",
+        details="&nbsp;",
+    )
+
+
+def test_decodes_sample_calendar() -> None:
+    with open("test/fixtures/sample_data_file.json", "rb") as file:
+        data = decode_calendar(file.read())
+
+    assert type(data) == dict
+    assert data["users"] == ["a_username"]
+    assert all(isinstance(task, RepetitiveTask) for task in data["tasks"]["repetition"])
+    assert decode_calendar(encode_calendar(data)) == data
+
+
+def test_tasks_can_be_read_like_dicts() -> None:
+    task = a_task()
+
+    assert task["title"] == "an irrelevant title"
+    assert task.get("travel_to") is None
+    assert "repetition_type" not in task
+    assert dict(task)["id"] == 1
+    with pytest.raises(KeyError):
+        task["an_irrelevant_key"]
+
+
+def test_task_roundtrip() -> None:
+    task = a_task()
+
+    assert decode_task(encode_task(task), repeats=False) == task
+    assert to_task(dict(task)) == task
+
+
+def test_invalid_calendar_raises_value_error() -> None:
+    with pytest.raises(ValueError):
+        decode_calendar(b'{"users": [], "tasks": {"normal": {}, "repetition": [{"id": "1"}], "hidden_repetition": {}}}')
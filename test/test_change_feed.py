@@ -0,0 +1,123 @@
+import json
+import os
+from typing import List
+from unittest.mock import patch
+
+from flask_calendar.change_feed import CHANGE_CREATED, CHANGE_MOVED, ChangeFeed, event_stream
+
+
+def test_read_returns_changes_after_the_cursor(tmp_path: str) -> None:
+    feed = ChangeFeed(str(tmp_path), max_bytes=1024, retention_seconds=3600)
+    feed.publish("sample", CHANGE_CREATED, ["2017-12-25"], [1])
+    cursor = feed.cursor_at_end("sample")
+    assert feed.read("sample", cursor)[0] == []
+
+    feed.publish("sample", CHANGE_MOVED, ["2017-12-25", "2017-12-26"], [1])
+    feed.publish("sample", CHANGE_CREATED, [], [2], repeats=True)
+    records, cursor = feed.read("sample", cursor)
+    assert [{key: value for key, value in record.items() if key != "at"} for record in records] == [
+        {"seq": 2, "op": CHANGE_MOVED, "days": ["2017-12-25", "2017-12-26"], "tasks": [1], "repeats": False},
+        {"seq": 3, "op": CHANGE_CREATED, "days": [], "tasks": [2], "repeats": True},
+    ]
+    assert feed.read("sample", cursor)[0] == []
+    assert [record["seq"] for record in feed.read("sample", feed.cursor_after(1))[0]] == [2, 3]
+
+
+def test_read_waits_for_complete_lines(tmp_path: str) -> None:
+    feed = ChangeFeed(str(tmp_path), max_bytes=1024, retention_seconds=3600)
+    cursor = feed.cursor_at_end("sample")
+    with open(feed.path("sample"), "ab") as file:
+        file.write(b'{"seq":1,"op":"created",')
+    records, cursor = feed.read("sample", cursor)
+    assert records == []
+
+    with open(feed.path("sample"), "ab") as file:
+        file.write(b'"days":[],"repeats":false}\n')
+    assert [record["seq"] for record in feed.read("sample", cursor)[0]] == [1]
+
+
+def test_change_after_a_cut_record_is_not_joined_to_it(tmp_path: str) -> None:
+    feed = ChangeFeed(str(tmp_path), max_bytes=1024, retention_seconds=3600)
+    feed.publish("sample", CHANGE_CREATED, ["2017-12-25"], [1])
+    cursor = feed.cursor_at_end("sample")
+    # a crash while appending
+    with open(feed.path("sample"), "ab") as file:
+        file.write(b'{"seq":2,"op":"created",')
+
+    feed.publish("sample", CHANGE_MOVED, ["2017-12-25", "2017-12-26"], [1])
+
+    records = feed.read("sample", cursor)[0]
+    assert [(record["seq"], record["op"]) for record in records] == [(2, CHANGE_MOVED)]
+    with open(feed.path("sample"), "rb") as file:
+        assert len(file.read().splitlines()) == 2
+
+
+def test_records_without_sequence_are_skipped(tmp_path: str) -> None:
+    feed = ChangeFeed(str(tmp_path), max_bytes=1024, retention_seconds=3600)
+    with open(feed.path("sample"), "wb") as file:
+        file.write(b'{"op":"created"}\n[]\n')
+    assert (feed.first_sequence("sample"), feed.last_sequence("sample")) == (None, 0)
+
+    feed.publish("sample", CHANGE_CREATED, ["2017-12-25"], [1])
+    with open(feed.path("sample"), "ab") as file:
+        file.write(b'{"op":"created"}\n')
+
+    assert [record["seq"] for record in feed.read("sample", feed.cursor_after(0))[0]] == [1]
+    assert (feed.first_sequence("sample"), feed.last_sequence("sample")) == (1, 1)
+
+
+def test_trimming_keeps_sequence_and_readers(tmp_path: str) -> None:
+    feed = ChangeFeed(str(tmp_path), max_bytes=512, retention_seconds=3600)
+    cursor = feed.cursor_at_end("sample")
+    seen = []  # type: List[int]
+    for _ in range(40):
+        feed.publish("sample", CHANGE_CREATED, ["2017-12-25"], [1])
+        records, cursor = feed.read("sample", cursor)
+        seen.extend(record["seq"] for record in records)
+
+    assert seen == list(range(1, 41))
+    assert os.path.getsize(feed.path("sample")) <= 512
+    first_sequence = feed.first_sequence("sample")
+    assert first_sequence is not None and first_sequence > 1
+
+
+def test_changes_are_kept_for_the_retention_time(tmp_path: str) -> None:
+    feed = ChangeFeed(str(tmp_path), max_bytes=1024, retention_seconds=3600)
+    with patch("flask_calendar.change_feed.time.time", return_value=1_000_000):
+        feed.publish("sample", CHANGE_CREATED, ["2017-12-25"], [1])
+        feed.publish("sample", CHANGE_CREATED, ["2017-12-25"], [2])
+    with patch("flask_calendar.change_feed.time.time", return_value=1_003_000):
+        feed.publish("sample", CHANGE_CREATED, ["2017-12-25"], [3])
+    assert feed.first_sequence("sample") == 1
+
+    with patch("flask_calendar.change_feed.time.time", return_value=1_003_700):
+        feed.publish("sample", CHANGE_CREATED, ["2017-12-25"], [4])
+    assert feed.first_sequence("sample") == 3
+    with patch("flask_calendar.change_feed.time.time", return_value=2_000_000):
+        feed.publish("sample", CHANGE_CREATED, ["2017-12-25"], [5])
+    # the last record is kept, so sequence numbers keep growing
+    assert (feed.first_sequence("sample"), feed.last_sequence("sample")) == (5, 5)
+
+
+def test_event_stream(tmp_path: str) -> None:
+    feed = ChangeFeed(str(tmp_path), max_bytes=1024, retention_seconds=3600)
+    feed.publish("sample", CHANGE_CREATED, ["2017-12-25"], [1])
+
+    # a new subscriber only gets later changes
+    assert list(event_stream(feed, "sample", None, duration=0, poll_seconds=1)) == ["retry: 1000\n\n"]
+
+    events = list(event_stream(feed, "sample", 0, duration=0, poll_seconds=1))
+    event_id, data = events[1].rstrip("\n").split("\n")
+    assert event_id == "id: 1"
+    assert json.loads(data[len("data: ") :])["days"] == ["2017-12-25"]
+
+
+def test_event_stream_resets_subscribers_that_missed_changes(tmp_path: str) -> None:
+    feed = ChangeFeed(str(tmp_path), max_bytes=256, retention_seconds=3600)
+    for _ in range(20):
+        feed.publish("sample", CHANGE_CREATED, ["2017-12-25"], [1])
+
+    events = list(event_stream(feed, "sample", 1, duration=0, poll_seconds=1))
+    assert events[1] == "event: reset\ndata: {}\n\n"
+    assert events[-1].startswith("id: 20\n")
+    assert "event: reset" not in "".join(event_stream(feed, "sample", 19, duration=0, poll_seconds=1))
@@ -0,0 +1,47 @@
+import os
+from typing import Dict
+
+from flask_calendar.calendar_schema import decode_calendar
+from flask_calendar.change_feed import CHANGE_CREATED, CHANGE_DELETED, CHANGE_HIDDEN, CHANGE_MOVED
+from flask_calendar.delta_sync import compact_changes
+from flask_calendar.hidden_repetitions import hide
+
+
+def sample_data() -> Dict:
+    with open(os.path.join("test", "fixtures", "sample_data_file.json"), "rb") as file:
+        return decode_calendar(file.read())
+
+
+def record(op: str, days: list, tasks: list) -> Dict:
+    return {"seq": 1, "at": 0, "op": op, "days": days, "tasks": tasks, "repeats": False}
+
+
+def test_changed_tasks_appear_once_with_their_current_state() -> None:
+    data = sample_data()
+    hide(data["tasks"]["hidden_repetition"], "3", "2017", "12", "4")
+    records = [
+        record(CHANGE_CREATED, ["2017-11-05"], [4]),
+        record(CHANGE_MOVED, ["2017-11-05", "2017-11-06"], [4]),
+        record(CHANGE_HIDDEN, ["2017-12-04"], [3]),
+    ]
+
+    changes = compact_changes(records, data)
+    assert [(change["date"], change["task"]["title"]) for change in changes["tasks"]] == [
+        ("2017-11-06", "Month 11 task")
+    ]
+    assert [(change["task"]["id"], change["hidden"]) for change in changes["repetitive_tasks"]] == [(3, ["2017-12-04"])]
+    assert changes["removed"] == []
+
+
+def test_deleted_tasks_are_tombstones() -> None:
+    data = sample_data()
+    records = [
+        record(CHANGE_DELETED, ["2017-12-26"], [7]),
+        record(CHANGE_CREATED, ["2017-11-06"], [4]),
+        record(CHANGE_DELETED, ["2017-11-06"], [4]),
+        # no longer in the calendar
+        record(CHANGE_CREATED, ["2017-12-27"], [8]),
+    ]
+
+    changes = compact_changes(records, data)
+    assert changes == {"tasks": [], "repetitive_tasks": [], "removed": [4, 7, 8]}
@@ -0,0 +1,40 @@
+import calendar
+from datetime import date
+
+import pytest
+from flask_calendar.gregorian_calendar import GregorianCalendar
+
+
+@pytest.mark.parametrize("first_weekday", (calendar.MONDAY, calendar.SUNDAY))
+def test_month_days_start_on_the_given_weekday(first_weekday: int) -> None:
+    month_days = list(GregorianCalendar.month_days(2017, 11, first_weekday))
+
+    assert month_days == list(calendar.Calendar(first_weekday).itermonthdates(2017, 11))
+    assert month_days[0].weekday() == first_weekday
+    # doesn't depend on the `calendar` module setting
+    assert calendar.firstweekday() == calendar.MONDAY
+
+
+def test_month_grids_are_computed_once() -> None:
+    assert GregorianCalendar.month_days(2018, 2, calendar.SUNDAY) is GregorianCalendar.month_days(
+        2018, 2, calendar.SUNDAY
+    )
+    assert [list(week) for week in GregorianCalendar.month_days_with_weekday(2018, 2, calendar.SUNDAY)] == [
+        list(week) for week in calendar.Calendar(calendar.SUNDAY).monthdayscalendar(2018, 2)
+    ]
+
+
+@pytest.mark.parametrize(
+    ("first_weekday", "week_start"),
+    (
+        (calendar.MONDAY, date(2017, 12, 25)),
+        (calendar.SUNDAY, date(2017, 12, 31)),
+        (calendar.WEDNESDAY, date(2017, 12, 27)),
+    ),
+)
+def test_week_days_start_on_the_given_weekday(first_weekday: int, week_start: date) -> None:
+    week_days = list(GregorianCalendar.week_days(2017, 12, 31, first_weekday))
+
+    assert week_days[0] == week_start
+    assert week_days == [date.fromordinal(week_start.toordinal() + offset) for offset in range(7)]
+    assert date(2017, 12, 31) in week_days
@@ -0,0 +1,96 @@
+import json
+import os
+import shutil
+
+import pytest
+from flask_calendar.calendar_schema import decode_calendar
+from flask_calendar.hidden_repetitions import (
+    HiddenRepetitions,
+    from_nested,
+    hidden_months,
+    hide,
+    is_hidden,
+    is_month_hidden,
+    is_nested,
+    to_nested,
+    unhide_month,
+)
+from flask_calendar.scripts.hidden_repetitions_to_bitmaps import convert
+from flask_calendar.storage import JsonStorage
+
+NESTED = {
+    "1": {"2017": {"1": {"1": True}, "12": {"2": True, "31": True}}, "2020": {"2": {"29": True, "30": True}}},
+    "7": {"2018": {"6": {"15": True}}},
+}
+
+
+def test_nested_form_converts_without_losses() -> None:
+    hidden = from_nested(NESTED)
+
+    assert not is_nested(hidden)
+    assert to_nested(hidden) == NESTED
+    assert from_nested(hidden) == hidden
+
+
+def test_membership() -> None:
+    hidden = from_nested(NESTED)
+
+    assert is_hidden(hidden, "1", "2017", "12", "31")
+    assert is_hidden(hidden, "1", "2020", "2", "30")
+    assert not is_hidden(hidden, "1", "2017", "12", "30")
+    assert not is_hidden(hidden, "1", "2018", "12", "2")
+    assert not is_hidden(hidden, "2", "2017", "12", "2")
+    assert is_month_hidden(hidden, "7", "2018", "6")
+    assert not is_month_hidden(hidden, "7", "2018", "7")
+
+
+def test_hide_does_not_change_shallow_copies() -> None:
+    hidden = from_nested(NESTED)
+    copy = dict(hidden)
+
+    hide(hidden, "1", "2017", "5", "4")
+    hide(hidden, "3", "2019", "1", "1")
+
+    assert is_hidden(hidden, "1", "2017", "5", "4")
+    assert is_hidden(hidden, "3", "2019", "1", "1")
+    assert not is_hidden(copy, "1", "2017", "5", "4")
+    assert "3" not in copy
+
+
+def test_unhide_month_removes_empty_entries() -> None:
+    hidden = from_nested(NESTED)
+
+    unhide_month(hidden, "1", "2017", 12)
+    assert hidden_months(hidden["1"]["2017"]) == [1]
+
+    unhide_month(hidden, "7", "2018", 6)
+    assert "7" not in hidden
+
+
+@pytest.mark.parametrize("nested", [{"1": {"2017": {"13": {"2": True}}}}, {"1": {"2017": {"2": {"32": True}}}}])
+def test_unconvertible_entries_raise_value_error(nested: HiddenRepetitions) -> None:
+    with pytest.raises(ValueError):
+        from_nested(nested)
+
+
+def test_calendars_saved_before_bitmaps_are_converted(tmp_path: str) -> None:
+    shutil.copy(
+        os.path.join("test", "fixtures", "repetitive_monthly_weekday_hidden_task_data_file.json"), str(tmp_path)
+    )
+    path = os.path.join(str(tmp_path), "repetitive_monthly_weekday_hidden_task_data_file.json")
+    with open(path, "rb") as file:
+        data = decode_calendar(file.read())
+    assert is_hidden(data["tasks"]["hidden_repetition"], "1", "2017", "12", "2")
+
+    assert convert(str(tmp_path)) == 1
+    with open(path) as file:
+        assert not is_nested(json.load(file)["tasks"]["hidden_repetition"])
+    data = JsonStorage(str(tmp_path)).load("repetitive_monthly_weekday_hidden_task_data_file", use_cache=False)
+    assert is_hidden(data["tasks"]["hidden_repetition"], "1", "2017", "12", "2")
+
+
+def test_empty_months_and_false_days_are_skipped() -> None:
+    with open(os.path.join("test", "fixtures", "empty_month_hidden_task_data_file.json"), "rb") as file:
+        hidden = decode_calendar(file.read())["tasks"]["hidden_repetition"]
+
+    assert to_nested(hidden) == {"1": {"2017": {"12": {"2": True}}}}
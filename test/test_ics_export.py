@@ -0,0 +1,121 @@
+import calendar
+import os
+from datetime import date
+from typing import Dict, List
+
+from flask_calendar.calendar_schema import decode_calendar
+from flask_calendar.hidden_repetitions import hide
+from flask_calendar.ics_export import MAX_LINE_OCTETS, calendar_lines
+
+CALENDAR_ID = "sample"
+START = date(2017, 11, 1)
+END = date(2017, 12, 31)
+
+
+def sample_data() -> Dict:
+    with open(os.path.join("test", "fixtures", "sample_data_file.json"), "rb") as file:
+        return decode_calendar(file.read())
+
+
+def events(data: Dict, first_weekday: int = calendar.MONDAY) -> Dict[str, List[str]]:
+    """
+    Unfolded properties of each event by UID.
+    """
+    document = "".join(calendar_lines(CALENDAR_ID, data, START, END, first_weekday, START))
+    assert document.endswith("\r\n")
+    lines = document.replace("\r\n ", "").split("\r\n")[:-1]
+    assert lines[0] == "BEGIN:VCALENDAR" and lines[-1] == "END:VCALENDAR"
+    by_uid = {}  # type: Dict[str, List[str]]
+    properties = []  # type: List[str]
+    for line in lines:
+        if line == "BEGIN:VEVENT":
+            properties = []
+        elif line.startswith("UID:"):
+            by_uid[line[len("UID:") :]] = properties
+        else:
+            properties.append(line)
+    return by_uid
+
+
+def repetition(task_id: int) -> str:
+    return "{}-repetition-{}@flask-calendar".format(CALENDAR_ID, task_id)
+
+
+def test_repetitive_tasks_become_rules_from_their_first_occurrence() -> None:
+    by_uid = events(sample_data())
+
+    assert "RRULE:FREQ=WEEKLY;BYDAY=MO" in by_uid[repetition(0)]
+    assert "DTSTART;VALUE=DATE:20171106" in by_uid[repetition(0)]
+    assert "DTEND;VALUE=DATE:20171107" in by_uid[repetition(0)]
+    assert "RRULE:FREQ=MONTHLY;BYDAY=1SA" in by_uid[repetition(1)]
+    assert "DTSTART;VALUE=DATE:20171104" in by_uid[repetition(1)]
+    assert "RRULE:FREQ=MONTHLY;BYMONTHDAY=1" in by_uid[repetition(2)]
+    assert "DTSTART;VALUE=DATE:20171101" in by_uid[repetition(2)]
+    # ends before it starts, so without duration
+    assert [line for line in by_uid[repetition(3)] if line.startswith("DT")] == [
+        "DTSTAMP:20171101T000000Z",
+        "DTSTART:20171102T193000",
+    ]
+
+
+def test_weekday_columns_follow_the_first_weekday() -> None:
+    by_uid = events(sample_data(), first_weekday=calendar.SUNDAY)
+
+    assert "RRULE:FREQ=WEEKLY;BYDAY=SU" in by_uid[repetition(0)]
+    assert "DTSTART;VALUE=DATE:20171105" in by_uid[repetition(0)]
+
+
+def test_hidden_instances_become_exdates() -> None:
+    data = sample_data()
+    hidden = data["tasks"]["hidden_repetition"]
+    hide(hidden, "0", "2017", "11", "13")
+    # monthly occurrences are hidden by any day of their month
+    hide(hidden, "1", "2017", "12", "20")
+    hide(hidden, "3", "2018", "1", "4")
+
+    by_uid = events(data)
+
+    assert [line for line in by_uid[repetition(0)] if line.startswith("EXDATE")] == ["EXDATE;VALUE=DATE:20171113"]
+    assert [line for line in by_uid[repetition(1)] if line.startswith("EXDATE")] == ["EXDATE;VALUE=DATE:20171202"]
+    assert [line for line in by_uid[repetition(3)] if line.startswith("EXDATE")] == ["EXDATE:20180104T193000"]
+
+
+def test_bounded_tasks_end_with_until() -> None:
+    data = sample_data()
+    repetitive_tasks = data["tasks"]["repetition"]
+    repetitive_tasks[0].starts_on = "2017-11-01"
+    repetitive_tasks[0].count = 2
+    repetitive_tasks[3].until = "2017-12-31"
+    repetitive_tasks[2].until = "2017-10-31"
+
+    by_uid = events(data)
+
+    assert "RRULE:FREQ=WEEKLY;BYDAY=MO;UNTIL=20171113" in by_uid[repetition(0)]
+    assert "RRULE:FREQ=WEEKLY;BYDAY=TH;UNTIL=20171231T235900" in by_uid[repetition(3)]
+    assert repetition(2) not in by_uid
+
+
+def test_normal_tasks_of_the_range_become_events() -> None:
+    data = sample_data()
+    data["tasks"]["normal"]["2017"]["12"]["25"][0].title = "Title, with; separators"
+
+    by_uid = events(data)
+
+    assert sorted(uid for uid in by_uid if "-repetition-" not in uid) == [
+        "sample-2017-11-06-4@flask-calendar",
+        "sample-2017-12-25-0@flask-calendar",
+        "sample-2017-12-25-1@flask-calendar",
+    ]
+    assert "SUMMARY:Title\\, with\\; separators" in by_uid["sample-2017-12-25-0@flask-calendar"]
+    assert "DTSTART:20171225T153000" in by_uid["sample-2017-12-25-1@flask-calendar"]
+    assert not any(line.startswith("RRULE") for line in by_uid["sample-2017-12-25-1@flask-calendar"])
+
+
+def test_lines_are_folded_at_75_octets() -> None:
+    data = sample_data()
+    data["tasks"]["repetition"][0].details = "ñ" * 200
+
+    document = "".join(calendar_lines(CALENDAR_ID, data, START, END, calendar.MONDAY, START))
+
+    assert max(len(line.encode("utf-8")) for line in document.split("\r\n")) == MAX_LINE_OCTETS
+    assert "DESCRIPTION:" + "ñ" * 200 in document.replace("\r\n ", "")
@@ -0,0 +1,172 @@
+import os
+import shutil
+from typing import Dict
+
+import pytest
+from flask_calendar.calendar_cache import cache
+from flask_calendar.calendar_data import CalendarData
+from flask_calendar.calendar_schema import decode_calendar, encode_calendar
+from flask_calendar.gregorian_calendar import GregorianCalendar
+from flask_calendar.hidden_repetitions import is_hidden
+from flask_calendar.journal_storage import KEY_JOURNAL_SEQUENCE, JournaledJsonStorage
+
+CALENDAR_ID = "sample_data_file"
+
+
+@pytest.fixture
+def storage(tmp_path: str) -> JournaledJsonStorage:
+    cache.clear()
+    shutil.copy(os.path.join("test", "fixtures", "{}.json".format(CALENDAR_ID)), tmp_path)
+    return JournaledJsonStorage(str(tmp_path), compaction_threshold_bytes=1024 * 1024)
+
+
+@pytest.fixture
+def calendar_data(storage: JournaledJsonStorage) -> CalendarData:
+    return CalendarData(storage.data_folder, storage=storage)
+
+
+def read_snapshot(storage: JournaledJsonStorage) -> Dict:
+    with open(storage.path(CALENDAR_ID), "rb") as file:
+        return decode_calendar(file.read())
+
+
+def make_changes(calendar_data: CalendarData) -> None:
+    calendar_data.create_tasks(
+        calendar_id=CALENDAR_ID,
+        dates=[(2017, 12, 10), (2017, 12, 11)],
+        title="an irrelevant title",
+        is_all_day=True,
+        start_time="00:00",
+        details="",
+        color="an_irrelevant_color",
+        has_repetition=False,
+        repetition_type=None,
+        repetition_subtype=None,
+        repetition_value=0,
+    )
+    calendar_data.update_task_day(CALENDAR_ID, "2017", "12", "25", 0, "26")
+    calendar_data.delete_task(CALENDAR_ID, "2017", "12", "25", 1)
+    calendar_data.hide_repetition_task_instance(CALENDAR_ID, "2017", "11", "6", "0")
+
+
+def test_changes_are_appended_without_rewriting_the_calendar_file(
+    storage: JournaledJsonStorage, calendar_data: CalendarData
+) -> None:
+    snapshot = read_snapshot(storage)
+
+    make_changes(calendar_data)
+
+    assert read_snapshot(storage) == snapshot
+    with open(storage.journal_path(CALENDAR_ID)) as file:
+        assert len(file.readlines()) == 4
+
+    data = calendar_data.load_calendar(CALENDAR_ID)
+    normal_tasks = data["tasks"]["normal"]["2017"]["12"]
+    assert len(normal_tasks["10"]) == 1
+    assert len(normal_tasks["11"]) == 1
+    assert normal_tasks["25"] == []
+    assert [task["id"] for task in normal_tasks["26"]] == [0]
+    assert is_hidden(data["tasks"]["hidden_repetition"], "0", "2017", "11", "6")
+
+
+def test_cached_calendar_matches_replayed_journal(storage: JournaledJsonStorage, calendar_data: CalendarData) -> None:
+    make_changes(calendar_data)
+    cached = calendar_data.load_calendar(CALENDAR_ID)
+
+    cache.clear()
+    assert calendar_data.load_calendar(CALENDAR_ID) == cached
+
+
+def test_compaction_folds_the_journal_into_the_calendar_file(
+    storage: JournaledJsonStorage, calendar_data: CalendarData
+) -> None:
+    make_changes(calendar_data)
+    expected = calendar_data.load_calendar(CALENDAR_ID)
+
+    storage.compact(CALENDAR_ID)
+
+    assert os.path.getsize(storage.journal_path(CALENDAR_ID)) == 0
+    assert read_snapshot(storage) == expected
+    cache.clear()
+    assert calendar_data.load_calendar(CALENDAR_ID) == expected
+
+
+def test_changes_already_in_the_calendar_file_are_not_applied_twice(
+    storage: JournaledJsonStorage, calendar_data: CalendarData
+) -> None:
+    make_changes(calendar_data)
+    expected = calendar_data.load_calendar(CALENDAR_ID)
+    assert expected[KEY_JOURNAL_SEQUENCE] == 4
+
+    # as if compaction was interrupted after replacing the calendar file but before trimming the journal
+    with open(storage.path(CALENDAR_ID), "wb") as file:
+        file.write(encode_calendar(expected))
+    cache.clear()
+
+    assert calendar_data.load_calendar(CALENDAR_ID) == expected
+
+
+def test_saved_calendars_are_cached_once(storage: JournaledJsonStorage, calendar_data: CalendarData) -> None:
+    make_changes(calendar_data)
+    data = calendar_data.load_calendar(CALENDAR_ID)
+
+    storage.save(CALENDAR_ID, data)
+
+    assert not os.path.exists(storage.journal_path(CALENDAR_ID))
+    assert cache.stats()["entries"] == 1
+    assert calendar_data.load_calendar(CALENDAR_ID)[KEY_JOURNAL_SEQUENCE] == 4
+
+
+def test_invalid_change_is_not_written(storage: JournaledJsonStorage, calendar_data: CalendarData) -> None:
+    with pytest.raises(KeyError):
+        calendar_data.update_task_day(CALENDAR_ID, "2001", "1", "1", 0, "2")
+
+    assert not os.path.exists(storage.journal_path(CALENDAR_ID))
+
+
+def test_journal_over_threshold_is_compacted(storage: JournaledJsonStorage, calendar_data: CalendarData) -> None:
+    storage.compaction_threshold_bytes = 0
+
+    calendar_data.hide_repetition_task_instance(CALENDAR_ID, "2017", "11", "6", "0")
+    storage.compact(CALENDAR_ID)
+
+    data = read_snapshot(storage)
+    assert is_hidden(data["tasks"]["hidden_repetition"], "0", "2017", "11", "6")
+    tasks = calendar_data.add_repetitive_tasks_from_calendar(
+        GregorianCalendar.month_days(2017, 11), calendar_data.load_calendar(CALENDAR_ID), {}
+    )
+    assert 0 not in [task["id"] for task in tasks["11"].get("6", [])]
+
+
+def test_change_after_a_cut_record_is_not_joined_to_it(
+    storage: JournaledJsonStorage, calendar_data: CalendarData
+) -> None:
+    make_changes(calendar_data)
+    # a crash while appending the hide of 2017-11-06
+    journal_size = os.path.getsize(storage.journal_path(CALENDAR_ID))
+    os.truncate(storage.journal_path(CALENDAR_ID), journal_size - 10)
+    cache.clear()
+
+    calendar_data.hide_repetition_task_instance(CALENDAR_ID, "2017", "11", "13", "0")
+
+    cache.clear()
+    data = calendar_data.load_calendar(CALENDAR_ID)
+    assert data[KEY_JOURNAL_SEQUENCE] == 4
+    assert not is_hidden(data["tasks"]["hidden_repetition"], "0", "2017", "11", "6")
+    assert is_hidden(data["tasks"]["hidden_repetition"], "0", "2017", "11", "13")
+    with open(storage.journal_path(CALENDAR_ID)) as file:
+        assert len(file.readlines()) == 4
+
+
+def test_cut_records_are_skipped(storage: JournaledJsonStorage, calendar_data: CalendarData) -> None:
+    make_changes(calendar_data)
+    with open(storage.journal_path(CALENDAR_ID)) as file:
+        lines = file.readlines()
+    lines[2] = lines[2][:10] + "\n"
+    with open(storage.journal_path(CALENDAR_ID), "w") as file:
+        file.writelines(lines)
+    cache.clear()
+
+    data = calendar_data.load_calendar(CALENDAR_ID)
+    assert [task["id"] for task in data["tasks"]["normal"]["2017"]["12"]["25"]] == [1]
+    assert is_hidden(data["tasks"]["hidden_repetition"], "0", "2017", "11", "6")
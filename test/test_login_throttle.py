@@ -0,0 +1,81 @@
+import os
+import time
+from unittest.mock import patch
+
+import pytest
+from flask_calendar.login_throttle import (
+    FailedLoginsStore,
+    FileSystemFailedLoginsStore,
+    LoginThrottle,
+    MemoryFailedLoginsStore,
+    SqliteFailedLoginsStore,
+)
+
+
+@pytest.fixture(params=["memory", "filesystem", "sqlite"])
+def failed_logins_store(request: pytest.FixtureRequest, tmp_path: str) -> FailedLoginsStore:
+    if request.param == "memory":
+        return MemoryFailedLoginsStore()
+    elif request.param == "filesystem":
+        return FileSystemFailedLoginsStore(os.path.join(tmp_path, "failed_logins"))
+    return SqliteFailedLoginsStore(os.path.join(tmp_path, "sessions.sqlite"))
+
+
+@pytest.fixture
+def login_throttle(failed_logins_store: FailedLoginsStore) -> LoginThrottle:
+    return LoginThrottle(failed_logins_store, delay_base=2)
+
+
+def test_allows_logins_without_failed_attempts(login_throttle: LoginThrottle) -> None:
+    assert login_throttle.retry_after("a_username", "127.0.0.1") == 0
+
+
+def test_delay_grows_exponentially_with_failed_attempts(login_throttle: LoginThrottle) -> None:
+    now = time.time()
+    with patch("time.time", return_value=now):
+        login_throttle.failed_attempt("a_username", "127.0.0.1")
+        assert login_throttle.retry_after("a_username", "127.0.0.1") == 1
+        login_throttle.failed_attempt("a_username", "127.0.0.1")
+        assert login_throttle.retry_after("a_username", "127.0.0.1") == 2
+        login_throttle.failed_attempt("a_username", "127.0.0.1")
+        assert login_throttle.retry_after("a_username", "127.0.0.1") == 4
+
+    with patch("time.time", return_value=now + 4):
+        assert login_throttle.retry_after("a_username", "127.0.0.1") == 0
+
+
+def test_throttles_both_username_and_client_ip(login_throttle: LoginThrottle) -> None:
+    login_throttle.failed_attempt("a_username", "127.0.0.1")
+
+    assert login_throttle.retry_after("a_username", "10.0.0.1") > 0
+    assert login_throttle.retry_after("another_username", "127.0.0.1") > 0
+    assert login_throttle.retry_after("another_username", "10.0.0.1") == 0
+
+
+def test_successful_login_resets_username_attempts(login_throttle: LoginThrottle) -> None:
+    login_throttle.failed_attempt("a_username", "127.0.0.1")
+    login_throttle.successful_attempt("a_username")
+
+    assert login_throttle.retry_after("a_username", "10.0.0.1") == 0
+    assert login_throttle.retry_after("a_username", "127.0.0.1") > 0
+
+
+def test_failed_attempts_expire_and_are_swept(failed_logins_store: FailedLoginsStore) -> None:
+    if isinstance(failed_logins_store, MemoryFailedLoginsStore):
+        pytest.skip("expiration is handled by SimpleCache")
+    failed_logins_store.set("LF_a_username", (3, time.time() + 8))
+
+    with patch("time.time", return_value=time.time() + 7201):
+        assert failed_logins_store.get("LF_a_username") is None
+        assert failed_logins_store.sweep_expired() == 1
+
+
+def test_failed_attempts_are_shared_between_store_instances(tmp_path: str) -> None:
+    # as separate worker processes would each create their own store
+    for create_store in (
+        lambda: SqliteFailedLoginsStore(os.path.join(tmp_path, "sessions.sqlite")),
+        lambda: FileSystemFailedLoginsStore(os.path.join(tmp_path, "failed_logins")),
+    ):
+        LoginThrottle(create_store(), delay_base=2).failed_attempt("a_username", "127.0.0.1")
+
+        assert LoginThrottle(create_store(), delay_base=2).retry_after("a_username", "127.0.0.1") == 1
@@ -0,0 +1,103 @@
+import calendar
+import os
+import random
+import shutil
+from datetime import date, timedelta
+from typing import Dict, List, Tuple
+
+import pytest
+from flask_calendar.calendar_data import CalendarData
+from flask_calendar.calendar_schema import Task
+from flask_calendar.gregorian_calendar import GregorianCalendar
+from flask_calendar.hidden_repetitions import from_nested
+from flask_calendar.occurrences import occurrences_between
+from flask_calendar.recurrence import RecurrenceIndex
+from flask_calendar.recurrence import cache as recurrence_cache
+
+from test.test_recurrence import random_task
+
+
+def month_by_month(index: RecurrenceIndex, start: date, end: date, first_weekday: int) -> List[Tuple[date, Task]]:
+    occurrences = []  # type: List[Tuple[date, Task]]
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        for day_str, day_tasks in index.month_tasks(year, month, first_weekday).items():
+            day = date(year, month, int(day_str))
+            if start <= day <= end:
+                occurrences.extend((day, task) for task in day_tasks)
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return occurrences
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_same_occurrences_as_expanding_month_by_month(seed: int) -> None:
+    generator = random.Random(seed)
+    repetitive_tasks = [random_task(generator, task_id) for task_id in range(80)]
+    for task in repetitive_tasks[:30]:
+        starts_on = date(2018, 1, 1) + timedelta(days=generator.randrange(4 * 365))
+        task.starts_on = starts_on.isoformat()
+        if generator.random() < 0.5:
+            task.until = (starts_on + timedelta(days=generator.randrange(500))).isoformat()
+        else:
+            task.count = generator.randint(1, 20)
+    nested = {}  # type: Dict
+    for _ in range(150):
+        months = nested.setdefault(str(generator.randrange(80)), {}).setdefault(str(generator.randint(2018, 2022)), {})
+        months.setdefault(str(generator.randint(1, 12)), {})[str(generator.randint(1, 31))] = True
+    hidden = from_nested(nested)
+    start = date(2018, 3, 17)
+    end = date(2022, 10, 2)
+
+    index = RecurrenceIndex(repetitive_tasks, hidden)
+    for first_weekday in (calendar.MONDAY, calendar.SUNDAY):
+        occurrences = occurrences_between({}, repetitive_tasks, hidden, start, end, first_weekday)
+        assert list(occurrences) == month_by_month(index, start, end, first_weekday)
+
+
+def test_normal_tasks_go_before_repetitive_ones_on_each_day() -> None:
+    generator = random.Random(0)
+    weekly = random_task(generator, 10)
+    weekly.repetition_type = CalendarData.REPETITION_TYPE_WEEKLY
+    weekly.repetition_value = 0
+    normal = random_task(generator, 11)
+    another_normal = random_task(generator, 12)
+    # November has no 31st
+    normal_tasks = {
+        "2017": {"11": {"6": [normal, another_normal], "31": [normal]}, "12": {"1": [another_normal]}}
+    }  # type: Dict
+
+    occurrences = occurrences_between(
+        normal_tasks, [weekly], {}, date(2017, 11, 6), date(2017, 11, 13), calendar.MONDAY
+    )
+
+    assert list(occurrences) == [
+        (date(2017, 11, 6), normal),
+        (date(2017, 11, 6), another_normal),
+        (date(2017, 11, 6), weekly),
+        (date(2017, 11, 13), weekly),
+    ]
+
+
+def test_empty_calendar_has_no_occurrences() -> None:
+    occurrences = occurrences_between({}, [], {}, date(2017, 1, 1), date(2027, 1, 1), calendar.MONDAY)
+
+    assert len(occurrences) == 0
+    assert occurrences.tasks_by_month() == {}
+
+
+def test_views_can_get_their_tasks_from_occurrences(tmp_path: str) -> None:
+    recurrence_cache.clear()
+    shutil.copy(os.path.join("test", "fixtures", "sample_data_file.json"), os.path.join(tmp_path, "a_calendar.json"))
+    calendar_data = CalendarData(str(tmp_path))
+    data = calendar_data.load_calendar("a_calendar")
+    CalendarData.hide_repetition_task_instance_in_data(data, "2017", "11", "13", "0")
+
+    month_days = list(GregorianCalendar.month_days(2017, 11))
+    tasks = calendar_data.tasks_from_calendar(month_days, data)
+    tasks = calendar_data.add_repetitive_tasks_from_calendar(month_days, data, tasks)
+    occurrences = calendar_data.occurrences_between(date(2017, 10, 1), date(2017, 12, 31), data=data)
+
+    assert occurrences.tasks_by_month() == {
+        month_str: {day_str: day_tasks for day_str, day_tasks in month_tasks.items() if day_tasks}
+        for month_str, month_tasks in tasks.items()
+    }
@@ -0,0 +1,338 @@
+import calendar
+import os
+import random
+import shutil
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, List
+from unittest.mock import patch
+
+import pytest
+from flask import Flask
+from flask_calendar.calendar_data import CalendarData
+from flask_calendar.calendar_schema import RepetitiveTask
+from flask_calendar.gregorian_calendar import GregorianCalendar
+from flask_calendar.hidden_repetitions import from_nested
+from flask_calendar.recurrence import (
+    REPETITION_SUBTYPE_MONTH_DAY,
+    REPETITION_SUBTYPE_WEEK_DAY,
+    REPETITION_TYPE_MONTHLY,
+    REPETITION_TYPE_WEEKLY,
+    RecurrenceCache,
+    RecurrenceIndex,
+    RuleWindows,
+    rule_window,
+)
+from flask_calendar.recurrence import cache as recurrence_cache
+
+
+def reference_month_tasks(
+    repetitive_tasks: List[RepetitiveTask], hidden_repetitions: Dict, year: int, month: int, first_weekday: int
+) -> Dict:
+    # previous algorithm of `CalendarData._repetitive_tasks_from_calendar`: every task against every day of the month
+    month_str = str(month)
+    year_str = str(year)
+    month_tasks = {}  # type: Dict
+    for task in repetitive_tasks:
+        id_str = str(task["id"])
+        monthly_task_assigned = False
+        for week in calendar.Calendar(first_weekday).monthdayscalendar(year, month):
+            for weekday, day in enumerate(week):
+                if day == 0:
+                    continue
+                day_str = str(day)
+                hidden = hidden_repetitions.get(id_str, {}).get(year_str, {})
+                if (
+                    task["repetition_type"] == REPETITION_TYPE_WEEKLY
+                    and not (month_str in hidden and day_str in hidden[month_str])
+                    and task["repetition_value"] == weekday
+                ):
+                    month_tasks.setdefault(day_str, []).append(task)
+                elif task["repetition_type"] == REPETITION_TYPE_MONTHLY and month_str not in hidden:
+                    if task["repetition_subtype"] == REPETITION_SUBTYPE_WEEK_DAY:
+                        if task["repetition_value"] == weekday and not monthly_task_assigned:
+                            monthly_task_assigned = True
+                            month_tasks.setdefault(day_str, []).append(task)
+                    else:
+                        if task["repetition_value"] == day:
+                            month_tasks.setdefault(day_str, []).append(task)
+    return month_tasks
+
+
+def random_task(generator: random.Random, task_id: int) -> RepetitiveTask:
+    repetition_type = generator.choice([REPETITION_TYPE_WEEKLY, REPETITION_TYPE_MONTHLY])
+    repetition_subtype = generator.choice([REPETITION_SUBTYPE_WEEK_DAY, REPETITION_SUBTYPE_MONTH_DAY])
+    if repetition_type == REPETITION_TYPE_MONTHLY and repetition_subtype == REPETITION_SUBTYPE_MONTH_DAY:
+        repetition_value = generator.randint(0, 32)
+    else:
+        repetition_value = generator.randint(-1, 7)
+    return RepetitiveTask(
+        id=task_id,
+        color="#000",
+        start_time="00:00",
+        end_time="00:00",
+        is_all_day=True,
+        title="Task {}".format(task_id),
+        details="",
+        repetition_type=repetition_type,
+        repetition_subtype=repetition_subtype,
+        repetition_value=repetition_value,
+    )
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_same_occurrences_as_checking_every_day(seed: int) -> None:
+    generator = random.Random(seed)
+    repetitive_tasks = [random_task(generator, task_id) for task_id in range(60)]
+    hidden_repetitions = {}  # type: Dict
+    for _ in range(80):
+        task_id_str = str(generator.randrange(60))
+        year_str = str(generator.randint(2019, 2021))
+        month_str = str(generator.randint(1, 12))
+        days = hidden_repetitions.setdefault(task_id_str, {}).setdefault(year_str, {}).setdefault(month_str, {})
+        days[str(generator.randint(1, 31))] = True
+
+    index = RecurrenceIndex(repetitive_tasks, from_nested(hidden_repetitions))
+    for first_weekday in (calendar.MONDAY, calendar.WEDNESDAY, calendar.SUNDAY):
+        for year in (2019, 2020, 2021):
+            for month in range(1, 13):
+                expected = reference_month_tasks(repetitive_tasks, hidden_repetitions, year, month, first_weekday)
+                assert index.month_tasks(year, month, first_weekday) == expected
+
+
+def test_monthly_week_day_task_only_happens_on_its_first_day() -> None:
+    task = random_task(random.Random(0), 1)
+    task.repetition_type = REPETITION_TYPE_MONTHLY
+    task.repetition_subtype = REPETITION_SUBTYPE_WEEK_DAY
+    task.repetition_value = 2
+
+    # November 2017 starts on a Wednesday, so its first Wednesday is the 1st with weeks starting on Monday
+    assert RecurrenceIndex([task], {}).month_tasks(2017, 11, calendar.MONDAY) == {"1": [task]}
+    # and its first Tuesday (third column of weeks starting on Sunday) is the 7th
+    assert RecurrenceIndex([task], {}).month_tasks(2017, 11, calendar.SUNDAY) == {"7": [task]}
+
+
+def reference_is_within_bounds(task: RepetitiveTask, occurrence: date, first_weekday: int) -> bool:
+    # counts the occurrences from `starts_on` month by month with the previous algorithm
+    if task.starts_on is None:
+        return task.until is None or occurrence <= date.fromisoformat(task.until)
+    first = date.fromisoformat(task.starts_on)
+    if occurrence < first or (task.until is not None and occurrence > date.fromisoformat(task.until)):
+        return False
+    if task.count is None:
+        return True
+    ordinal = 0
+    year, month = first.year, first.month
+    while (year, month) <= (occurrence.year, occurrence.month):
+        for day_str in reference_month_tasks([task], {}, year, month, first_weekday):
+            if first <= date(year, month, int(day_str)) <= occurrence:
+                ordinal += 1
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return ordinal <= task.count
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_bounded_rules_only_happen_within_their_bounds(seed: int) -> None:
+    generator = random.Random(seed)
+    repetitive_tasks = [random_task(generator, task_id) for task_id in range(60)]
+    for task in repetitive_tasks:
+        starts_on = date(2019, 1, 1) + timedelta(days=generator.randrange(3 * 365))
+        if generator.random() < 0.6:
+            task.starts_on = starts_on.isoformat()
+        if generator.random() < 0.4:
+            task.until = (starts_on + timedelta(days=generator.randrange(400))).isoformat()
+        if generator.random() < 0.5:
+            task.count = generator.randint(1, 12)
+    hidden_repetitions = {"0": {"2020": {"3": {"2": True}}}, "1": {"2019": {"6": {"10": True}}}}
+
+    index = RecurrenceIndex(repetitive_tasks, from_nested(hidden_repetitions))
+    for first_weekday in (calendar.MONDAY, calendar.SUNDAY):
+        for year in (2019, 2020, 2021):
+            for month in range(1, 13):
+                expected = {}
+                for day_str, day_tasks in reference_month_tasks(
+                    repetitive_tasks, hidden_repetitions, year, month, first_weekday
+                ).items():
+                    day_tasks = [
+                        task
+                        for task in day_tasks
+                        if reference_is_within_bounds(task, date(year, month, int(day_str)), first_weekday)
+                    ]
+                    if day_tasks:
+                        expected[day_str] = day_tasks
+                assert index.month_tasks(year, month, first_weekday) == expected
+
+
+def test_rules_that_ended_are_not_considered() -> None:
+    ended = ((date(2017, 1, 1), date(2017, 12, 31)), (0, random_task(random.Random(0), 0)))
+    active = ((date(2017, 1, 1), date.max), (1, random_task(random.Random(1), 1)))
+    not_started = ((date(2019, 1, 1), date.max), (2, random_task(random.Random(2), 2)))
+
+    windows = RuleWindows([ended, active, not_started])
+
+    assert windows.active(date(2018, 5, 1), date(2018, 5, 31)) == [active]
+
+
+@pytest.fixture
+def calendar_data(tmp_path: str) -> CalendarData:
+    recurrence_cache.clear()
+    shutil.copy(os.path.join("test", "fixtures", "sample_data_file.json"), os.path.join(tmp_path, "a_calendar.json"))
+    return CalendarData(str(tmp_path))
+
+
+def month_tasks(calendar_data: CalendarData, year: int, month: int) -> Dict:
+    data = calendar_data.load_calendar("a_calendar")
+    return calendar_data.add_repetitive_tasks_from_calendar(
+        GregorianCalendar.month_days(year, month), data, {}, calendar_id="a_calendar"
+    )
+
+
+def test_expansions_are_memoized(calendar_data: CalendarData) -> None:
+    first = month_tasks(calendar_data, 2017, 11)
+
+    with patch.object(RecurrenceIndex, "month_tasks") as expand:
+        assert month_tasks(calendar_data, 2017, 11) == first
+    expand.assert_not_called()
+
+
+def test_expansions_are_not_shared_between_first_weekdays(calendar_data: CalendarData) -> None:
+    month_tasks(calendar_data, 2017, 11)
+
+    calendar_data.first_weekday = calendar.SUNDAY
+    with patch.object(RecurrenceIndex, "month_tasks", return_value={}) as expand:
+        month_tasks(calendar_data, 2017, 11)
+    assert expand.called
+
+
+@pytest.mark.parametrize(
+    "change",
+    [
+        lambda calendar_data: calendar_data.hide_repetition_task_instance("a_calendar", "2017", "11", "6", "0"),
+        lambda calendar_data: calendar_data.delete_task("a_calendar", "2017", "11", "6", 0),
+        lambda calendar_data: calendar_data.create_task(
+            calendar_id="a_calendar",
+            year=None,
+            month=None,
+            day=None,
+            title="a title",
+            is_all_day=True,
+            start_time="00:00",
+            details="",
+            color="#000",
+            has_repetition=True,
+            repetition_type=CalendarData.REPETITION_TYPE_WEEKLY,
+            repetition_subtype=CalendarData.REPETITION_SUBTYPE_WEEK_DAY,
+            repetition_value=1,
+        ),
+    ],
+)
+def test_repetitive_changes_expand_again(calendar_data: CalendarData, change: Callable[[CalendarData], None]) -> None:
+    month_tasks(calendar_data, 2017, 11)
+
+    app = Flask(__name__)
+    with app.app_context():
+        change(calendar_data)
+    with patch.object(RecurrenceIndex, "month_tasks", return_value={}) as expand:
+        month_tasks(calendar_data, 2017, 11)
+    assert expand.called
+
+
+@pytest.mark.parametrize("month, day, task_id, invalidated", [("12", "25", 1, False), ("11", "6", 0, True)])
+def test_only_repetitive_deletions_drop_expansions(
+    calendar_data: CalendarData, month: str, day: str, task_id: int, invalidated: bool
+) -> None:
+    app = Flask(__name__)
+    with app.app_context(), patch.object(recurrence_cache, "invalidate") as invalidate:
+        calendar_data.delete_task("a_calendar", "2017", month, day, task_id)
+    assert invalidate.called == invalidated
+
+
+def test_least_recently_used_expansions_are_evicted() -> None:
+    cache = RecurrenceCache(max_entries=2)
+    cache.put(("a_calendar", 1, 0, 2017, 11, 0), {})
+    cache.put(("a_calendar", 1, 0, 2017, 12, 0), {})
+    cache.get(("a_calendar", 1, 0, 2017, 11, 0))
+    cache.put(("a_calendar", 1, 0, 2018, 1, 0), {})
+
+    assert cache.get(("a_calendar", 1, 0, 2017, 11, 0)) is not None
+    assert cache.get(("a_calendar", 1, 0, 2017, 12, 0)) is None
+
+
+def create_weekly_task(calendar_data: CalendarData, **bounds: Any) -> bool:
+    app = Flask(__name__)
+    app.config["MAX_YEAR"] = 2200
+    with app.app_context():
+        return calendar_data.create_task(
+            calendar_id="a_calendar",
+            year=2017,
+            month=11,
+            day=8,
+            title="a bounded title",
+            is_all_day=True,
+            start_time="00:00",
+            details="",
+            color="#000",
+            has_repetition=True,
+            repetition_type=CalendarData.REPETITION_TYPE_WEEKLY,
+            repetition_subtype=CalendarData.REPETITION_SUBTYPE_WEEK_DAY,
+            repetition_value=2,
+            **bounds,
+        )
+
+
+def bounded_task_days(calendar_data: CalendarData, year: int, month: int) -> List[str]:
+    return [
+        day_str
+        for day_str, day_tasks in month_tasks(calendar_data, year, month)[str(month)].items()
+        if any(task["title"] == "a bounded title" for task in day_tasks)
+    ]
+
+
+def test_count_starts_at_the_task_date_without_starts_on(calendar_data: CalendarData) -> None:
+    assert create_weekly_task(calendar_data, count=3)
+
+    # wednesdays
+    assert bounded_task_days(calendar_data, 2017, 10) == []
+    assert bounded_task_days(calendar_data, 2017, 11) == ["8", "15", "22"]
+
+
+def test_counts_past_the_last_representable_date_leave_the_window_open() -> None:
+    task = RepetitiveTask(
+        id=1,
+        color="#000",
+        start_time="00:00",
+        end_time="00:00",
+        is_all_day=True,
+        title="a title",
+        details="",
+        repetition_type=REPETITION_TYPE_MONTHLY,
+        repetition_subtype=REPETITION_SUBTYPE_MONTH_DAY,
+        repetition_value=1,
+        starts_on="9990-01-01",
+        count=500,
+    )
+    assert rule_window(task, calendar.MONDAY) == (date(9990, 1, 1), date.max)
+
+
+def test_until_ends_repetitions(calendar_data: CalendarData) -> None:
+    assert create_weekly_task(calendar_data, starts_on="2017-11-10", until="2017-12-06")
+
+    assert bounded_task_days(calendar_data, 2017, 11) == ["15", "22", "29"]
+    assert bounded_task_days(calendar_data, 2017, 12) == ["6"]
+    assert bounded_task_days(calendar_data, 2018, 1) == []
+
+
+@pytest.mark.parametrize(
+    "bounds",
+    [
+        {"starts_on": "2017-11-10", "until": "2017-11-09"},
+        {"starts_on": "2017-11-31"},
+        {"until": "not a date"},
+        {"count": 0},
+        {"count": 500000},
+        {"starts_on": "2024-01-01", "count": 500000},
+        # within MAX_COUNT but ending after MAX_YEAR
+        {"starts_on": "2195-01-01", "count": 9000},
+    ],
+)
+def test_invalid_bounds_are_rejected(calendar_data: CalendarData, bounds: Dict) -> None:
+    assert not create_weekly_task(calendar_data, **bounds)
@@ -0,0 +1,41 @@
+import os
+import time
+from unittest.mock import patch
+
+import pytest
+from flask_calendar.session_store import FileSystemSessionStore, SessionStore, SqliteSessionStore
+
+
+@pytest.fixture(params=["filesystem", "sqlite"])
+def session_store(request: pytest.FixtureRequest, tmp_path: str) -> SessionStore:
+    if request.param == "filesystem":
+        return FileSystemSessionStore(os.path.join(tmp_path, "sessions"))
+    return SqliteSessionStore(os.path.join(tmp_path, "sessions.sqlite"))
+
+
+def test_added_session_returns_its_username(session_store: SessionStore) -> None:
+    session_store.add("a_session_id", "a_username", timeout=60)
+
+    assert session_store.get_username("a_session_id") == "a_username"
+    assert session_store.get_username("another_session_id") is None
+
+
+def test_expired_sessions_are_invalid_and_swept(session_store: SessionStore) -> None:
+    session_store.add("an_expired_session_id", "a_username", timeout=60)
+    session_store.add("a_session_id", "a_username", timeout=600)
+
+    with patch("time.time", return_value=time.time() + 120):
+        assert session_store.get_username("an_expired_session_id") is None
+        assert session_store.sweep_expired() == 1
+
+    assert session_store.get_username("an_expired_session_id") is None
+    assert session_store.get_username("a_session_id") == "a_username"
+
+
+def test_sessions_are_shared_between_store_instances(tmp_path: str) -> None:
+    # as separate worker processes would each create their own store
+    SqliteSessionStore(os.path.join(tmp_path, "sessions.sqlite")).add("a_session_id", "a_username", timeout=60)
+    FileSystemSessionStore(str(tmp_path)).add("a_session_id", "a_username", timeout=60)
+
+    assert SqliteSessionStore(os.path.join(tmp_path, "sessions.sqlite")).get_username("a_session_id") == "a_username"
+    assert FileSystemSessionStore(str(tmp_path)).get_username("a_session_id") == "a_username"
@@ -0,0 +1,142 @@
+import os
+import shutil
+
+import pytest
+from flask_calendar.calendar_cache import cache
+from flask_calendar.calendar_data import CalendarData
+from flask_calendar.gregorian_calendar import GregorianCalendar
+from flask_calendar.hidden_repetitions import is_hidden
+from flask_calendar.scripts.json_to_sharded import convert
+from flask_calendar.sharded_storage import ShardedJsonStorage
+from flask_calendar.storage import CalendarNotFoundError
+
+CALENDAR_ID = "sample_data_file"
+
+
+@pytest.fixture
+def json_calendar_data() -> CalendarData:
+    return CalendarData("test/fixtures")
+
+
+@pytest.fixture
+def storage(tmp_path: str) -> ShardedJsonStorage:
+    cache.clear()
+    shutil.copy(os.path.join("test", "fixtures", "{}.json".format(CALENDAR_ID)), tmp_path)
+    assert convert(str(tmp_path)) == 1
+    return ShardedJsonStorage(str(tmp_path))
+
+
+@pytest.fixture
+def sharded_calendar_data(storage: ShardedJsonStorage) -> CalendarData:
+    return CalendarData(storage.data_folder, storage=storage)
+
+
+def month_tasks(calendar_data: CalendarData, year: int, month: int) -> dict:
+    data = calendar_data.load_calendar(CALENDAR_ID)
+    tasks = calendar_data.tasks_from_calendar(GregorianCalendar.month_days(year, month), data)
+    return calendar_data.add_repetitive_tasks_from_calendar(GregorianCalendar.month_days(year, month), data, tasks)
+
+
+@pytest.mark.parametrize("year, month", [(2017, 11), (2017, 12), (2018, 1)])
+def test_month_tasks_match_json_storage(
+    json_calendar_data: CalendarData, sharded_calendar_data: CalendarData, year: int, month: int
+) -> None:
+    assert month_tasks(sharded_calendar_data, year, month) == month_tasks(json_calendar_data, year, month)
+
+
+def test_whole_calendar_matches_json_storage(json_calendar_data: CalendarData, storage: ShardedJsonStorage) -> None:
+    data = storage.load(CALENDAR_ID, use_cache=False)
+
+    assert data.pop("version") == 1
+    assert data == json_calendar_data.load_calendar(CALENDAR_ID, use_cache=False)
+
+
+def test_only_rendered_months_are_read(sharded_calendar_data: CalendarData, storage: ShardedJsonStorage) -> None:
+    cache.clear()
+    # december 2017 view also shows the last days of november
+    month_tasks(sharded_calendar_data, 2017, 12)
+    assert storage.month_path(CALENDAR_ID, "2017", "11") in cache._entries
+
+    cache.clear()
+    month_tasks(sharded_calendar_data, 2018, 1)
+    assert storage.header_path(CALENDAR_ID) in cache._entries
+    assert storage.month_path(CALENDAR_ID, "2017", "11") not in cache._entries
+    assert storage.month_path(CALENDAR_ID, "2017", "12") not in cache._entries
+
+
+def test_missing_calendar_raises_not_found(sharded_calendar_data: CalendarData) -> None:
+    with pytest.raises(CalendarNotFoundError):
+        sharded_calendar_data.load_calendar("an_irrelevant_calendar_id")
+
+
+def test_create_move_and_delete_normal_task(sharded_calendar_data: CalendarData, storage: ShardedJsonStorage) -> None:
+    header_stamp = os.stat(storage.header_path(CALENDAR_ID)).st_mtime_ns
+    sharded_calendar_data.create_tasks(
+        calendar_id=CALENDAR_ID,
+        dates=[(2019, 2, 10), (2019, 2, 11)],
+        title="an irrelevant title",
+        is_all_day=True,
+        start_time="00:00",
+        details="",
+        color="an_irrelevant_color",
+        has_repetition=False,
+        repetition_type=None,
+        repetition_subtype=None,
+        repetition_value=0,
+    )
+    assert os.path.exists(storage.month_path(CALENDAR_ID, "2019", "2"))
+    assert os.stat(storage.header_path(CALENDAR_ID)).st_mtime_ns == header_stamp
+
+    tasks = sharded_calendar_data.tasks_from_calendar(
+        GregorianCalendar.month_days(2019, 2), sharded_calendar_data.load_calendar(CALENDAR_ID)
+    )
+    task_id = tasks["2"]["10"][0]["id"]
+
+    sharded_calendar_data.update_task_day(CALENDAR_ID, "2019", "2", "10", task_id, "20")
+    task = sharded_calendar_data.task_from_calendar(CALENDAR_ID, 2019, 2, 20, task_id)
+    assert task["title"] == "an irrelevant title"
+
+    sharded_calendar_data.delete_task(CALENDAR_ID, "2019", "2", "20", task_id)
+    with pytest.raises(ValueError):
+        sharded_calendar_data.task_from_calendar(CALENDAR_ID, 2019, 2, 20, task_id)
+
+
+def test_hide_and_delete_repetitive_task(sharded_calendar_data: CalendarData) -> None:
+    # task 0 repeats every monday, 2017-11-06 is a monday
+    sharded_calendar_data.hide_repetition_task_instance(CALENDAR_ID, "2017", "11", "6", "0")
+    data = sharded_calendar_data.load_calendar(CALENDAR_ID)
+    assert is_hidden(data["tasks"]["hidden_repetition"], "0", "2017", "11", "6")
+    assert 0 not in [task["id"] for task in month_tasks(sharded_calendar_data, 2017, 11)["11"]["6"]]
+
+    sharded_calendar_data.delete_task(CALENDAR_ID, "2017", "11", "13", 0)
+    data = sharded_calendar_data.load_calendar(CALENDAR_ID)
+    assert 0 not in [task["id"] for task in data["tasks"]["repetition"]]
+    assert "0" not in data["tasks"]["hidden_repetition"]
+
+
+def test_saving_removes_months_without_tasks(storage: ShardedJsonStorage) -> None:
+    data = storage.load(CALENDAR_ID, use_cache=False)
+    del data["tasks"]["normal"]["2017"]["11"]
+
+    storage.save(CALENDAR_ID, data)
+
+    assert not os.path.exists(storage.month_path(CALENDAR_ID, "2017", "11"))
+    assert storage.load(CALENDAR_ID, use_cache=False) == dict(data, version=2)
+
+
+def test_repetitive_changes_increase_version(sharded_calendar_data: CalendarData) -> None:
+    version = sharded_calendar_data.load_calendar(CALENDAR_ID)["version"]
+
+    sharded_calendar_data.hide_repetition_task_instance(CALENDAR_ID, "2017", "11", "6", "0")
+    assert sharded_calendar_data.load_calendar(CALENDAR_ID)["version"] == version + 1
+
+    sharded_calendar_data.update_task_day(CALENDAR_ID, "2017", "12", "25", 1, "26")
+    assert sharded_calendar_data.load_calendar(CALENDAR_ID)["version"] == version + 1
+
+
+def test_every_change_increases_revision(sharded_calendar_data: CalendarData) -> None:
+    revision = sharded_calendar_data.calendar_revision(CALENDAR_ID)
+
+    sharded_calendar_data.update_task_day(CALENDAR_ID, "2017", "12", "25", 1, "26")
+    assert sharded_calendar_data.calendar_revision(CALENDAR_ID) > revision
+    assert sharded_calendar_data.load_calendar(CALENDAR_ID)["version"] == revision[0]
@@ -0,0 +1,106 @@
+import os
+
+import pytest
+from flask_calendar.calendar_data import CalendarData
+from flask_calendar.gregorian_calendar import GregorianCalendar
+from flask_calendar.hidden_repetitions import is_hidden
+from flask_calendar.sqlite_storage import SqliteStorage
+from flask_calendar.storage import CalendarNotFoundError, JsonStorage
+
+CALENDAR_ID = "sample_data_file"
+
+
+@pytest.fixture
+def json_calendar_data() -> CalendarData:
+    return CalendarData("test/fixtures")
+
+
+@pytest.fixture
+def sqlite_calendar_data(tmp_path: str, json_calendar_data: CalendarData) -> CalendarData:
+    storage = SqliteStorage(os.path.join(tmp_path, "calendars.sqlite"))
+    storage.save(CALENDAR_ID, JsonStorage("test/fixtures").load(CALENDAR_ID, use_cache=False))
+    return CalendarData("test/fixtures", storage=storage)
+
+
+def month_tasks(calendar_data: CalendarData, year: int, month: int) -> dict:
+    data = calendar_data.load_calendar(CALENDAR_ID)
+    tasks = calendar_data.tasks_from_calendar(GregorianCalendar.month_days(year, month), data)
+    return calendar_data.add_repetitive_tasks_from_calendar(GregorianCalendar.month_days(year, month), data, tasks)
+
+
+@pytest.mark.parametrize("year, month", [(2017, 11), (2017, 12), (2018, 1)])
+def test_month_tasks_match_json_storage(
+    json_calendar_data: CalendarData, sqlite_calendar_data: CalendarData, year: int, month: int
+) -> None:
+    assert month_tasks(sqlite_calendar_data, year, month) == month_tasks(json_calendar_data, year, month)
+
+
+def test_users_are_kept(sqlite_calendar_data: CalendarData) -> None:
+    assert sqlite_calendar_data.users_list(calendar_id=CALENDAR_ID) == ["a_username"]
+
+
+def test_missing_calendar_raises_not_found(sqlite_calendar_data: CalendarData) -> None:
+    with pytest.raises(FileNotFoundError):
+        sqlite_calendar_data.load_calendar("an_irrelevant_calendar_id")
+    with pytest.raises(CalendarNotFoundError):
+        sqlite_calendar_data.load_calendar("an_irrelevant_calendar_id")
+
+
+def test_create_move_and_delete_normal_task(sqlite_calendar_data: CalendarData) -> None:
+    sqlite_calendar_data.create_tasks(
+        calendar_id=CALENDAR_ID,
+        dates=[(2017, 12, 10), (2017, 12, 11)],
+        title="an irrelevant title",
+        is_all_day=True,
+        start_time="00:00",
+        details="",
+        color="an_irrelevant_color",
+        has_repetition=False,
+        repetition_type=None,
+        repetition_subtype=None,
+        repetition_value=0,
+    )
+    tasks = sqlite_calendar_data.tasks_from_calendar(
+        GregorianCalendar.month_days(2017, 12), sqlite_calendar_data.load_calendar(CALENDAR_ID)
+    )
+    task_id = tasks["12"]["10"][0]["id"]
+    assert tasks["12"]["11"][0]["id"] != task_id
+
+    sqlite_calendar_data.update_task_day(CALENDAR_ID, "2017", "12", "10", task_id, "20")
+    task = sqlite_calendar_data.task_from_calendar(CALENDAR_ID, 2017, 12, 20, task_id)
+    assert task["title"] == "an irrelevant title"
+
+    sqlite_calendar_data.delete_task(CALENDAR_ID, "2017", "12", "20", task_id)
+    with pytest.raises(KeyError):
+        sqlite_calendar_data.task_from_calendar(CALENDAR_ID, 2017, 12, 20, task_id)
+
+
+def test_hide_and_delete_repetitive_task(sqlite_calendar_data: CalendarData) -> None:
+    # task 0 repeats every monday, 2017-11-06 is a monday
+    sqlite_calendar_data.hide_repetition_task_instance(CALENDAR_ID, "2017", "11", "6", "0")
+    data = sqlite_calendar_data.load_calendar(CALENDAR_ID)
+    assert is_hidden(data["tasks"]["hidden_repetition"], "0", "2017", "11", "6")
+    assert 0 not in [task["id"] for task in month_tasks(sqlite_calendar_data, 2017, 11)["11"]["6"]]
+
+    sqlite_calendar_data.delete_task(CALENDAR_ID, "2017", "11", "13", 0)
+    data = sqlite_calendar_data.load_calendar(CALENDAR_ID)
+    assert 0 not in [task["id"] for task in data["tasks"]["repetition"]]
+    assert "0" not in data["tasks"]["hidden_repetition"]
+
+
+def test_repetitive_changes_increase_version(sqlite_calendar_data: CalendarData) -> None:
+    version = sqlite_calendar_data.load_calendar(CALENDAR_ID)["version"]
+
+    sqlite_calendar_data.hide_repetition_task_instance(CALENDAR_ID, "2017", "11", "6", "0")
+    assert sqlite_calendar_data.load_calendar(CALENDAR_ID)["version"] == version + 1
+
+    sqlite_calendar_data.update_task_day(CALENDAR_ID, "2017", "12", "25", 1, "26")
+    assert sqlite_calendar_data.load_calendar(CALENDAR_ID)["version"] == version + 1
+
+
+def test_every_change_increases_revision(sqlite_calendar_data: CalendarData) -> None:
+    revision = sqlite_calendar_data.calendar_revision(CALENDAR_ID)
+
+    sqlite_calendar_data.update_task_day(CALENDAR_ID, "2017", "12", "25", 1, "26")
+    assert sqlite_calendar_data.calendar_revision(CALENDAR_ID) > revision
+    assert sqlite_calendar_data.load_calendar(CALENDAR_ID)["revision"] == revision[2] + 1
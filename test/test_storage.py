@@ -0,0 +1,110 @@
+import multiprocessing
+import os
+import shutil
+from typing import Dict
+
+import pytest
+from flask import Flask
+from flask_calendar.calendar_cache import cache
+from flask_calendar.calendar_data import CalendarData
+from flask_calendar.storage import CalendarConflictError, JsonStorage
+
+CALENDAR_ID = "sample_data_file"
+
+
+@pytest.fixture
+def storage(tmp_path: str) -> JsonStorage:
+    cache.clear()
+    shutil.copy(os.path.join("test", "fixtures", "{}.json".format(CALENDAR_ID)), tmp_path)
+    return JsonStorage(str(tmp_path))
+
+
+def create_task(calendar_data: CalendarData, day: int) -> None:
+    calendar_data.create_task(
+        calendar_id=CALENDAR_ID,
+        year=2017,
+        month=12,
+        day=day,
+        title="an irrelevant title",
+        is_all_day=True,
+        start_time="00:00",
+        details="",
+        color="an_irrelevant_color",
+        has_repetition=False,
+        repetition_type=None,
+        repetition_subtype=None,
+        repetition_value=0,
+    )
+
+
+def test_save_replaces_the_file_and_increments_the_version(storage: JsonStorage) -> None:
+    data = storage.load(CALENDAR_ID, use_cache=False)
+
+    storage.save(CALENDAR_ID, data, expected_version=0)
+    storage.save(CALENDAR_ID, storage.load(CALENDAR_ID, use_cache=False), expected_version=1)
+
+    assert storage.load(CALENDAR_ID)["version"] == 2
+    assert sorted(os.listdir(storage.data_folder)) == ["{}.json".format(CALENDAR_ID), "{}.lock".format(CALENDAR_ID)]
+
+
+def test_saving_a_stale_calendar_raises_conflict(storage: JsonStorage) -> None:
+    stale = storage.load(CALENDAR_ID, use_cache=False)
+    storage.save(CALENDAR_ID, storage.load(CALENDAR_ID, use_cache=False), expected_version=0)
+
+    with pytest.raises(CalendarConflictError):
+        storage.save(CALENDAR_ID, stale, expected_version=0)
+
+
+def test_conflicting_change_is_applied_again(app: Flask, storage: JsonStorage) -> None:
+    calendar_data = CalendarData(storage.data_folder, storage=storage)
+    original_save = storage.save
+    saves = []
+
+    def save_after_someone_else(calendar_id: str, data: Dict, expected_version: int) -> None:
+        saves.append(expected_version)
+        if len(saves) == 1:
+            # someone else saves the calendar after this change loaded it
+            other_data = storage.load(CALENDAR_ID, use_cache=False)
+            other_data["name"] = "a changed name"
+            original_save(calendar_id, other_data, expected_version)
+        original_save(calendar_id, data, expected_version)
+
+    storage.save = save_after_someone_else  # type: ignore
+    with app.app_context():
+        create_task(calendar_data, day=10)
+
+    assert saves == [0, 1]
+    data = storage.load(CALENDAR_ID)
+    assert data["name"] == "a changed name"
+    assert len(data["tasks"]["normal"]["2017"]["12"]["10"]) == 1
+
+
+def create_tasks_in_process(data_folder: str, first_day: int) -> None:
+    from flask_calendar.app import create_app
+
+    calendar_data = CalendarData(data_folder, storage=JsonStorage(data_folder))
+    with create_app({"TESTING": True}).app_context():
+        for day in range(first_day, first_day + 5):
+            create_task(calendar_data, day=day)
+
+
+def test_processes_writing_at_the_same_time_dont_lose_changes(storage: JsonStorage) -> None:
+    context = multiprocessing.get_context("fork")
+    processes = [
+        context.Process(target=create_tasks_in_process, args=(storage.data_folder, first_day))
+        for first_day in (1, 6, 11, 16)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    assert all(process.exitcode == 0 for process in processes)
+    normal_tasks = storage.load(CALENDAR_ID)["tasks"]["normal"]["2017"]["12"]
+    task_ids = [
+        task["id"]
+        for day_tasks in normal_tasks.values()
+        for task in day_tasks
+        if task["title"] == "an irrelevant title"
+    ]
+    assert len(set(task_ids)) == 20
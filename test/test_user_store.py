@@ -0,0 +1,95 @@
+import json
+import os
+import shutil
+
+import pytest
+from flask_calendar.user_store import UserStore, get_user_store
+
+A_USER = {"username": "a_username", "password": "a_hash", "default_calendar": "sample", "ics_key": "an_ics_key"}
+
+
+@pytest.fixture
+def users_folder(tmp_path: str) -> str:
+    shutil.copy(os.path.join("test", "fixtures", "users.json"), str(tmp_path))
+    return str(tmp_path)
+
+
+def test_finds_users_by_username(users_folder: str) -> None:
+    user_store = UserStore(users_folder)
+
+    user = user_store.get("a_username")
+    assert user is not None
+    assert user["default_calendar"] == "sample"
+    assert user_store.get("another_username") is None
+
+
+def test_changes_are_appended_to_the_journal(users_folder: str) -> None:
+    user_store = UserStore(users_folder)
+    with open(os.path.join(users_folder, "users.json")) as file:
+        users_file_contents = file.read()
+
+    user_store.set(dict(A_USER, username="another_username"))
+    user_store.delete("a_username")
+
+    with open(os.path.join(users_folder, "users.json")) as file:
+        assert file.read() == users_file_contents
+    assert user_store.get("another_username") is not None
+    assert user_store.get("a_username") is None
+
+
+def test_reloads_changes_made_by_other_processes(users_folder: str) -> None:
+    user_store = UserStore(users_folder)
+    assert user_store.get("another_username") is None
+
+    UserStore(users_folder).set(dict(A_USER, username="another_username"))
+
+    assert user_store.get("another_username") is not None
+
+
+def test_compaction_folds_journal_into_users_file(users_folder: str) -> None:
+    user_store = UserStore(users_folder, compaction_threshold_bytes=0)
+
+    user_store.set(dict(A_USER, username="another_username"))
+
+    assert not os.path.exists(os.path.join(users_folder, "users.journal"))
+    with open(os.path.join(users_folder, "users.json")) as file:
+        assert set(json.load(file).keys()) == {"a_username", "another_username"}
+    assert UserStore(users_folder).get("another_username") is not None
+
+
+def test_journal_left_by_interrupted_compaction_is_harmless(users_folder: str) -> None:
+    user_store = UserStore(users_folder)
+    user_store.delete("a_username")
+    with open(os.path.join(users_folder, "users.journal")) as file:
+        journal = file.read()
+    user_store.compact()
+    with open(os.path.join(users_folder, "users.journal"), "w") as file:
+        file.write(journal)
+
+    assert UserStore(users_folder).get("a_username") is None
+
+
+def test_store_is_shared_within_the_process(users_folder: str) -> None:
+    assert get_user_store(users_folder) is get_user_store(users_folder)
+
+
+def test_change_after_a_cut_record_is_not_joined_to_it(users_folder: str) -> None:
+    UserStore(users_folder).set(dict(A_USER, username="another_username"))
+    journal_path = os.path.join(users_folder, "users.journal")
+    # a crash while appending that change
+    os.truncate(journal_path, os.path.getsize(journal_path) - 10)
+
+    UserStore(users_folder).set(dict(A_USER, username="a_third_username"))
+
+    user_store = UserStore(users_folder)
+    assert user_store.get("a_username") is not None
+    assert user_store.get("another_username") is None
+    assert user_store.get("a_third_username") is not None
+
+
+def test_cut_records_are_skipped(users_folder: str) -> None:
+    with open(os.path.join(users_folder, "users.journal"), "w") as file:
+        file.write('{"op": "set", "user": {"userna\n')
+        file.write(json.dumps({"op": "delete", "username": "a_username"}) + "\n")
+
+    assert UserStore(users_folder).get("a_username") is None